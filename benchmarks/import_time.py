@@ -0,0 +1,116 @@
+"""
+Cold-start import budget for the bot and the CLI pipeline.
+
+Runs each entry point's imports in a fresh interpreter with `python -X importtime`,
+reports the slowest modules and fails (exit code 1) if an entry point exceeds its budget.
+
+Usage:
+    python benchmarks/import_time.py                 # report against default budgets
+    python benchmarks/import_time.py --top 20        # show more modules
+    python benchmarks/import_time.py --json out.json # also save the raw numbers
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Entry point -> (modules it imports at startup, budget in milliseconds)
+ENTRY_POINTS: Dict[str, Tuple[List[str], float]] = {
+    "bot_main": (["aiogram", "tg_bot.handlers", "tg_analyst.model_registry"], 1500.0),
+    "run_analysis": ([
+        "tg_analyst.utils.downloader",
+        "tg_analyst.utils.analyzer",
+        "tg_analyst.utils.cluster_utils",
+        "tg_analyst.report_generator",
+        "tg_analyst.gpt_summary",
+    ], 2500.0),
+    "analyzer": (["tg_analyst.utils.analyzer"], 150.0),
+}
+
+# tg_analyst.config refuses to import without credentials; any values will do for timing
+DUMMY_ENV = {
+    "TELEGRAM_API_ID": "0",
+    "TELEGRAM_API_HASH": "benchmark",
+    "SESSION_NAME": "benchmark",
+    "TGA_WARM_UP_MODELS": "0",
+}
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, float]]:
+    """Parse `-X importtime` output into (module, nesting depth, cumulative ms) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # header line
+        name = fields[2]
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(fields[1]) / 1000))
+    return rows
+
+
+def _run(code: str) -> List[Tuple[str, int, float]]:
+    env = {**os.environ, **DUMMY_ENV, "PYTHONPATH": ROOT}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return _parse_importtime(proc.stderr)
+
+
+def measure(modules: List[str]) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Import `modules` in a fresh interpreter.
+
+    Returns:
+        (total_ms, [(module, cumulative_ms), ...]) with modules sorted slowest first.
+        Interpreter startup (site, encodings) is excluded from the total.
+    """
+    baseline = {name for name, _, _ in _run("pass")}
+    rows = [r for r in _run("; ".join(f"import {m}" for m in modules)) if r[0] not in baseline]
+    total = sum(ms for _, depth, ms in rows if depth == 0)
+    return total, sorted(((name, ms) for name, _, ms in rows), key=lambda t: t[1], reverse=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules to show")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    over_budget = False
+    for entry, (modules, budget_ms) in ENTRY_POINTS.items():
+        try:
+            total, timings = measure(modules)
+        except RuntimeError as e:
+            print(f"❌ {entry}: import failed — {e}")
+            over_budget = True
+            continue
+
+        status = "✅" if total <= budget_ms else "❌"
+        over_budget |= total > budget_ms
+        print(f"{status} {entry}: {total:.0f} ms (budget {budget_ms:.0f} ms)")
+        for name, ms in timings[:args.top]:
+            print(f"    {ms:8.1f} ms  {name}")
+        results[entry] = {"total_ms": round(total, 1), "budget_ms": budget_ms,
+                          "slowest": [[n, round(ms, 1)] for n, ms in timings[:args.top]]}
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
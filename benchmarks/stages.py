@@ -0,0 +1,266 @@
+"""
+Time and profile every analysis stage on synthetic chats, and compare runs across commits.
+
+For each size, a seeded synthetic chat (benchmarks/synthetic_chat.py) is written to a
+scratch directory and analysed stage by stage. The steps are loading, word frequency,
+activity plots, NMF topics, embeddings, the reduction (UMAP by default), clustering,
+cluster summaries and the report. Each step records wall time, CPU time, peak RSS and
+input size (tg_analyst/metrics.py). Each size runs in a fresh process with empty caches,
+so peak RSS and model loading are not carried over between sizes.
+
+Results are stored in benchmarks/results/<commit>.json (git-ignored). Checking out other
+commits and re-running leaves one file per commit to compare.
+
+Usage:
+    python benchmarks/stages.py --sizes 1000 10000 100000
+    python benchmarks/stages.py --sizes 1000000 --stages load frequency message_activity topics
+    python benchmarks/stages.py --profile              # also save cProfile output per stage
+    python benchmarks/stages.py --compare 1a2b3c4      # diff against the results of another commit
+"""
+
+import os
+import sys
+import glob
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import importlib
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+STEPS = ["load", "frequency", "message_activity", "user_activity", "topics", "embed", "reduce", "cluster",
+         "summarize", "report"]
+
+# A run this much slower than the baseline is flagged
+REGRESSION_THRESHOLD = 1.1
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def commit_id() -> str:
+    """Short id of the checked-out commit, with "-dirty" for uncommitted changes."""
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    return f"{commit}-dirty" if _git("status", "--porcelain", "--untracked-files=no") else commit
+
+
+def _call(target: str, *args, **kwargs):
+    module, _, name = target.partition(":")
+    return getattr(importlib.import_module(module), name)(*args, **kwargs)
+
+
+def run_size(size: int, seed: int, steps: List[str], reduction: str, workdir: str,
+             profile_dir: Optional[str] = None) -> Dict:
+    """Analyse one synthetic chat step by step in this process; returns the step measurements."""
+    # Fresh stores and caches for every size: a benchmark must not hit the caches of a previous run
+    os.environ["TGA_OUTPUT_DIR"] = os.path.join(workdir, f"data_{size}")
+    os.environ["TGA_STAGE_CACHE"] = "0"
+
+    from synthetic_chat import write_chat
+    from tg_analyst.job import JobContext
+    from tg_analyst.metrics import JobMetrics, measure, METRICS_FILE
+    from tg_analyst.pipeline import build_stages
+    from tg_analyst.utils.corpus import MessageCorpus
+
+    with measure("generate", size) as generated:
+        path = write_chat(os.path.join(workdir, f"chat_{size}.json"), size, seed=seed)
+
+    job = JobContext.create(chat_id=f"bench_{size}")
+    metrics = JobMetrics(job.job_id)
+    stages = {stage.name: stage for stage in build_stages(use_gpt=False, reduction=reduction)}
+    # Embedding without reducing, then the reduction alone (the embeddings come from the store)
+    calls = {name: (stage.fn, dict(stage.params), stage.uses_corpus) for name, stage in stages.items()}
+    calls["embed"] = (stages["embed"].fn, {**stages["embed"].params, "reduce": False}, True)
+    calls["reduce"] = (stages["embed"].fn, dict(stages["embed"].params), True)
+
+    corpus = None
+    for step in STEPS:
+        # Every step needs the corpus, so it is always loaded
+        if step != "load" and (step not in steps or corpus is None):
+            continue
+        profiler = None
+        if profile_dir:
+            import cProfile
+            profiler = cProfile.Profile()
+        try:
+            with metrics.stage(step) as record:
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    if step == "load":
+                        corpus = MessageCorpus.load(path, chat_id=f"bench_{size}")
+                        record["items"] = len(corpus)
+                    else:
+                        fn, params, uses_corpus = calls[step]
+                        record["items"] = len(corpus.messages) if uses_corpus else None
+                        _call(fn, *((corpus,) if uses_corpus else ()), job=job, **params)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+            # Stage functions log their errors and return; missing outputs mean they failed
+            missing = [name for name in getattr(stages.get(step), "outputs", ()) if not os.path.exists(job.path(name))]
+            if missing:
+                metrics.record(step, status="failed", error=f"missing {', '.join(missing)}")
+            else:
+                metrics.record(step, status="done")
+        except Exception as e:
+            # Missing optional dependencies or models skip a step instead of the whole run
+            metrics.record(step, status="failed", error=f"{type(e).__name__}: {e}")
+        if profiler is not None:
+            profile_path = os.path.join(profile_dir, f"{size}_{step}.prof")
+            profiler.dump_stats(profile_path)
+            metrics.record(step, profile=profile_path)
+
+    # The chart renderer's worker processes would keep this process from exiting
+    from tg_analyst.utils import rendering
+    rendering.shutdown()
+
+    summary = metrics.write(job.path(METRICS_FILE))
+    summary["generate_seconds"] = generated["wall_seconds"]
+    return summary
+
+
+def _machine() -> Dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_results(commit: str, seed: int, reduction: str, runs: Dict[int, Dict]) -> str:
+    """Merge the runs into the results file of `commit`; returns its path."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{commit}.json")
+    data = {"runs": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    data.update({
+        "commit": commit,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "machine": _machine(),
+        "seed": seed,
+        "reduction": reduction,
+    })
+    data["runs"].update({str(size): run for size, run in runs.items()})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_results(ref: str) -> Optional[Dict]:
+    """Results of a commit (id prefix) or a results file path."""
+    if os.path.isfile(ref):
+        path = ref
+    else:
+        matches = sorted(glob.glob(os.path.join(RESULTS_DIR, f"{ref}*.json")), key=os.path.getmtime)
+        if not matches:
+            return None
+        path = matches[-1]
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_runs(runs: Dict[int, Dict]) -> None:
+    print(f"{'size':>8} {'stage':<17} {'status':<7} {'wall s':>9} {'cpu s':>9} {'peak RSS MB':>12} {'items':>8}")
+    for size, run in runs.items():
+        for step, record in run["stages"].items():
+            items = record.get("items")
+            print(f"{size:>8} {step:<17} {record.get('status', ''):<7} {record.get('wall_seconds', 0):>9.3f} "
+                  f"{record.get('cpu_seconds') or 0:>9.3f} {record.get('peak_rss_mb') or 0:>12.0f} "
+                  f"{items if items is not None else '':>8}")
+            if record.get("error"):
+                print(f"{'':>8} {'':<17} ↳ {record['error']}")
+
+
+def print_comparison(base: Dict, current: Dict) -> int:
+    """Print wall-time ratios per stage; returns the number of regressions."""
+    print(f"\n📊 Compared with {base.get('commit')} ({base.get('created')})")
+    print(f"{'size':>8} {'stage':<17} {'base s':>9} {'now s':>9} {'ratio':>7}")
+    regressions = 0
+    for size, run in current["runs"].items():
+        base_run = base.get("runs", {}).get(size)
+        if base_run is None:
+            continue
+        for step, record in run["stages"].items():
+            before = base_run["stages"].get(step, {})
+            if record.get("status") != "done" or before.get("status") != "done":
+                continue
+            old, new = before["wall_seconds"], record["wall_seconds"]
+            ratio = new / old if old else float("inf")
+            # Sub-10ms steps are noise
+            flag = " ⚠️" if ratio > REGRESSION_THRESHOLD and new - old > 0.01 else ""
+            regressions += bool(flag)
+            print(f"{size:>8} {step:<17} {old:>9.3f} {new:>9.3f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--stages", nargs="+", choices=STEPS, default=STEPS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reduction", choices=["umap", "pca", "none"], default="umap")
+    parser.add_argument("--profile", action="store_true", help="save a cProfile file per stage")
+    parser.add_argument("--tracemalloc", action="store_true", help="record peak Python allocations (slower)")
+    parser.add_argument("--compare", help="commit id prefix or results file to compare with")
+    parser.add_argument("--no-save", action="store_true", help="don't store the results")
+    args = parser.parse_args()
+
+    if args.tracemalloc:
+        os.environ["TGA_METRICS_TRACEMALLOC"] = "1"
+    commit = commit_id()
+    workdir = tempfile.mkdtemp(prefix="tga_bench_")
+    profile_dir = None
+    if args.profile:
+        profile_dir = os.path.join(RESULTS_DIR, "profiles", commit)
+        os.makedirs(profile_dir, exist_ok=True)
+
+    runs = {}
+    try:
+        for size in args.sizes:
+            print(f"⏱️ {size} messages...")
+            # One process per size: clean peak RSS, and every size pays for its own model loading
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                runs[size] = pool.submit(
+                    run_size, size, args.seed, args.stages, args.reduction, workdir, profile_dir
+                ).result()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_runs(runs)
+    if not args.no_save:
+        print(f"\n💾 Results saved to {save_results(commit, args.seed, args.reduction, runs)}")
+    if profile_dir:
+        print(f"🔬 Profiles in {profile_dir} (python -m pstats <file>)")
+
+    if args.compare:
+        base = load_results(args.compare)
+        if base is None:
+            print(f"⚠️ No results found for {args.compare}")
+            return 1
+        current = {"runs": {str(size): run for size, run in runs.items()}}
+        if print_comparison(base, current):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
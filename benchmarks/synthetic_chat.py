@@ -0,0 +1,214 @@
+"""
+Seeded generator of synthetic Russian group chats for benchmarks.
+
+The same seed and size always give the same chat. The distributions follow what real
+group chats look like:
+
+- senders: Zipf-like activity, a few members write most of the messages
+- timestamps: conversations start more often in the evening and on weekends; messages
+  within a conversation follow each other at exponential gaps of tens of seconds
+- length: log-normal word counts (median ~7 words, long tail), plus short reactions
+  ("ок", "ахах", "+1")
+- text: each conversation has a topic; words mix the topic's vocabulary (Zipf-ranked)
+  with common function words, with occasional emoji and links
+
+Usage:
+    python benchmarks/synthetic_chat.py --size 100000 --out chat.json
+    python benchmarks/synthetic_chat.py --size 10000 --format desktop --out result.json
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import numpy as np
+
+TOPICS = {
+    "работа": "проект задача дедлайн созвон начальник отчёт встреча офис удалёнка зарплата отпуск коллега "
+              "презентация клиент договор бюджет сроки планёрка ревью релиз",
+    "футбол": "матч гол игра команда тренер сезон чемпионат вратарь судья пенальти стадион болельщики "
+              "трансфер счёт победа поражение лига финал форма состав",
+    "кино": "фильм сериал серия сезон актёр режиссёр сюжет финал трейлер премьера кинотеатр персонаж "
+            "сценарий оскар концовка рейтинг озвучка субтитры жанр продолжение",
+    "еда": "рецепт ужин обед завтрак пицца суши кофе чай ресторан доставка борщ пельмени салат десерт "
+           "торт меню кафе вкусно шаурма блины",
+    "путешествия": "поездка билеты самолёт поезд отель виза море горы маршрут аэропорт чемодан экскурсия "
+                   "пляж город страна граница паспорт хостел пересадка рейс",
+    "программирование": "код баг питон сервер база запрос деплой тест функция библиотека релиз ошибка "
+                        "коммит ветка фреймворк память процессор логи докер скрипт",
+    "погода": "дождь снег солнце холодно жарко ветер зонт прогноз мороз градусов лужи гроза туман "
+              "весна осень зима лето тепло слякоть облачно",
+    "учёба": "экзамен сессия лекция преподаватель курсовая диплом зачёт семинар домашка оценка "
+             "университет студент конспект билеты практика группа расписание пара проект задание",
+}
+
+COMMON = ("я ты мы он она они это что как так ну вот да нет не и а но в на с по за к у о "
+          "уже ещё тоже просто вообще кстати короче типа сегодня завтра вчера сейчас потом "
+          "можно нужно надо хочу думаю знаю понял было будет есть очень там тут").split()
+
+REACTIONS = ["ок", "ага", "да", "нет", "ахах", "ахаха", "лол", "+1", "спасибо", "согласен", "жиза",
+             "понял", "норм", "круто", "ого", "хм", "ну да", "точно", "класс", "капец"]
+EMOJI = ["😂", "👍", "🔥", "😅", "🤔", "❤️", "😢", "🙏", "👀", "🎉"]
+FIRST_NAMES = ["Алексей", "Мария", "Дмитрий", "Анна", "Сергей", "Елена", "Иван", "Ольга", "Никита", "Татьяна",
+               "Андрей", "Наталья", "Павел", "Ксения", "Михаил", "Юлия", "Артём", "Дарья", "Егор", "Полина"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+              "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров"]
+
+# Relative chance of a conversation starting at each hour of the day
+HOURLY = np.array([2, 1, 0.5, 0.3, 0.2, 0.3, 0.8, 2, 4, 5, 5, 5, 6, 6, 5, 5, 5, 6, 7, 9, 10, 10, 8, 5], dtype=float)
+# Monday..Sunday
+WEEKDAY = np.array([1.0, 1.0, 1.0, 1.0, 1.1, 1.3, 1.2])
+
+REACTION_SHARE = 0.15
+TOPIC_WORD_SHARE = 0.55
+MESSAGES_PER_CONVERSATION = 12
+SECONDS_BETWEEN_MESSAGES = 45
+
+
+def _zipf_weights(n: int, a: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** a
+    return weights / weights.sum()
+
+
+def generate_messages(n: int, seed: int = 42, n_senders: int = None, days: int = None,
+                      start: datetime = datetime(2024, 1, 1, tzinfo=timezone.utc)) -> List[dict]:
+    """
+    Synthetic chat messages in the downloader's record format, oldest first.
+
+    Args:
+        n (int): Number of messages.
+        seed (int): Random seed; equal seeds give equal chats.
+        n_senders (int, optional): Chat members who write (default: grows with sqrt(n)).
+        days (int, optional): Period covered (default: ~200 messages per day, 30 days to 2 years).
+        start (datetime): Start of the period.
+
+    Returns:
+        List[dict]: Records with id/date/sender_id/sender_username/sender_name/text keys.
+    """
+    rng = np.random.default_rng(seed)
+    n_senders = n_senders or max(10, int(4 * np.sqrt(n)))
+    days = days or int(np.clip(n // 200, 30, 730))
+    topics = list(TOPICS.values())
+    vocab = [np.array(words.split(), dtype=object) for words in topics]
+    common = np.array(COMMON, dtype=object)
+
+    # Conversations: topic, start time (evening and weekend heavy) and length
+    n_conv = max(1, n // MESSAGES_PER_CONVERSATION)
+    conv_lengths = rng.geometric(1 / MESSAGES_PER_CONVERSATION, size=n_conv)
+    while conv_lengths.sum() < n:
+        conv_lengths = np.concatenate([conv_lengths, rng.geometric(1 / MESSAGES_PER_CONVERSATION, size=n_conv)])
+    conv = np.repeat(np.arange(len(conv_lengths)), conv_lengths)[:n]
+    n_conv = conv[-1] + 1
+    conv_topic = rng.integers(0, len(topics), size=n_conv)
+
+    day_weights = WEEKDAY[(np.arange(days) + start.weekday()) % 7]
+    conv_day = rng.choice(days, size=n_conv, p=day_weights / day_weights.sum())
+    conv_hour = rng.choice(24, size=n_conv, p=HOURLY / HOURLY.sum())
+    conv_start = conv_day * 86400.0 + conv_hour * 3600.0 + rng.uniform(0, 3600, size=n_conv)
+
+    gaps = rng.exponential(SECONDS_BETWEEN_MESSAGES, size=n)
+    first = np.r_[True, conv[1:] != conv[:-1]]
+    gaps[first] = 0.0
+    elapsed = np.cumsum(gaps)
+    # Time since the first message of the message's conversation
+    elapsed -= np.maximum.accumulate(np.where(first, elapsed, 0.0))
+    timestamps = conv_start[conv] + elapsed
+    order = np.argsort(timestamps, kind="stable")
+
+    sender_weights = _zipf_weights(n_senders, 1.1)
+    senders = rng.choice(n_senders, size=n, p=sender_weights)
+    sender_ids = 10_000_000 + rng.permutation(90_000_000)[:n_senders]
+
+    # Word counts and words of all messages at once
+    lengths = np.clip(np.round(rng.lognormal(np.log(7), 0.8, size=n)), 1, 150).astype(int)
+    reaction = rng.random(n) < REACTION_SHARE
+    lengths[reaction] = 0
+    total = int(lengths.sum())
+    word_topic = np.repeat(conv_topic[conv], lengths)
+    topical = rng.random(total) < TOPIC_WORD_SHARE
+    ranks = min(len(v) for v in vocab)
+    topic_rank = rng.choice(ranks, size=total, p=_zipf_weights(ranks, 0.9))
+    common_rank = rng.integers(0, len(common), size=total)
+    words = common[common_rank]
+    for t, topic_words in enumerate(vocab):
+        mask = topical & (word_topic == t)
+        words[mask] = topic_words[topic_rank[mask]]
+    offsets = np.r_[0, np.cumsum(lengths)]
+
+    endings = rng.choice(["", ".", "?", "!", ")", "..."], size=n, p=[0.45, 0.2, 0.12, 0.08, 0.1, 0.05])
+    extras = rng.random(n)
+    reaction_choice = rng.integers(0, len(REACTIONS), size=n)
+    emoji_choice = rng.integers(0, len(EMOJI), size=n)
+
+    records = []
+    for new_id, i in enumerate(order, start=1):
+        if reaction[i]:
+            text = REACTIONS[reaction_choice[i]]
+        else:
+            text = " ".join(words[offsets[i]:offsets[i + 1]])
+            text = text[0].upper() + text[1:] + endings[i]
+        if extras[i] < 0.08:
+            text += " " + EMOJI[emoji_choice[i]]
+        elif extras[i] > 0.98:
+            text += f" https://example.com/{conv[i]}"
+        sender = senders[i]
+        records.append({
+            "id": new_id,
+            "date": (start + timedelta(seconds=float(timestamps[i]))).replace(microsecond=0).isoformat(),
+            "sender_id": int(sender_ids[sender]),
+            "sender_username": f"user{sender}",
+            "sender_name": f"{FIRST_NAMES[sender % len(FIRST_NAMES)]} "
+                           f"{LAST_NAMES[(sender // len(FIRST_NAMES)) % len(LAST_NAMES)]}",
+            "text": text,
+        })
+    return records
+
+
+def to_desktop_export(records: List[dict], name: str = "Synthetic chat") -> dict:
+    """The records as a Telegram Desktop result.json export."""
+    return {
+        "name": name,
+        "type": "private_supergroup",
+        "id": 1,
+        "messages": [
+            {
+                "id": r["id"],
+                "type": "message",
+                "date": r["date"][:19],
+                "from": r["sender_name"],
+                "from_id": f"user{r['sender_id']}",
+                "text": r["text"],
+            }
+            for r in records
+        ],
+    }
+
+
+def write_chat(path: str, n: int, seed: int = 42, fmt: str = "records") -> str:
+    """Generate a chat and write it as downloader JSON ("records") or a Telegram Desktop export ("desktop")."""
+    records = generate_messages(n, seed=seed)
+    data = to_desktop_export(records) if fmt == "desktop" else records
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    return path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["records", "desktop"], default="records")
+    parser.add_argument("--out", default="synthetic_chat.json")
+    args = parser.parse_args()
+
+    write_chat(args.out, args.size, args.seed, args.format)
+    print(f"💬 Wrote {args.size} messages to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -43,7 +43,39 @@ dp.include_router(router)
 # === Main entry point for launching the bot ===
 async def main():
     logging.info("🤖 Starting Telegram bot (aiogram v3)...")
-    await dp.start_polling(bot)
+
+    # With the job queue, analyses run in `tg_analyst.worker` processes; the bot only delivers them.
+    # TGA_BOT_WORKERS of them are started here (0 when they run separately)
+    from tg_bot.delivery import BOT_WORKERS, JOB_QUEUE_ENABLED, delivery_loop
+    from tg_analyst.worker import start_workers, stop_workers
+    delivery = asyncio.create_task(delivery_loop(bot)) if JOB_QUEUE_ENABLED else None
+    workers = start_workers(BOT_WORKERS) if JOB_QUEUE_ENABLED else []
+    if workers:
+        logging.info(f"👷 Started {len(workers)} analysis workers")
+
+    # Prometheus text metrics on a local port (TGA_METRICS_PORT, 0 disables it)
+    from tg_bot.metrics_server import start_metrics_server
+    metrics_server = await start_metrics_server()
+
+    # Otherwise start the analysis worker processes (each loads the embedding model once) before
+    # polling, so the first analysis doesn't pay for it
+    from tg_bot.executor import analysis_executor
+    if not JOB_QUEUE_ENABLED and os.getenv("TGA_WARM_UP_MODELS", "1") != "0":
+        try:
+            stats = await analysis_executor.warm_up()
+            logging.info(f"🔥 Analysis workers warmed up: {stats}")
+        except Exception as e:
+            logging.error(f"❌ Worker warm-up failed, models will load on first use: {e}")
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if delivery is not None:
+            delivery.cancel()
+        if metrics_server is not None:
+            metrics_server.close()
+        analysis_executor.shutdown()
+        stop_workers(workers, interrupt=True)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,150 @@
+"""
+GPT summarization against a local stand-in for the OpenAI chat completions endpoint.
+
+The stub server answers by the system prompt of each request (map, merge or the final
+synthesis) and records every request, so the tests can count the calls of each kind and
+check that no part of the analysis is dropped on the way to the final prompt.
+"""
+
+import re
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tg_analyst import gpt_client, gpt_map_reduce, gpt_summary
+
+# Roughly 150 tokens of the fallback counter, so six map summaries need two merges
+FILLER = " lorem" * 75
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        system, user = body["messages"][0]["content"], body["messages"][-1]["content"]
+        if system == gpt_map_reduce.MAP_PROMPT:
+            kind = "map"
+            content = " ".join(f"summary-of-cluster-{i}" for i in re.findall(r"--- Cluster (\d+)", user)) + FILLER
+        elif system == gpt_map_reduce.MERGE_PROMPT:
+            kind = "merge"
+            content = " ".join(re.findall(r"summary-of-cluster-\d+", user)) + FILLER
+        else:
+            kind = "final"
+            content = "final analysis"
+        self.server.calls.append((kind, user))
+
+        response = json.dumps({
+            "id": f"chatcmpl-{len(self.server.calls)}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def openai_stub(monkeypatch, tmp_path):
+    """A local chat completions endpoint; yields the list of (kind, user prompt) it received."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.calls = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(gpt_client, "GPT_CACHE_PATH", str(tmp_path / "gpt_completions.sqlite"))
+    yield server.calls
+    server.shutdown()
+    server.server_close()
+
+
+def _write_results(results_dir, clusters: int = 0, cluster_words: int = 0, report: str = ""):
+    results_dir.mkdir(parents=True, exist_ok=True)
+    (results_dir / "nmf_topics.txt").write_text("Topic 1: work meeting deadline\n", encoding="utf-8")
+    (results_dir / "word_frequency.csv").write_text("word,count\nwork,10\n", encoding="utf-8")
+    (results_dir / "report.md").write_text(report, encoding="utf-8")
+    blocks = [
+        f"--- Cluster {i} ---\n" + "\n".join(f"• message {i} {j}" for j in range(cluster_words))
+        for i in range(clusters)
+    ]
+    (results_dir / "cluster_summaries.txt").write_text("\n\n".join(blocks), encoding="utf-8")
+    return str(results_dir)
+
+
+def test_auto_mode_sends_input_that_fits_whole(openai_stub, monkeypatch, tmp_path):
+    # Longer than the old 12,000 character cut, but within the prompt token budget
+    report = "x" * 13000 + " END-OF-REPORT"
+    results_dir = _write_results(tmp_path / "results", report=report)
+    monkeypatch.setattr(gpt_summary, "GPT_MODE", "auto")
+
+    gpt_summary.main(results_dir)
+
+    assert [kind for kind, _ in openai_stub] == ["final"]
+    assert report in openai_stub[0][1]
+    assert (tmp_path / "results" / "final_analysis_gpt.txt").read_text(encoding="utf-8") == "final analysis"
+
+
+def test_single_mode_cuts_oversized_input_to_the_token_budget(openai_stub, monkeypatch, tmp_path):
+    results_dir = _write_results(tmp_path / "results", report="x" * 40000)
+    monkeypatch.setattr(gpt_summary, "GPT_MODE", "single")
+
+    gpt_summary.main(results_dir)
+
+    assert [kind for kind, _ in openai_stub] == ["final"]
+    assert gpt_map_reduce.count_tokens(f"{gpt_summary.SYSTEM_PROMPT}\n{openai_stub[0][1]}") <= gpt_map_reduce.INPUT_TOKENS
+
+
+def test_map_reduce_summarizes_every_cluster(openai_stub, monkeypatch, tmp_path):
+    # Every cluster fills most of a map batch, so each one gets its own map request
+    monkeypatch.setattr(gpt_map_reduce, "INPUT_TOKENS", 1500)
+    results_dir = _write_results(tmp_path / "results", clusters=6, cluster_words=220)
+
+    result = gpt_map_reduce.summarize_map_reduce(results_dir, token_budget=60000, concurrency=2)
+
+    kinds = [kind for kind, _ in openai_stub]
+    assert result == "final analysis"
+    assert kinds.count("map") == 6
+    assert kinds.count("merge") == 2
+    assert kinds[-1] == "final" and kinds.count("final") == 1
+    # Every cluster reached the map stage and its summary the final prompt
+    mapped = " ".join(user for kind, user in openai_stub if kind == "map")
+    final_prompt = openai_stub[-1][1]
+    for i in range(6):
+        assert f"--- Cluster {i} ---" in mapped
+        assert f"summary-of-cluster-{i}" in final_prompt
+
+
+def test_main_map_reduce_mode_writes_the_summary(openai_stub, monkeypatch, tmp_path):
+    monkeypatch.setattr(gpt_map_reduce, "INPUT_TOKENS", 1500)
+    monkeypatch.setattr(gpt_summary, "GPT_MODE", "map_reduce")
+    results_dir = _write_results(tmp_path / "results", clusters=3, cluster_words=20)
+
+    gpt_summary.main(results_dir)
+
+    kinds = [kind for kind, _ in openai_stub]
+    assert kinds == ["map", "final"]
+    assert all(f"summary-of-cluster-{i}" in openai_stub[-1][1] for i in range(3))
+    assert (tmp_path / "results" / "final_analysis_gpt.txt").read_text(encoding="utf-8") == "final analysis"
+
+
+def test_map_reduce_respects_the_token_budget(openai_stub, monkeypatch, tmp_path):
+    monkeypatch.setattr(gpt_map_reduce, "INPUT_TOKENS", 1500)
+    results_dir = _write_results(tmp_path / "results", clusters=6, cluster_words=220)
+
+    # Room for the final request and two map batches only
+    budget = 1500 + gpt_map_reduce.FINAL_OUTPUT_TOKENS + 2 * (1500 + gpt_map_reduce.MAP_OUTPUT_TOKENS)
+    result = gpt_map_reduce.summarize_map_reduce(results_dir, token_budget=budget, concurrency=1)
+
+    kinds = [kind for kind, _ in openai_stub]
+    assert result == "final analysis"
+    assert kinds.count("map") == 2
+    assert kinds[-1] == "final"
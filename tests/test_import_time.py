@@ -0,0 +1,29 @@
+"""
+Importing the analysis entry points must not pull in the ML stack; the stages import it when they run.
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+HEAVY_MODULES = ("pandas", "sklearn", "sentence_transformers", "umap", "hdbscan")
+
+
+def _heavy_modules_after(code: str):
+    probe = f"{code}\nimport json, sys\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    out = subprocess.run([sys.executable, "-c", probe], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("code", [
+    "import tg_analyst.utils.analyzer",
+    "from tg_analyst.utils.analyzer import plot_user_activity, analyze_messages",
+])
+def test_analyzer_import_is_light(code):
+    assert _heavy_modules_after(code) == []
@@ -0,0 +1,248 @@
+"""
+Shared access to the OpenAI chat completions API.
+
+- One client per API key and endpoint is kept per process and reused, so the HTTP
+  connection pool survives between requests.
+- Completions are cached in SQLite, keyed by model, temperature, completion limit and the
+  hash of the prompt, and expire after TGA_GPT_CACHE_TTL_HOURS. Re-analysing an unchanged
+  chat then costs neither API latency nor money.
+- Identical requests made at the same time (from several threads, or several tasks of one
+  event loop) share one API call.
+- Rate limits, timeouts, connection errors and 5xx responses are retried with exponential
+  backoff and full jitter.
+
+- TGA_GPT_CACHE: set to 0 to disable the completion cache
+- TGA_GPT_CACHE_PATH: location of the completion cache database
+- TGA_GPT_CACHE_TTL_HOURS: age after which a cached completion is requested again
+- TGA_GPT_MAX_RETRIES: retries of a failed request
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+)
+
+GPT_CACHE = os.getenv("TGA_GPT_CACHE", "1") != "0"
+GPT_CACHE_PATH = os.getenv("TGA_GPT_CACHE_PATH", os.path.join(BASE_DIR, "cache", "gpt_completions.sqlite"))
+GPT_CACHE_TTL_HOURS = float(os.getenv("TGA_GPT_CACHE_TTL_HOURS", "168"))
+
+MAX_RETRIES = int(os.getenv("TGA_GPT_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+# Error class names of the openai package worth retrying
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+_clients: Dict[Tuple[str, Optional[str]], Any] = {}
+_clients_lock = threading.Lock()
+
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+_cache_lock = threading.Lock()
+
+
+def get_client(api_key: str):
+    """The process-wide OpenAI client for `api_key` (and the configured OPENAI_BASE_URL)."""
+    from openai import OpenAI
+
+    key = (api_key, os.getenv("OPENAI_BASE_URL"))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Retries are done here, with jitter, instead of by the client
+            client = _clients[key] = OpenAI(api_key=api_key, max_retries=0)
+    return client
+
+
+def cache_key(model: str, temperature: float, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> str:
+    """Hash identifying one completion request."""
+    prompt = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(f"{model}|{temperature}|{max_tokens}|{prompt}".encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _connect():
+    os.makedirs(os.path.dirname(GPT_CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(GPT_CACHE_PATH, timeout=30)
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, model TEXT, created REAL, content TEXT, tokens INTEGER)"
+        )
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def cache_get(key: str) -> Optional[str]:
+    """The cached completion for `key`, or None if missing, expired or caching is off."""
+    if not GPT_CACHE:
+        return None
+    try:
+        with _cache_lock, _connect() as conn:
+            row = conn.execute("SELECT content, created FROM completions WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logging.warning(f"⚠️ GPT cache unavailable: {e}")
+        return None
+    if row is None or time.time() - row[1] > GPT_CACHE_TTL_HOURS * 3600:
+        return None
+    return row[0]
+
+
+def cache_put(key: str, model: str, content: str, tokens: int = 0) -> None:
+    """Store a completion and drop expired ones. Empty completions are not stored, so they are requested again."""
+    if not GPT_CACHE or not content:
+        return
+    now = time.time()
+    try:
+        with _cache_lock, _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, created, content, tokens) VALUES (?, ?, ?, ?, ?)",
+                (key, model, now, content, tokens),
+            )
+            conn.execute("DELETE FROM completions WHERE created < ?", (now - GPT_CACHE_TTL_HOURS * 3600,))
+    except sqlite3.Error as e:
+        logging.warning(f"⚠️ Could not cache GPT completion: {e}")
+
+
+def _retryable(error: Exception) -> bool:
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retry number `attempt` (0-based): exponential with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _content_and_tokens(response) -> Tuple[str, int]:
+    usage = getattr(response, "usage", None)
+    return response.choices[0].message.content or "", usage.total_tokens if usage else 0
+
+
+def complete(api_key: str, model: str, messages: List[Dict[str, str]], temperature: float,
+             max_tokens: Optional[int] = None) -> str:
+    """
+    Request a chat completion through the pooled client, the cache and in-flight deduplication.
+
+    Args:
+        api_key (str): OpenAI API key.
+        model (str): Model name.
+        messages (List[dict]): Chat messages ("role", "content").
+        temperature (float): Sampling temperature.
+        max_tokens (int, optional): Completion limit.
+
+    Returns:
+        str: The completion text.
+
+    Raises:
+        Exception: The last error of the openai package once retries are exhausted.
+    """
+    key = cache_key(model, temperature, messages, max_tokens)
+    cached = cache_get(key)
+    if cached is not None:
+        logging.info("📦 Reusing cached GPT completion")
+        return cached
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        logging.info("⏳ Waiting for an identical GPT request in progress")
+        return future.result()
+
+    try:
+        client = get_client(api_key)
+        kwargs = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = client.chat.completions.create(
+                    model=model, messages=messages, temperature=temperature, **kwargs
+                )
+                break
+            except Exception as e:
+                if attempt == MAX_RETRIES or not _retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"⚠️ GPT request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        content, tokens = _content_and_tokens(response)
+        cache_put(key, model, content, tokens)
+        future.set_result(content)
+        return content
+    except Exception as e:
+        # Waiting callers get the error too
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+class AsyncCompletions:
+    """
+    The async counterpart of `complete` for one event loop: caching, deduplication of identical
+    concurrent requests and retries around an AsyncOpenAI client owned by the caller
+    (async clients are bound to their event loop, so they are not pooled across runs).
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], temperature: float,
+                       max_tokens: Optional[int] = None) -> Tuple[str, int, bool]:
+        """
+        Returns:
+            tuple: (completion text, tokens used, True if it came from the cache)
+        """
+        key = cache_key(model, temperature, messages, max_tokens)
+        cached = await asyncio.to_thread(cache_get, key)
+        if cached is not None:
+            return cached, 0, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            content, _ = await asyncio.shield(task)
+            return content, 0, True
+
+        task = self._inflight[key] = asyncio.ensure_future(self._request(key, model, messages, temperature, max_tokens))
+        try:
+            content, tokens = await task
+        finally:
+            self._inflight.pop(key, None)
+        return content, tokens, False
+
+    async def _request(self, key, model, messages, temperature, max_tokens) -> Tuple[str, int]:
+        kwargs = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model, messages=messages, temperature=temperature, **kwargs
+                )
+                break
+            except Exception as e:
+                if attempt == MAX_RETRIES or not _retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"⚠️ GPT request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        content, tokens = _content_and_tokens(response)
+        await asyncio.to_thread(cache_put, key, model, content, tokens)
+        return content, tokens
@@ -0,0 +1,301 @@
+"""
+Hierarchical (map-reduce) GPT summarization for chats whose analysis does not fit one prompt.
+
+1. map: the messages of every cluster are packed into batches that fit one request and
+   summarized in parallel by an async client, at most TGA_GPT_CONCURRENCY requests at a time
+2. reduce: partial summaries are merged group by group until they fit one prompt
+3. synthesis: the merged summary, NMF topics, word frequencies and the report answer the
+   same questions as the single-request mode
+
+Every request is counted against a token budget for the whole run (prompt + completion).
+The final request is reserved up front, so the map stage can never starve it. Clusters that
+no longer fit the budget are left out and the omission is logged.
+
+- TGA_GPT_TOKEN_BUDGET: tokens one summarization may spend in total
+- TGA_GPT_INPUT_TOKENS: prompt size of one request
+- TGA_GPT_CONCURRENCY: parallel requests
+- TGA_GPT_MESSAGES_PER_CLUSTER: example messages per cluster given to the map stage
+
+Requests go through the completion cache and retry policy of gpt_client and to the endpoint
+configured for the openai package (OPENAI_BASE_URL), so a local stand-in for the OpenAI API
+can be used for testing.
+"""
+
+import os
+import re
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from tg_analyst.gpt_client import AsyncCompletions, cache_get, cache_key
+from tg_analyst.gpt_summary import (
+    GPT_MODEL, GPT_TEMPERATURE, QUESTIONS, SYSTEM_PROMPT, collect_sections, format_input,
+)
+
+TOKEN_BUDGET = int(os.getenv("TGA_GPT_TOKEN_BUDGET", "60000"))
+INPUT_TOKENS = int(os.getenv("TGA_GPT_INPUT_TOKENS", "5000"))
+CONCURRENCY = int(os.getenv("TGA_GPT_CONCURRENCY", "4"))
+MESSAGES_PER_CLUSTER = int(os.getenv("TGA_GPT_MESSAGES_PER_CLUSTER", "30"))
+
+MAP_OUTPUT_TOKENS = 400
+FINAL_OUTPUT_TOKENS = 1500
+# Per-message overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+MAP_PROMPT = (
+    "Below are groups of messages from a Telegram group chat; each group is one semantic cluster. "
+    "For every cluster, describe in 1–3 sentences what it is about and the tone of the messages. "
+    "Keep cluster numbers. Answer in the language of the messages."
+)
+
+MERGE_PROMPT = (
+    "Below are partial summaries of the semantic clusters of one Telegram group chat. "
+    "Merge them into one summary: group related clusters into themes, keep notable details "
+    "and the tone, and drop repetitions."
+)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = GPT_MODEL) -> int:
+    """
+    Number of tokens `text` takes for `model`. Uses tiktoken when installed; otherwise
+    estimates from the UTF-8 length, erring on the high side for Cyrillic text.
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = GPT_MODEL) -> str:
+    """Cut `text` to at most `max_tokens` tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    while count_tokens(text, model) > max_tokens:
+        text = text[:max(0, int(len(text) * max_tokens / count_tokens(text, model)) - 1)]
+    return text
+
+
+def single_request_input_tokens() -> int:
+    """Tokens left for the analysis text in the prompt of one request, next to the system prompt and questions."""
+    return INPUT_TOKENS - count_tokens(f"{SYSTEM_PROMPT}\n\n\n{QUESTIONS}")
+
+
+def fits_single_request(text: str) -> bool:
+    """True if `text` plus the questions fits the prompt of one request."""
+    return count_tokens(f"{SYSTEM_PROMPT}\n{text}\n{QUESTIONS}") <= INPUT_TOKENS
+
+
+class TokenBudget:
+    """
+    Tokens one summarization may still spend. A request reserves its worst case
+    (prompt + max completion) before it is sent and settles the actual usage afterwards.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.reserved = 0
+
+    @property
+    def remaining(self) -> int:
+        return self.limit - self.used - self.reserved
+
+    def reserve(self, tokens: int) -> bool:
+        if tokens > self.remaining:
+            return False
+        self.reserved += tokens
+        return True
+
+    def settle(self, reserved: int, used: int) -> None:
+        self.reserved -= reserved
+        self.used += used
+
+
+def _cluster_blocks(results_dir: str, sections: Dict[str, str]) -> List[str]:
+    """One text block per cluster: up to MESSAGES_PER_CLUSTER messages of each, largest clusters first."""
+    csv_path = os.path.join(results_dir, "hdbscan_clusters.csv")
+    if os.path.exists(csv_path):
+        import pandas as pd
+
+        try:
+            df = pd.read_csv(csv_path)
+            df = df[df["cluster"] != -1]
+            blocks = []
+            for cluster_id, texts in sorted(df.groupby("cluster")["text"], key=lambda g: -len(g[1])):
+                lines = [str(t).strip().replace("\n", " ") for t in texts.head(MESSAGES_PER_CLUSTER)]
+                blocks.append(
+                    f"--- Cluster {cluster_id} ({len(texts)} messages) ---\n" + "\n".join(f"• {t}" for t in lines if t)
+                )
+            if blocks:
+                return blocks
+        except Exception as e:
+            logging.warning(f"⚠️ Could not read clusters from {csv_path}: {e}")
+
+    # Fall back to the examples written by summarize_clusters
+    return [b.strip() for b in re.split(r"(?m)^(?=--- Cluster )", sections["clusters"]) if b.strip()]
+
+
+def _pack(blocks: List[str], max_tokens: int) -> List[str]:
+    """Greedily join blocks into batches of at most `max_tokens` tokens (oversized blocks are cut)."""
+    batches, current, size = [], [], 0
+    for block in blocks:
+        tokens = count_tokens(block)
+        if tokens > max_tokens:
+            block, tokens = truncate_to_tokens(block, max_tokens), max_tokens
+        if current and size + tokens > max_tokens:
+            batches.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(block)
+        size += tokens
+    if current:
+        batches.append("\n\n".join(current))
+    return batches
+
+
+class _Summarizer:
+    """Shares one async client, concurrency limit and token budget between the requests of a run."""
+
+    def __init__(self, client, budget: TokenBudget, concurrency: int):
+        self.completions = AsyncCompletions(client)
+        self.budget = budget
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = 0
+
+    async def complete(self, system: str, user: str, max_tokens: int) -> Optional[str]:
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+        # Cached completions are free, even when the budget is spent
+        cached = await asyncio.to_thread(cache_get, cache_key(GPT_MODEL, GPT_TEMPERATURE, messages, max_tokens))
+        if cached is not None:
+            return cached
+
+        prompt_tokens = count_tokens(system) + count_tokens(user) + 2 * MESSAGE_OVERHEAD_TOKENS
+        reserved = prompt_tokens + max_tokens
+        if not self.budget.reserve(reserved):
+            return None
+
+        async with self.semaphore:
+            try:
+                content, tokens, cached = await self.completions.complete(
+                    GPT_MODEL, messages, GPT_TEMPERATURE, max_tokens
+                )
+            except Exception as e:
+                logging.error(f"❌ GPT request failed: {e}")
+                self.budget.settle(reserved, 0)
+                return None
+
+        if not cached:
+            self.requests += 1
+        self.budget.settle(reserved, tokens if tokens or cached else prompt_tokens + count_tokens(content))
+        return content
+
+    async def map(self, batches: List[str]) -> List[str]:
+        results = await asyncio.gather(*(self.complete(MAP_PROMPT, b, MAP_OUTPUT_TOKENS) for b in batches))
+        skipped = sum(1 for r in results if r is None)
+        if skipped:
+            logging.warning(f"⚠️ {skipped} of {len(batches)} cluster batches were not summarized (token budget or errors)")
+        return [r for r in results if r]
+
+    async def reduce(self, parts: List[str], max_tokens: int) -> str:
+        while len(parts) > 1 and count_tokens("\n\n".join(parts)) > max_tokens:
+            groups = _pack(parts, max_tokens)
+            if len(groups) >= len(parts):
+                break
+            merged = await asyncio.gather(*(self.complete(MERGE_PROMPT, g, MAP_OUTPUT_TOKENS) for g in groups))
+            # A failed merge keeps (a cut of) its inputs, so nothing is dropped silently
+            parts = [m or truncate_to_tokens(g, MAP_OUTPUT_TOKENS) for m, g in zip(merged, groups)]
+            logging.info(f"🧠 Merged partial summaries into {len(parts)}")
+        return truncate_to_tokens("\n\n".join(parts), max_tokens)
+
+
+def _fit_sections(sections: Dict[str, str], max_tokens: int) -> Dict[str, str]:
+    """Cut sections, least important first (report, words, topics), until the prompt fits."""
+    sections = dict(sections)
+    for name in ("report", "words", "topics", "clusters"):
+        excess = count_tokens(format_input(sections)) - max_tokens
+        if excess <= 0:
+            break
+        sections[name] = truncate_to_tokens(sections[name], count_tokens(sections[name]) - excess)
+    return sections
+
+
+async def _summarize(results_dir: str, client, budget: TokenBudget, concurrency: int) -> Optional[str]:
+    sections = collect_sections(results_dir)
+    summarizer = _Summarizer(client, budget, concurrency)
+
+    # Keep the final request's worst case out of reach of the map and reduce stages
+    final_reserve = INPUT_TOKENS + FINAL_OUTPUT_TOKENS
+    if not budget.reserve(final_reserve):
+        logging.error(f"❌ GPT token budget {budget.limit} is smaller than one final request ({final_reserve})")
+        return None
+
+    question_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(QUESTIONS) + 2 * MESSAGE_OVERHEAD_TOKENS
+    batch_tokens = INPUT_TOKENS - count_tokens(MAP_PROMPT) - 2 * MESSAGE_OVERHEAD_TOKENS
+    blocks = _cluster_blocks(results_dir, sections)
+    if blocks:
+        batches = _pack(blocks, batch_tokens)
+        logging.info(f"🧠 Summarizing {len(blocks)} clusters in {len(batches)} batches...")
+        partial = await summarizer.map(batches)
+        # The merged cluster summary gets half of the final prompt
+        sections["clusters"] = await summarizer.reduce(partial, (INPUT_TOKENS - question_tokens) // 2)
+
+    budget.settle(final_reserve, 0)
+    prompt = format_input(_fit_sections(sections, INPUT_TOKENS - question_tokens))
+    result = await summarizer.complete(SYSTEM_PROMPT, prompt + "\n\n" + QUESTIONS, FINAL_OUTPUT_TOKENS)
+    logging.info(
+        f"🧠 Hierarchical GPT summary: {summarizer.requests} requests, {budget.used} of {budget.limit} tokens"
+    )
+    return result
+
+
+def summarize_map_reduce(results_dir: str, token_budget: Optional[int] = None,
+                         concurrency: Optional[int] = None) -> str:
+    """
+    Summarize the analysis in `results_dir` hierarchically (see the module docstring).
+
+    Args:
+        results_dir (str): Directory with the analysis outputs.
+        token_budget (int, optional): Tokens the run may spend (default: TGA_GPT_TOKEN_BUDGET).
+        concurrency (int, optional): Parallel requests (default: TGA_GPT_CONCURRENCY).
+
+    Returns:
+        str: The final analysis, or the same failure messages as `ask_gpt`.
+    """
+    from openai import AsyncOpenAI
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logging.error("OPENAI_API_KEY not found in .env file.")
+        return "API key not found."
+
+    budget = TokenBudget(token_budget or TOKEN_BUDGET)
+
+    async def run() -> Optional[str]:
+        async with AsyncOpenAI(api_key=api_key, max_retries=0) as client:
+            return await _summarize(results_dir, client, budget, concurrency or CONCURRENCY)
+
+    try:
+        result = asyncio.run(run())
+    except Exception as e:
+        logging.error(f"❌ Hierarchical GPT summary failed: {e}")
+        return "GPT request failed."
+    return result or "GPT request failed."
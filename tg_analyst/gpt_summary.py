@@ -6,73 +6,98 @@ BASE_DIR = os.environ.get("TGANALYST_BASE_DIR", os.path.abspath(os.path.join(os.
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import logging
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from tg_analyst.gpt_client import complete
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+GPT_MODEL = os.getenv("TGA_GPT_MODEL", "gpt-4")
+GPT_TEMPERATURE = 0.7
 
-def prepare_gpt_input(results_dir: str) -> str:
+# "single" (one request, input cut to the prompt budget TGA_GPT_INPUT_TOKENS), "map_reduce"
+# (hierarchical, see gpt_map_reduce) or "auto" (map_reduce when the input does not fit one request)
+GPT_MODE = os.getenv("TGA_GPT_MODE", "auto")
+
+SYSTEM_PROMPT = (
+    "You are a professional conversation analyst. Your task is to analyze a Telegram group chat using the outputs of topic modeling (NMF), "
+    "semantic clustering (HDBSCAN), word frequency statistics, and selected message examples from each cluster. "
+    "Your goal is to deeply interpret the group’s behavior and communication patterns, not just summarize raw outputs."
+)
+
+QUESTIONS = (
+    "Please answer the following questions:\n"
+    "1. What are the main topics discussed in the chat? Group them thematically.\n"
+    "If there any topics or themes that might have been missed by the models but are visible in the sample messages, just add them to point 1\n"
+    "3. How do participants interact with each other? Are there signs of close relationships, informal tone, or leadership?\n"
+    "4. How would you describe the emotional tone and communication style in this group?\n"
+    "5. Based on all the data, write a 5–7 sentence summary of what this Telegram group is mostly about."
+)
+
+
+def _read(path: str) -> str:
+    if not os.path.exists(path):
+        return ""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def collect_sections(results_dir: str) -> dict:
     """
-    Collects output files from the given results directory and prepares a formatted prompt
-    for GPT-based summarization. Truncates large files to avoid token overflow.
-    
-    Args:
-        results_dir (str): Path to the directory with result files.
-        
+    Reads the analysis outputs GPT is given from the results directory.
+
     Returns:
-        str: Formatted text for GPT input.
+        dict: "topics", "clusters", "words" and "report" texts (empty when a file is missing).
     """
-    nmf_path = os.path.join(results_dir, "nmf_topics.txt")
-    clusters_path = os.path.join(results_dir, "hdbscan_clusters.csv")
-    cluster_summary_path = os.path.join(results_dir, "cluster_summaries.txt")
-    freq_path = os.path.join(results_dir, "word_frequency.csv")
-    report_path = os.path.join(results_dir, "report.md")
-
-    nmf_summary = ""
-    cluster_summary = ""
-    word_freq = ""
-    report_text = ""
-
-    if os.path.exists(nmf_path):
-        with open(nmf_path, "r", encoding="utf-8") as f:
-            nmf_summary = f.read()
-
-    if os.path.exists(cluster_summary_path):
-        with open(cluster_summary_path, "r", encoding="utf-8") as f:
-            cluster_summary += "\n" + f.read()
-
-    if os.path.exists(freq_path):
-        with open(freq_path, "r", encoding="utf-8") as f:
-            word_freq = f.read()
-
-    if os.path.exists(report_path):
-        with open(report_path, "r", encoding="utf-8") as f:
-            report_text = f.read()
-
-    combined = f"""
+    return {
+        "topics": _read(os.path.join(results_dir, "nmf_topics.txt")),
+        "clusters": _read(os.path.join(results_dir, "cluster_summaries.txt")),
+        "words": _read(os.path.join(results_dir, "word_frequency.csv")),
+        "report": _read(os.path.join(results_dir, "report.md")),
+    }
+
+
+def format_input(sections: dict) -> str:
+    """Formats collected sections into the prompt text."""
+    return f"""
 📊 Final Chat Analysis Summary
 
 --- Topics (NMF) ---
-{nmf_summary}
+{sections["topics"]}
 
 --- Semantic Clusters (HDBSCAN) ---
-{cluster_summary}
+{sections["clusters"]}
 
 --- Frequent Words ---
-{word_freq}
+{sections["words"]}
 
 --- Markdown Report (Optional) ---
-{report_text}
+{sections["report"]}
 """
 
-    if len(combined) > 12000:
-        logging.warning(f"⚠️ GPT input is too long ({len(combined)} chars), truncating.")
-        combined = combined[:12000]
 
-    return combined
+def prepare_gpt_input(results_dir: str) -> str:
+    """
+    Collects output files from the given results directory and prepares a formatted prompt
+    for GPT-based summarization. Input that does not fit the prompt of one request
+    (see `gpt_map_reduce.fits_single_request`) is cut to that token budget.
+    
+    Args:
+        results_dir (str): Path to the directory with result files.
+        
+    Returns:
+        str: Formatted text for GPT input.
+    """
+    from tg_analyst.gpt_map_reduce import fits_single_request, single_request_input_tokens, truncate_to_tokens
+
+    combined = format_input(collect_sections(results_dir))
+
+    if not fits_single_request(combined):
+        logging.warning("⚠️ GPT input does not fit one request, truncating (TGA_GPT_MODE=auto summarizes it whole).")
+        combined = truncate_to_tokens(combined, single_request_input_tokens())
 
+    return combined
 
 
 def ask_gpt(full_text: str) -> str:
@@ -85,51 +110,47 @@ def ask_gpt(full_text: str) -> str:
         logging.error("OPENAI_API_KEY not found in .env file.")
         return "API key not found."
 
-    client = OpenAI(api_key=api_key)
-
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a professional conversation analyst. Your task is to analyze a Telegram group chat using the outputs of topic modeling (NMF), "
-                        "semantic clustering (HDBSCAN), word frequency statistics, and selected message examples from each cluster. "
-                        "Your goal is to deeply interpret the group’s behavior and communication patterns, not just summarize raw outputs."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": full_text + "\n\n"
-                    "Please answer the following questions:\n"
-                    "1. What are the main topics discussed in the chat? Group them thematically.\n"
-                    "If there any topics or themes that might have been missed by the models but are visible in the sample messages, just add them to point 1\n"
-                    "3. How do participants interact with each other? Are there signs of close relationships, informal tone, or leadership?\n"
-                    "4. How would you describe the emotional tone and communication style in this group?\n"
-                    "5. Based on all the data, write a 5–7 sentence summary of what this Telegram group is mostly about."
-                }
+        return complete(
+            api_key,
+            GPT_MODEL,
+            [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": full_text + "\n\n" + QUESTIONS}
             ],
-            temperature=0.7
+            temperature=GPT_TEMPERATURE
         )
-        return response.choices[0].message.content
     except Exception as e:
         logging.error(f"❌ GPT request failed: {e}")
         return "GPT request failed."
 
 
-def main(results_dir=None):
+def main(results_dir=None, job=None):
     """
     Main entry point: prepares input, gets summary from GPT, and writes it to file.
+    Reads and writes the `job` workspace when a JobContext is given and results_dir is not.
     """
+    if results_dir is None and job is not None:
+        results_dir = job.output_dir
+
     if results_dir is None:
         base_dir = os.environ.get("TGANALYST_BASE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
         results_dir = os.path.join(base_dir, "data", "results")
 
-    input_text = prepare_gpt_input(results_dir)
+    mode = GPT_MODE
+    if mode == "auto":
+        from tg_analyst.gpt_map_reduce import fits_single_request
+        mode = "single" if fits_single_request(format_input(collect_sections(results_dir))) else "map_reduce"
+
+    if mode == "map_reduce":
+        from tg_analyst.gpt_map_reduce import summarize_map_reduce
+        logging.info("🧠 Requesting hierarchical GPT analysis...")
+        result = summarize_map_reduce(results_dir)
+    else:
+        input_text = prepare_gpt_input(results_dir)
 
-    logging.info("🧠 Requesting GPT analysis...")
-    result = ask_gpt(input_text)
+        logging.info("🧠 Requesting GPT analysis...")
+        result = ask_gpt(input_text)
 
     output_path = os.path.join(results_dir, "final_analysis_gpt.txt")
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -0,0 +1,196 @@
+"""
+Per-job workspaces for analysis runs.
+
+Every run gets its own output directory (<data dir>/jobs/<job_id>) so concurrent analyses
+never overwrite each other's files. Old workspaces are removed by `cleanup_workspaces`
+according to an age and total-size retention policy. A running job holds its workspace
+(`JobContext.hold`), which keeps cleanups in any process away from it however long it runs.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, List, Optional
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+)
+
+JOBS_DIR = os.getenv("TGA_JOBS_DIR", os.path.join(BASE_DIR, "jobs"))
+
+# Retention policy for job workspaces
+JOB_MAX_AGE_HOURS = float(os.getenv("TGA_JOB_MAX_AGE_HOURS", "72"))
+JOB_MAX_TOTAL_MB = float(os.getenv("TGA_JOB_MAX_TOTAL_MB", "1024"))
+
+# Workspaces touched more recently than this are never removed (they may be about to be held)
+JOB_GRACE_SECONDS = 600
+
+# Lock file a running job holds a shared lock on (see JobContext.hold)
+LOCK_FILE = ".lock"
+
+
+def new_job_id() -> str:
+    """A unique, time-ordered job id, also used as the workspace directory name."""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+@dataclass
+class JobContext:
+    """
+    Identity and output location of a single analysis run.
+
+    Attributes:
+        job_id (str): Unique id of the run.
+        chat_id (Any): Telegram chat the run analyzes, if known.
+        output_dir (str): Directory all result files of this run are written to.
+    """
+    job_id: str
+    chat_id: Optional[Any]
+    output_dir: str
+
+    @classmethod
+    def create(cls, chat_id: Optional[Any] = None, root: str = JOBS_DIR) -> "JobContext":
+        """Create a new job with a fresh, empty workspace under `root`."""
+        job_id = new_job_id()
+        output_dir = os.path.join(root, job_id)
+        os.makedirs(output_dir, exist_ok=True)
+        logging.info(f"🗂️ Created job {job_id} for chat {chat_id} in {output_dir}")
+        return cls(job_id=job_id, chat_id=chat_id, output_dir=output_dir)
+
+    @classmethod
+    def open(cls, job_id: str, chat_id: Optional[Any] = None, root: str = JOBS_DIR) -> "JobContext":
+        """Reopen the workspace of `job_id` (creating it if missing), e.g. to resume a queued job."""
+        output_dir = os.path.join(root, job_id)
+        resumed = os.path.isdir(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        logging.info(f"🗂️ {'Reopened' if resumed else 'Created'} job {job_id} for chat {chat_id} in {output_dir}")
+        return cls(job_id=job_id, chat_id=chat_id, output_dir=output_dir)
+
+    def path(self, filename: str) -> str:
+        """Absolute path of a result file inside this job's workspace."""
+        return os.path.join(self.output_dir, filename)
+
+    @contextmanager
+    def hold(self):
+        """
+        Keep `cleanup_workspaces` from removing this workspace while the block runs.
+
+        Takes a shared lock on the workspace's lock file, so several holders (e.g. the bot
+        waiting for a job and the process running it) don't block each other. The lock goes
+        away with the process, so a crashed job's workspace can be cleaned up. Without fcntl
+        (Windows) only the recent-modification grace period protects running jobs.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self.path(LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+@contextmanager
+def _claim_unused(path: str):
+    """Yields True while holding the workspace exclusively, False if a running job holds it."""
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+    lock_path = os.path.join(path, LOCK_FILE)
+    if not os.path.exists(lock_path):
+        yield True
+        return
+    try:
+        f = open(lock_path, "a")
+    except OSError:
+        yield True
+        return
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+
+
+def cleanup_workspaces(
+        root: str = JOBS_DIR,
+        max_age_hours: float = JOB_MAX_AGE_HOURS,
+        max_total_mb: float = JOB_MAX_TOTAL_MB,
+        keep: Iterable[str] = (),
+) -> List[str]:
+    """
+    Remove old job workspaces.
+
+    Workspaces older than `max_age_hours` are removed first; then the oldest remaining ones
+    are removed until the total size is under `max_total_mb`. Workspaces listed in `keep`,
+    held by a running job or modified within the last few minutes are never removed.
+
+    Returns:
+        List[str]: Ids of the removed jobs.
+    """
+    if not os.path.isdir(root):
+        return []
+
+    keep = set(keep)
+    now = time.time()
+    workspaces = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path) or name in keep:
+            continue
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        workspaces.append((mtime, name, path, _dir_size(path)))
+
+    workspaces.sort()
+    total = sum(w[3] for w in workspaces)
+    removed = []
+
+    for mtime, name, path, size in workspaces:
+        if now - mtime < JOB_GRACE_SECONDS:
+            break
+        too_old = max_age_hours > 0 and now - mtime > max_age_hours * 3600
+        too_big = max_total_mb > 0 and total > max_total_mb * 2 ** 20
+        if not (too_old or too_big):
+            continue
+        with _claim_unused(path) as unused:
+            if not unused:
+                continue
+            try:
+                shutil.rmtree(path)
+            except OSError as e:
+                logging.warning(f"⚠️ Could not remove job workspace {path}: {e}")
+                continue
+        total -= size
+        removed.append(name)
+
+    if removed:
+        logging.info(f"🧹 Removed {len(removed)} old job workspaces from {root}")
+    return removed
@@ -0,0 +1,367 @@
+"""
+Durable analysis job queue shared by the bot and the worker processes (SQLite).
+
+The bot enqueues jobs and delivers their results; `python -m tg_analyst.worker` processes
+claim and run them. A job names the function to run ("module:function", like pipeline
+stages) and its keyword arguments. Everything lives in one SQLite file, so jobs,
+progress messages and results survive a restart of the bot or of a worker.
+
+A running job holds a lease that its worker renews with heartbeats. If the worker dies,
+the lease expires after TGA_QUEUE_LEASE_SECONDS and another worker claims the job. The
+job keeps its workspace, so the pipeline resumes from the stages it had finished. A job
+is attempted at most TGA_QUEUE_MAX_ATTEMPTS times.
+
+Finished jobs whose outcome was delivered are removed TGA_QUEUE_RETENTION_HOURS after they
+ended, with their progress messages and subscribers (`prune`, called by the workers).
+
+- TGA_QUEUE_PATH: location of the queue database
+- TGA_QUEUE_LEASE_SECONDS: heartbeat age after which a running job is taken over
+- TGA_QUEUE_MAX_ATTEMPTS: attempts per job
+- TGA_QUEUE_RETENTION_HOURS: age after which delivered jobs are removed
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from tg_analyst.job import new_job_id
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+)
+
+QUEUE_PATH = os.getenv("TGA_QUEUE_PATH", os.path.join(BASE_DIR, "queue", "jobs.sqlite"))
+LEASE_SECONDS = float(os.getenv("TGA_QUEUE_LEASE_SECONDS", "120"))
+MAX_ATTEMPTS = int(os.getenv("TGA_QUEUE_MAX_ATTEMPTS", "3"))
+RETENTION_HOURS = float(os.getenv("TGA_QUEUE_RETENTION_HOURS", "24"))
+
+# Statuses of a job
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+ACTIVE = (QUEUED, RUNNING)
+_ACTIVE_PLACEHOLDERS = ", ".join("?" * len(ACTIVE))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    fn TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    dedup_key TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    heartbeat REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    result TEXT,
+    error TEXT,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    delivered_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status);
+CREATE TABLE IF NOT EXISTS events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS subscribers (
+    job_id TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (job_id, chat_id)
+);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    job_id TEXT,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+def _row(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    record = {col[0]: value for col, value in zip(cursor.description, row)}
+    for name in ("kwargs", "result"):
+        if record.get(name) is not None:
+            record[name] = json.loads(record[name])
+    return record
+
+
+class JobQueue:
+    """
+    Jobs, their progress messages and their subscribers in one SQLite database.
+
+    Args:
+        path (str): Database file (default: TGA_QUEUE_PATH).
+    """
+
+    def __init__(self, path: str = QUEUE_PATH):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _db(self, immediate: bool = False):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = _row
+        try:
+            if not self._initialized:
+                with self._init_lock:
+                    # WAL lets the bot read while a worker writes
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def enqueue(
+            self,
+            fn: str,
+            kwargs: Dict[str, Any],
+            dedup_key: Optional[str] = None,
+            subscriber: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[str, bool]:
+        """
+        Add a job, or attach to the queued or running job with the same `dedup_key`.
+
+        Args:
+            fn (str): "module:function" the worker calls as fn(**kwargs, job=..., progress=...).
+            kwargs (dict): JSON-serializable keyword arguments.
+            dedup_key (str, optional): Identity of the work, e.g. "chat:<id>".
+            subscriber (tuple, optional): (Telegram chat id, user id) to deliver the result to.
+
+        Returns:
+            tuple: (job id, True if a new job was created)
+        """
+        now = time.time()
+        with self._db(immediate=True) as conn:
+            existing = None
+            if dedup_key is not None:
+                existing = conn.execute(
+                    f"SELECT id FROM jobs WHERE dedup_key = ? AND status IN ({_ACTIVE_PLACEHOLDERS}) "
+                    f"ORDER BY created LIMIT 1",
+                    (dedup_key, *ACTIVE),
+                ).fetchone()
+            job_id = existing["id"] if existing else new_job_id()
+            if existing is None:
+                conn.execute(
+                    "INSERT INTO jobs (id, fn, kwargs, dedup_key, status, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, fn, json.dumps(kwargs, ensure_ascii=False), dedup_key, QUEUED, now, now),
+                )
+            if subscriber is not None:
+                conn.execute(
+                    "INSERT OR IGNORE INTO subscribers (job_id, chat_id, user_id) VALUES (?, ?, ?)",
+                    (job_id, *subscriber),
+                )
+        logging.info(f"📮 {'Queued' if existing is None else 'Attached to'} job {job_id} ({fn})")
+        return job_id, existing is None
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest queued job, or a running job whose lease expired.
+        Jobs out of attempts are marked failed instead.
+        """
+        now = time.time()
+        with self._db(immediate=True) as conn:
+            while True:
+                job = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? OR (status = ? AND heartbeat < ?) ORDER BY created LIMIT 1",
+                    (QUEUED, RUNNING, now - LEASE_SECONDS),
+                ).fetchone()
+                if job is None:
+                    return None
+                if job["attempts"] >= MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                        (FAILED, f"gave up after {job['attempts']} attempts", now, job["id"]),
+                    )
+                    logging.error(f"❌ Job {job['id']} failed: gave up after {job['attempts']} attempts")
+                    continue
+                if job["status"] == RUNNING:
+                    logging.warning(f"⚠️ Job {job['id']} lost its worker {job['worker']}, resuming it")
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, heartbeat = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE id = ?",
+                    (RUNNING, worker_id, now, now, job["id"]),
+                )
+                job.update(status=RUNNING, worker=worker_id, attempts=job["attempts"] + 1)
+                return job
+
+    def heartbeat(self, worker_id: str, job_id: Optional[str] = None) -> None:
+        """Renew the lease of the worker's job and record that the worker is alive."""
+        now = time.time()
+        with self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (id, host, pid, job_id, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                (worker_id, socket.gethostname(), os.getpid(), job_id, now),
+            )
+            if job_id is not None:
+                conn.execute(
+                    "UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND status = ?",
+                    (now, job_id, worker_id, RUNNING),
+                )
+
+    def remove_worker(self, worker_id: str) -> None:
+        with self._db() as conn:
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def add_event(self, job_id: str, text: str) -> None:
+        """Record a progress message of a job."""
+        with self._db(immediate=True) as conn:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 AS seq FROM events WHERE job_id = ?",
+                               (job_id,)).fetchone()["seq"]
+            conn.execute("INSERT INTO events (job_id, seq, text, created) VALUES (?, ?, ?, ?)",
+                         (job_id, seq, text, time.time()))
+
+    def _complete(self, job_id: str, worker_id: Optional[str], column: str, status: str, value: Any) -> bool:
+        with self._db() as conn:
+            updated = conn.execute(
+                f"UPDATE jobs SET status = ?, {column} = ?, updated = ? "
+                f"WHERE id = ? AND status = ? AND (? IS NULL OR worker = ?)",
+                (status, value, time.time(), job_id, RUNNING, worker_id, worker_id),
+            ).rowcount
+        if not updated:
+            logging.warning(f"⚠️ Job {job_id} is no longer held by worker {worker_id}, its outcome was dropped")
+        return bool(updated)
+
+    def finish(self, job_id: str, result: Any, worker_id: Optional[str] = None) -> bool:
+        """
+        Mark a running job done.
+
+        Returns:
+            bool: False if the worker lost the job in the meantime (its lease was taken over or
+            the job already ended); the result is then dropped instead of overwriting the new owner's.
+        """
+        return self._complete(job_id, worker_id, "result", DONE, json.dumps(result, ensure_ascii=False, default=str))
+
+    def fail(self, job_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        """Mark a running job failed; returns False like `finish` when the worker lost the job."""
+        return self._complete(job_id, worker_id, "error", FAILED, error)
+
+    def prune(self, older_than: float = RETENTION_HOURS * 3600) -> int:
+        """
+        Remove delivered jobs that ended more than `older_than` seconds ago, with their
+        progress messages and subscribers, and workers silent for as long.
+
+        Returns:
+            int: Number of jobs removed.
+        """
+        cutoff = time.time() - older_than
+        with self._db(immediate=True) as conn:
+            stale = "SELECT id FROM jobs WHERE status IN (?, ?) AND delivered = 1 AND updated < ?"
+            params = (DONE, FAILED, cutoff)
+            conn.execute(f"DELETE FROM events WHERE job_id IN ({stale})", params)
+            conn.execute(f"DELETE FROM subscribers WHERE job_id IN ({stale})", params)
+            removed = conn.execute(f"DELETE FROM jobs WHERE id IN ({stale})", params).rowcount
+            conn.execute("DELETE FROM workers WHERE heartbeat < ?", (cutoff,))
+        if removed:
+            logging.info(f"🧹 Pruned {removed} finished jobs from {self.path}")
+        return removed
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._db() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def active_job(self, dedup_key: str) -> Optional[str]:
+        """Id of the queued or running job with `dedup_key`, if any."""
+        with self._db() as conn:
+            row = conn.execute(
+                f"SELECT id FROM jobs WHERE dedup_key = ? AND status IN ({_ACTIVE_PLACEHOLDERS}) "
+                f"ORDER BY created LIMIT 1",
+                (dedup_key, *ACTIVE),
+            ).fetchone()
+        return row["id"] if row else None
+
+    def progress(self, job_id: str) -> Dict[str, Any]:
+        """
+        Where a job stands: its "status", "position" (1-based place in the queue, 0 once it runs
+        or finished), "waiting" (subscribed users), "last_event" (latest progress message, if any)
+        and "age" (seconds since it was queued).
+        """
+        with self._db() as conn:
+            job = conn.execute("SELECT status, created FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return {"status": None, "position": 0, "waiting": 0, "last_event": None, "age": 0.0}
+            position = 0
+            if job["status"] == QUEUED:
+                position = conn.execute(
+                    "SELECT COUNT(*) AS n FROM jobs WHERE status = ? AND created <= ?", (QUEUED, job["created"])
+                ).fetchone()["n"]
+            waiting = conn.execute("SELECT COUNT(*) AS n FROM subscribers WHERE job_id = ?", (job_id,)).fetchone()["n"]
+            last_event = conn.execute(
+                "SELECT text FROM events WHERE job_id = ? ORDER BY seq DESC LIMIT 1", (job_id,)
+            ).fetchone()
+        return {
+            "status": job["status"],
+            "position": position,
+            "waiting": waiting,
+            "last_event": last_event["text"] if last_event else None,
+            "age": time.time() - job["created"],
+        }
+
+    def depth(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._db() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def active_jobs(self, user_id: int) -> int:
+        """Queued or running jobs a user is subscribed to."""
+        with self._db() as conn:
+            return conn.execute(
+                f"SELECT COUNT(DISTINCT jobs.id) AS n FROM jobs JOIN subscribers ON subscribers.job_id = jobs.id "
+                f"WHERE subscribers.user_id = ? AND jobs.status IN ({_ACTIVE_PLACEHOLDERS})",
+                (user_id, *ACTIVE),
+            ).fetchone()["n"]
+
+    def live_workers(self, max_age: float = LEASE_SECONDS) -> int:
+        """Workers that sent a heartbeat in the last `max_age` seconds."""
+        with self._db() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) AS n FROM workers WHERE heartbeat >= ?", (time.time() - max_age,)
+            ).fetchone()["n"]
+
+    def undelivered(self) -> List[Dict[str, Any]]:
+        """Jobs with progress messages or a final outcome not yet delivered to their subscribers."""
+        with self._db() as conn:
+            jobs = conn.execute(
+                "SELECT * FROM jobs WHERE delivered = 0 AND (status IN (?, ?) OR EXISTS ("
+                "SELECT 1 FROM events WHERE events.job_id = jobs.id AND events.seq > jobs.delivered_seq))",
+                (DONE, FAILED),
+            ).fetchall()
+            for job in jobs:
+                job["events"] = conn.execute(
+                    "SELECT seq, text FROM events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                    (job["id"], job["delivered_seq"]),
+                ).fetchall()
+                job["subscribers"] = conn.execute(
+                    "SELECT chat_id, user_id FROM subscribers WHERE job_id = ?", (job["id"],)
+                ).fetchall()
+        return jobs
+
+    def mark_delivered(self, job_id: str, seq: Optional[int] = None, final: bool = False) -> None:
+        """Record that progress messages up to `seq` (and with `final`, the outcome) were delivered."""
+        with self._db() as conn:
+            if seq is not None:
+                conn.execute("UPDATE jobs SET delivered_seq = MAX(delivered_seq, ?) WHERE id = ?", (seq, job_id))
+            if final:
+                conn.execute("UPDATE jobs SET delivered = 1 WHERE id = ?", (job_id,))
@@ -0,0 +1,258 @@
+"""
+Stage instrumentation: wall time, CPU time, memory and item counts of analysis steps.
+
+Every measured step of a job is collected in a `JobMetrics` and written to metrics.json
+in the job workspace:
+
+    metrics = JobMetrics(job.job_id)
+    with metrics.stage("load") as record:
+        corpus = MessageCorpus.load(path)
+        record["items"] = len(corpus)
+    metrics.write(job.path(METRICS_FILE))
+
+- wall_seconds / cpu_seconds: elapsed time and CPU time of the thread running the step
+  (work the step hands to other processes or native thread pools is not in cpu_seconds)
+- peak_rss_mb: highest current RSS of the process sampled while the step ran (every
+  TGA_METRICS_RSS_INTERVAL seconds, from /proc/self/statm), rss_growth_mb how far it rose
+  above the RSS at the start of the step. Steps running in parallel share one process, so
+  their peaks include each other's memory.
+- process_peak_rss_mb: high-water mark of the process RSS over its whole life (ru_maxrss)
+  when the step ended; in long-lived workers this reflects earlier jobs too
+- traced_peak_mb: peak Python allocations during the step (tracemalloc), only with
+  TGA_METRICS_TRACEMALLOC=1 because tracing slows allocations down. Stages running in
+  parallel share one peak.
+
+The module also renders metrics in the Prometheus text format (`Histogram`,
+`format_metric`), used by the bot's /metrics endpoint.
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+METRICS_FILE = "metrics.json"
+TRACEMALLOC = os.getenv("TGA_METRICS_TRACEMALLOC", "0") == "1"
+RSS_SAMPLE_SECONDS = float(os.getenv("TGA_METRICS_RSS_INTERVAL", "0.1"))
+
+# Stage latencies from sub-second cache restores to long clustering runs
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def process_peak_rss_mb() -> Optional[float]:
+    """High-water mark of this process' resident memory over its life in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def current_rss_mb() -> Optional[float]:
+    """Current resident memory of this process in MB (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+class _RssSampler:
+    """Highest current RSS seen between construction and `stop`, sampled by a daemon thread."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS):
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self._stopped = threading.Event()
+        self._thread = None
+        if self.start_mb is not None and interval > 0:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="rss-sampler", daemon=True)
+            self._thread.start()
+
+    def _sample(self) -> None:
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self._sample()
+
+    def stop(self) -> Optional[float]:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+        return self.peak_mb
+
+
+@contextmanager
+def measure(name: str, items: Optional[int] = None):
+    """
+    Measure the enclosed block; yields the record, whose "items" the block may set.
+
+    Returns (via the yielded dict): name, items, wall_seconds, cpu_seconds, peak_rss_mb,
+    rss_growth_mb, process_peak_rss_mb and traced_peak_mb.
+    """
+    record: Dict[str, Any] = {"name": name, "items": items}
+    sampler = _RssSampler()
+    traced = TRACEMALLOC and tracemalloc.is_tracing()
+    if traced:
+        tracemalloc.reset_peak()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = time.perf_counter() - wall_start
+        record["cpu_seconds"] = time.thread_time() - cpu_start
+        peak = sampler.stop()
+        record["peak_rss_mb"] = peak
+        record["rss_growth_mb"] = peak - sampler.start_mb if peak is not None else None
+        record["process_peak_rss_mb"] = process_peak_rss_mb()
+        record["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20 if traced else None
+
+
+class JobMetrics:
+    """
+    Measurements of the steps of one job, safe to fill from parallel stage threads.
+
+    Args:
+        job_id (str, optional): Id of the job, written to metrics.json.
+    """
+
+    def __init__(self, job_id: Optional[str] = None):
+        self.job_id = job_id
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        if TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, items: Optional[int] = None):
+        """Measure a step and record it under `name`; yields the record (see `measure`)."""
+        record = None
+        try:
+            with measure(name, items) as record:
+                yield record
+        finally:
+            if record is not None:
+                self.add(record)
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """Record a measurement, merging it into the values already recorded for the same step."""
+        values = {k: v for k, v in record.items() if k != "name"}
+        with self._lock:
+            self.stages.setdefault(record["name"], {}).update(values)
+
+    def record(self, name: str, **values: Any) -> None:
+        """Set extra values of a step, e.g. its status."""
+        with self._lock:
+            self.stages.setdefault(name, {}).update(values)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "wall_seconds": time.perf_counter() - self._started,
+            "cpu_seconds": time.process_time() - self._cpu_started,
+            "process_peak_rss_mb": process_peak_rss_mb(),
+            "stages": dict(self.stages),
+        }
+
+    def write(self, path: str) -> Dict[str, Any]:
+        """Write the summary to `path` (metrics.json of the job) and return it."""
+        summary = self.summary()
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logging.warning(f"⚠️ Could not write metrics to {path}: {e}")
+        return summary
+
+
+def load_metrics(path: str) -> Optional[Dict[str, Any]]:
+    """The metrics.json of a job workspace (a directory or the file itself), or None."""
+    if os.path.isdir(path):
+        path = os.path.join(path, METRICS_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: Iterable[Tuple[str, Any]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def format_metric(name: str, kind: str, help_text: str, samples: Dict[Tuple, float],
+                  labelnames: Sequence[str] = ()) -> str:
+    """
+    One metric family in the Prometheus text format.
+
+    Args:
+        name (str): Metric name.
+        kind (str): "counter" or "gauge".
+        help_text (str): HELP line.
+        samples (dict): Label values (a tuple matching `labelnames`) -> value.
+        labelnames (Sequence[str]): Label names.
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for values, value in samples.items():
+        lines.append(f"{name}{_labels(labelnames, values)} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+class Histogram:
+    """
+    A Prometheus histogram with fixed buckets, per combination of label values.
+
+    Args:
+        name (str): Metric name.
+        help_text (str): HELP line.
+        labelnames (Sequence[str]): Label names.
+        buckets (Sequence[float]): Upper bounds of the buckets (+Inf is added).
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: Any) -> None:
+        with self._lock:
+            series = self._series.setdefault(labelvalues, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, [('le', le)])} {cumulative}")
+                labels = _labels(self.labelnames, values)
+                lines.append(f"{self.name}_sum{labels} {float(total)!r}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,163 @@
+"""
+Process-wide registry of embedding models.
+
+Each SentenceTransformer is loaded once per process and shared by every analysis.
+Models can be pre-loaded at startup with `warm_up()` and are optionally evicted
+after a period without use (TGA_MODEL_IDLE_TIMEOUT, in seconds; 0 disables eviction).
+"""
+
+import os
+import gc
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+DEFAULT_EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+IDLE_TIMEOUT = float(os.getenv("TGA_MODEL_IDLE_TIMEOUT", "0"))
+
+
+def _current_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB, or None if it cannot be determined."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _load_sentence_transformer(name: str) -> Any:
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+class ModelRegistry:
+    """
+    Thread-safe cache of loaded models keyed by model name.
+
+    Args:
+        loader (Callable): Function that loads a model by name.
+        idle_timeout (float): Seconds without use after which a model is evicted (0 disables).
+    """
+
+    def __init__(self, loader: Callable[[str], Any] = _load_sentence_transformer, idle_timeout: float = IDLE_TIMEOUT):
+        self._loader = loader
+        self.idle_timeout = idle_timeout
+        self._models: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._reaper: Optional[threading.Thread] = None
+
+    def get(self, name: str = DEFAULT_EMBEDDING_MODEL) -> Any:
+        """Return the model `name`, loading it on first use."""
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                entry["last_used"] = time.monotonic()
+                return entry["model"]
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Load outside the registry lock so other models stay available meanwhile
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(name)
+                if entry is not None:
+                    entry["last_used"] = time.monotonic()
+                    return entry["model"]
+
+            rss_before = _current_rss_mb()
+            started = time.perf_counter()
+            model = self._loader(name)
+            load_seconds = time.perf_counter() - started
+            rss_after = _current_rss_mb()
+            rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+
+            with self._lock:
+                self._models[name] = {
+                    "model": model,
+                    "load_seconds": load_seconds,
+                    "rss_delta_mb": rss_delta,
+                    "last_used": time.monotonic(),
+                }
+            memory = f"{rss_delta:+.0f} MB RSS" if rss_delta is not None else "RSS unknown"
+            logging.info(f"🧠 Loaded model {name} in {load_seconds:.2f}s ({memory})")
+            self._start_reaper()
+            return model
+
+    def warm_up(self, names: Iterable[str] = (DEFAULT_EMBEDDING_MODEL,)) -> None:
+        """Load the given models ahead of the first request."""
+        for name in names:
+            self.get(name)
+
+    def evict(self, name: str) -> bool:
+        """Drop model `name` from the registry. Returns True if it was loaded."""
+        with self._lock:
+            entry = self._models.pop(name, None)
+        if entry is None:
+            return False
+        del entry
+        gc.collect()
+        logging.info(f"♻️ Evicted model {name}")
+        return True
+
+    def evict_idle(self) -> int:
+        """Evict every model unused for longer than `idle_timeout`. Returns the number evicted."""
+        if self.idle_timeout <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            idle = [n for n, e in self._models.items() if now - e["last_used"] > self.idle_timeout]
+        return sum(self.evict(name) for name in idle)
+
+    def stats(self) -> Dict[str, dict]:
+        """Load time, memory delta and idle time for every loaded model."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "load_seconds": round(e["load_seconds"], 3),
+                    "rss_delta_mb": round(e["rss_delta_mb"], 1) if e["rss_delta_mb"] is not None else None,
+                    "idle_seconds": round(now - e["last_used"], 1),
+                }
+                for name, e in self._models.items()
+            }
+
+    def _start_reaper(self) -> None:
+        if self.idle_timeout <= 0 or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        self._reaper = threading.Thread(target=self._reap_forever, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        interval = max(1.0, min(self.idle_timeout / 2, 60.0))
+        while True:
+            time.sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logging.error(f"❌ Model eviction failed: {e}")
+            with self._lock:
+                if not self._models:
+                    self._reaper = None
+                    return
+
+
+registry = ModelRegistry()
+
+
+def get_embedding_model(name: str = DEFAULT_EMBEDDING_MODEL) -> Any:
+    """Shared SentenceTransformer instance for `name`."""
+    return registry.get(name)
+
+
+def warm_up(names: Iterable[str] = (DEFAULT_EMBEDDING_MODEL,)) -> Dict[str, dict]:
+    """Pre-load embedding models and return their load statistics."""
+    registry.warm_up(names)
+    return registry.stats()
@@ -0,0 +1,424 @@
+"""
+Declarative analysis pipeline.
+
+The analysis is a graph of stages:
+
+    load → frequency / message_activity / user_activity / topics / embed
+         → cluster → summarize → report → gpt
+
+Every stage's outputs are cached under <data dir>/cache/stages, keyed by a hash of the
+corpus content, the stage parameters and the keys of the stages it depends on. A re-run
+with unchanged inputs copies the cached files into the new job workspace instead of
+recomputing them. Stages whose dependencies are finished run in parallel threads.
+
+Wall time, CPU time, memory and input size of every stage are written to metrics.json
+(see tg_analyst/metrics.py). Finished stages are also recorded in checkpoint.json in the job workspace. Running the
+pipeline again in the same workspace (a queued job resumed after a worker crash) skips
+the stages whose key is unchanged and whose outputs are still there.
+
+- TGA_STAGE_CACHE: "0" to disable the stage cache
+- TGA_STAGE_CACHE_DIR: cache location
+- TGA_STAGE_CACHE_MAX_MB / TGA_STAGE_CACHE_MAX_AGE_HOURS: retention of cache entries
+- TGA_PIPELINE_WORKERS: stages run at the same time
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import importlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from tg_analyst.job import JobContext, cleanup_workspaces
+from tg_analyst.metrics import METRICS_FILE, JobMetrics
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+)
+
+STAGE_CACHE_ENABLED = os.getenv("TGA_STAGE_CACHE", "1") == "1"
+STAGE_CACHE_DIR = os.getenv("TGA_STAGE_CACHE_DIR", os.path.join(BASE_DIR, "cache", "stages"))
+STAGE_CACHE_MAX_MB = float(os.getenv("TGA_STAGE_CACHE_MAX_MB", "512"))
+STAGE_CACHE_MAX_AGE_HOURS = float(os.getenv("TGA_STAGE_CACHE_MAX_AGE_HOURS", "168"))
+PIPELINE_WORKERS = int(os.getenv("TGA_PIPELINE_WORKERS", "4"))
+
+MIN_MESSAGES_FOR_FULL_ANALYSIS = 10
+
+
+@dataclass
+class Stage:
+    """
+    One node of the analysis graph.
+
+    Attributes:
+        name (str): Unique stage name.
+        fn (str): "module:function" to call, imported when the stage runs.
+        deps (tuple): Names of the stages that must finish first.
+        params (dict): Keyword arguments for `fn`; part of the cache key.
+        outputs (tuple): Files in the job workspace the stage must produce to be cached.
+        optional_outputs (tuple): Files that are cached when present.
+        uses_corpus (bool): Call `fn(corpus, job=job, ...)` instead of `fn(job=job, ...)`.
+        cache (bool): Cache the outputs (off for stages whose results live elsewhere).
+        min_messages (int): Skip the stage for corpora with fewer messages.
+        label (str): Progress line shown when the stage starts.
+        version (str): Bump to invalidate cached results after changing the stage.
+        cache_if (Callable[[JobContext], bool]): Extra check before caching the outputs.
+    """
+    name: str
+    fn: str
+    deps: Tuple[str, ...] = ()
+    params: Dict[str, Any] = field(default_factory=dict)
+    outputs: Tuple[str, ...] = ()
+    optional_outputs: Tuple[str, ...] = ()
+    uses_corpus: bool = True
+    cache: bool = True
+    min_messages: int = 0
+    label: Optional[str] = None
+    version: str = "1"
+    cache_if: Optional[Callable[[JobContext], bool]] = None
+
+
+@dataclass
+class StageResult:
+    """Outcome of one stage: "done", "cached", "resumed" (from the job's checkpoint), "skipped" or "failed"."""
+    name: str
+    status: str
+    seconds: float = 0.0
+    key: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("done", "cached", "resumed")
+
+
+def _gpt_succeeded(job: JobContext) -> bool:
+    # A failed request still writes a placeholder; it must not be served from the cache
+    with open(job.path("final_analysis_gpt.txt"), "r", encoding="utf-8") as f:
+        return not f.read().startswith("⚠️")
+
+
+def build_stages(
+        engine: Optional[str] = None,
+        incremental: Optional[bool] = None,
+        reduction: Optional[str] = None,
+        lemmatize: Optional[bool] = None,
+        topic_mode: Optional[str] = None,
+        n_topics: int = 10,
+        n_words: int = 10,
+        use_gpt: bool = True,
+        min_messages: int = MIN_MESSAGES_FOR_FULL_ANALYSIS,
+        chart_profile: Optional[str] = None,
+) -> List[Stage]:
+    """
+    The standard analysis graph.
+
+    Settings left as None are resolved from their environment defaults here, so that they
+    become part of the cache keys.
+    """
+    from tg_analyst.utils.lemmatizer import LEMMATIZE_DEFAULT
+    from tg_analyst.utils.reduction import REDUCTION_MODE
+    from tg_analyst.utils.cluster_model import INCREMENTAL_DEFAULT
+    from tg_analyst.utils.stages.clustering import CLUSTER_ENGINE
+    from tg_analyst.utils.stages.topics import TOPIC_MODE
+    from tg_analyst.utils.rendering import CHART_PROFILE
+
+    lemmatize = LEMMATIZE_DEFAULT if lemmatize is None else lemmatize
+    reduction = reduction or REDUCTION_MODE
+    engine = engine or CLUSTER_ENGINE
+    incremental = INCREMENTAL_DEFAULT if incremental is None else incremental
+    chart_profile = chart_profile or CHART_PROFILE
+
+    stages = [
+        Stage("frequency", "tg_analyst.utils.stages.frequency:analyze_messages",
+              params={"lemmatize": lemmatize, "chart_profile": chart_profile},
+              outputs=("word_frequency.csv",), optional_outputs=("word_bigrams.csv", "top_words.png"),
+              label="🔍 Analyzing word frequency..."),
+        Stage("message_activity", "tg_analyst.utils.stages.activity:plot_message_activity",
+              params={"chart_profile": chart_profile},
+              outputs=("message_activity.png",), label="📊 Plotting activity charts..."),
+        Stage("user_activity", "tg_analyst.utils.stages.activity:plot_user_activity",
+              params={"chart_profile": chart_profile}, outputs=("user_activity.png",)),
+        Stage("topics", "tg_analyst.utils.stages.topics:topic_modeling_nmf",
+              params={"n_topics": n_topics, "n_words": n_words, "lemmatize": lemmatize,
+                      "mode": topic_mode or TOPIC_MODE},
+              outputs=("nmf_topics.txt",), min_messages=min_messages, label="🧠 Extracting topics..."),
+        # Embeddings are cached by the embedding store itself
+        Stage("embed", "tg_analyst.utils.stages.clustering:embed_messages",
+              params={"reduction": reduction, "engine": engine, "incremental": incremental},
+              cache=False, min_messages=min_messages, label="🧩 Embedding messages..."),
+        Stage("cluster", "tg_analyst.utils.stages.clustering:cluster_with_embeddings", deps=("embed",),
+              params={"engine": engine, "incremental": incremental,
+                      "reduction": reduction, "chart_profile": chart_profile},
+              outputs=("hdbscan_clusters.csv",), optional_outputs=("hdbscan_umap.png",),
+              min_messages=min_messages, label="🧩 Clustering messages..."),
+        Stage("summarize", "tg_analyst.utils.cluster_utils:summarize_clusters", deps=("cluster",),
+              outputs=("cluster_summaries.txt",), uses_corpus=False, min_messages=min_messages),
+        Stage("report", "tg_analyst.report_generator:generate_report",
+              deps=("frequency", "message_activity", "user_activity", "topics", "cluster"),
+              outputs=("report.md",), uses_corpus=False, label="📝 Writing the report..."),
+    ]
+    if use_gpt:
+        stages.append(
+            Stage("gpt", "tg_analyst.gpt_summary:main", deps=("report", "summarize"),
+                  outputs=("final_analysis_gpt.txt",), uses_corpus=False, cache_if=_gpt_succeeded)
+        )
+    return stages
+
+
+def _resolve(target: str) -> Callable:
+    module, _, name = target.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def stage_key(stage: Stage, corpus_digest: str, dep_keys: Sequence[str]) -> str:
+    """Cache key of a stage: its identity, parameters, input corpus and upstream results."""
+    payload = json.dumps(
+        {
+            "stage": stage.name,
+            "fn": stage.fn,
+            "version": stage.version,
+            "params": stage.params,
+            "corpus": corpus_digest if stage.uses_corpus else None,
+            "deps": list(dep_keys),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """Output files of finished stages, one directory per cache key."""
+
+    def __init__(self, root: str = STAGE_CACHE_DIR):
+        self.root = root
+
+    def _entry(self, stage: Stage, key: str) -> str:
+        return os.path.join(self.root, f"{stage.name}_{key[:24]}")
+
+    def restore(self, stage: Stage, key: str, job: JobContext) -> bool:
+        """Copy cached outputs into the job workspace; False on a cache miss."""
+        entry = self._entry(stage, key)
+        manifest_path = os.path.join(entry, "manifest.json")
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("key") != key:
+                return False
+            for name in manifest["files"]:
+                shutil.copy2(os.path.join(entry, name), job.path(name))
+            # Keeps recently used entries ahead of the retention policy
+            os.utime(entry)
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def store(self, stage: Stage, key: str, job: JobContext, seconds: float) -> None:
+        """Save the stage outputs present in the job workspace."""
+        entry = self._entry(stage, key)
+        if os.path.exists(entry):
+            return
+        files = [name for name in stage.outputs + stage.optional_outputs if os.path.exists(job.path(name))]
+        tmp_entry = f"{entry}.{job.job_id}.tmp"
+        try:
+            os.makedirs(tmp_entry, exist_ok=True)
+            for name in files:
+                shutil.copy2(job.path(name), os.path.join(tmp_entry, name))
+            with open(os.path.join(tmp_entry, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump({"stage": stage.name, "key": key, "files": files, "seconds": seconds}, f)
+            os.replace(tmp_entry, entry)
+        except OSError as e:
+            # Another run may have stored the same entry first
+            logging.warning(f"⚠️ Could not cache outputs of stage {stage.name}: {e}")
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+
+def _run_stage(stage: Stage, corpus, job: JobContext) -> None:
+    fn = _resolve(stage.fn)
+    args = (corpus,) if stage.uses_corpus else ()
+    fn(*args, job=job, **stage.params)
+
+
+def _execute(stage: Stage, key: str, corpus, job: JobContext, cache: Optional[StageCache]) -> StageResult:
+    if len(corpus.messages) < stage.min_messages:
+        logging.info(f"⏭️ Stage {stage.name} skipped: fewer than {stage.min_messages} messages")
+        return StageResult(stage.name, "skipped", key=key)
+
+    start = time.perf_counter()
+    if cache is not None and stage.cache and cache.restore(stage, key, job):
+        seconds = time.perf_counter() - start
+        logging.info(f"📦 Stage {stage.name} restored from cache in {seconds:.2f}s")
+        return StageResult(stage.name, "cached", seconds, key)
+
+    try:
+        _run_stage(stage, corpus, job)
+    except Exception as e:
+        logging.exception(f"❌ Stage {stage.name} failed:")
+        return StageResult(stage.name, "failed", time.perf_counter() - start, key, str(e))
+    seconds = time.perf_counter() - start
+
+    # Stage functions log their own errors and return; missing outputs mean they did not finish
+    missing = [name for name in stage.outputs if not os.path.exists(job.path(name))]
+    if missing:
+        logging.warning(f"⚠️ Stage {stage.name} produced no {', '.join(missing)}")
+        return StageResult(stage.name, "failed", seconds, key, f"missing {', '.join(missing)}")
+
+    if cache is not None and stage.cache and (stage.cache_if is None or stage.cache_if(job)):
+        cache.store(stage, key, job, seconds)
+    logging.info(f"✅ Stage {stage.name} finished in {seconds:.2f}s")
+    return StageResult(stage.name, "done", seconds, key)
+
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def _load_checkpoint(job: JobContext) -> Dict[str, Dict[str, str]]:
+    try:
+        with open(job.path(CHECKPOINT_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_checkpoint(job: JobContext, checkpoint: Dict[str, Dict[str, str]]) -> None:
+    # Write-then-rename: a crash mid-write leaves the previous checkpoint intact
+    tmp_path = job.path(f"{CHECKPOINT_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, job.path(CHECKPOINT_FILE))
+
+
+def _resumable(stage: Stage, key: str, entry: Optional[Dict[str, str]], job: JobContext) -> bool:
+    if not entry or entry.get("key") != key or entry.get("status") not in ("done", "cached", "resumed"):
+        return False
+    return all(os.path.exists(job.path(name)) for name in stage.outputs)
+
+
+def _execute_measured(stage: Stage, key: str, corpus, job: JobContext, cache: Optional[StageCache],
+                      metrics: JobMetrics) -> StageResult:
+    items = len(corpus.messages) if stage.uses_corpus else None
+    with metrics.stage(stage.name, items):
+        result = _execute(stage, key, corpus, job, cache)
+    metrics.record(stage.name, status=result.status)
+    return result
+
+
+def _check_graph(stages: Sequence[Stage]) -> None:
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Stage names must be unique")
+    known = set(names)
+    for stage in stages:
+        unknown = set(stage.deps) - known
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(sorted(unknown))}")
+
+
+def run_pipeline(
+        corpus,
+        job: JobContext,
+        stages: Optional[Sequence[Stage]] = None,
+        progress: Optional[Callable[[str], None]] = None,
+        use_cache: bool = STAGE_CACHE_ENABLED,
+        max_workers: int = PIPELINE_WORKERS,
+        resume: bool = True,
+        metrics: Optional[JobMetrics] = None,
+) -> Dict[str, StageResult]:
+    """
+    Run the stage graph over a loaded corpus, writing all outputs into `job`'s workspace.
+
+    A failing stage does not stop the run: its dependents still run and handle the
+    missing files like they do when a step has nothing to report. The outcome and
+    timing of every stage is written to pipeline.json in the workspace, and each
+    finished stage to checkpoint.json.
+
+    Args:
+        corpus (MessageCorpus): The loaded messages.
+        job (JobContext): Workspace of this run.
+        stages (Sequence[Stage], optional): The graph (default: `build_stages()`).
+        progress (Callable[[str], None], optional): Called with a stage's label when it starts.
+        use_cache (bool): Restore and store stage outputs in the stage cache.
+        max_workers (int): Stages run at the same time.
+        resume (bool): Keep the outputs of stages the workspace's checkpoint records as finished.
+        metrics (JobMetrics, optional): Collects the stage measurements, e.g. with the loading
+            step measured by the caller (default: a new one). Written to metrics.json.
+
+    Returns:
+        Dict[str, StageResult]: Outcome of every stage, by name.
+    """
+    stages = list(stages) if stages is not None else build_stages()
+    _check_graph(stages)
+    by_name = {s.name: s for s in stages}
+
+    cache = None
+    if use_cache:
+        cleanup_workspaces(STAGE_CACHE_DIR, STAGE_CACHE_MAX_AGE_HOURS, STAGE_CACHE_MAX_MB)
+        cache = StageCache()
+
+    digest = corpus.digest()
+    checkpoint = _load_checkpoint(job) if resume else {}
+    metrics = metrics if metrics is not None else JobMetrics(job.job_id)
+    results: Dict[str, StageResult] = {}
+    pending = dict(by_name)
+    running = {}
+    started = time.perf_counter()
+
+    def report(stage: Stage):
+        if progress is not None and stage.label:
+            try:
+                progress(stage.label)
+            except Exception as e:
+                logging.warning(f"⚠️ Progress callback failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="stage") as pool:
+        while pending or running:
+            scheduled = True
+            while scheduled:
+                scheduled = False
+                for name, stage in list(pending.items()):
+                    if not all(dep in results for dep in stage.deps):
+                        continue
+                    # Upstream failures change the key: the stage sees different inputs
+                    dep_keys = [f"{dep}:{results[dep].key}:{results[dep].ok}" for dep in stage.deps]
+                    key = stage_key(stage, digest, dep_keys)
+                    del pending[name]
+                    scheduled = True
+                    if resume and _resumable(stage, key, checkpoint.get(name), job):
+                        logging.info(f"⏩ Stage {name} already finished in this job, resuming after it")
+                        results[name] = StageResult(name, "resumed", key=key)
+                        metrics.record(name, status="resumed", wall_seconds=0.0)
+                        continue
+                    report(stage)
+                    running[pool.submit(_execute_measured, stage, key, corpus, job, cache, metrics)] = name
+
+            if not running and not pending:
+                break
+            if not running:
+                raise ValueError(f"Stage graph has a cycle: {', '.join(sorted(pending))}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[result.name] = result
+                del running[future]
+                checkpoint[result.name] = {"key": result.key, "status": result.status}
+                _save_checkpoint(job, checkpoint)
+
+    total = time.perf_counter() - started
+    summary = {
+        "job_id": job.job_id,
+        "seconds": total,
+        "stages": {name: vars(result) for name, result in results.items()},
+    }
+    with open(job.path("pipeline.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    metrics.write(job.path(METRICS_FILE))
+
+    statuses = ", ".join(f"{r.name}={r.status}" for r in results.values())
+    logging.info(f"🏁 Pipeline finished in {total:.2f}s: {statuses}")
+    return results
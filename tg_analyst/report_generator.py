@@ -1,7 +1,7 @@
 import os
 import logging
 
-def generate_report(results_dir: str):
+def generate_report(results_dir: str = None, job=None):
     """
     Generates a Markdown report summarizing the Telegram chat analysis.
     Includes: word frequency chart, NMF topics, cluster map, message activity chart, and user activity chart.
@@ -9,7 +9,13 @@ def generate_report(results_dir: str):
 
     Args:
         results_dir (str): Path to the results directory where charts and topic files are stored.
+        job (JobContext, optional): Job whose workspace is used when results_dir is not given.
     """
+    if results_dir is None:
+        if job is None:
+            raise ValueError("Either results_dir or job must be given")
+        results_dir = job.output_dir
+
     os.makedirs(results_dir, exist_ok=True)
     report_path = os.path.join(results_dir, "report.md")
     topic_path = os.path.join(results_dir, "nmf_topics.txt")
@@ -1,6 +1,5 @@
 import sys
 import os
-import json
 import logging
 
 # === Base dir setup ===
@@ -9,31 +8,11 @@ sys.path.append(BASE_DIR)
 
 # === Import modules ===
 from tg_analyst.utils.downloader import download_messages
-from tg_analyst.utils.analyzer import (
-    analyze_messages, plot_message_activity,
-    cluster_with_embeddings, topic_modeling_nmf, plot_user_activity
-)
-from tg_analyst.utils.cluster_utils import summarize_clusters
-from tg_analyst.report_generator import generate_report
-from tg_analyst.gpt_summary import main as gpt_summary_main
-
-# === Logging setup ===
-log_dir = os.path.join(BASE_DIR, 'tg_analyst', 'logs')
-os.makedirs(log_dir, exist_ok=True)
-log_path = os.path.join(log_dir, 'analysis.log')
-
-for handler in logging.root.handlers[:]:
-    logging.root.removeHandler(handler)
-
-logging.basicConfig(
-    filename=log_path,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    encoding='utf-8',
-    filemode='w',
-)
-
-logging.info("🚀 Starting Telegram Chat Analysis Pipeline...")
+from tg_analyst.utils.corpus import MessageCorpus
+from tg_analyst.utils.message_store import ChatMessageStore
+from tg_analyst.pipeline import build_stages, run_pipeline
+from tg_analyst.job import JobContext, cleanup_workspaces
+from tg_analyst.metrics import JobMetrics
 
 # === Config ===
 MIN_MESSAGES_FOR_FULL_ANALYSIS = 10
@@ -42,99 +21,108 @@ LIMIT_MESSAGES = 500
 # === Config flags ===
 USE_GPT = False  # True for using GPT
 USE_EXISTING_JSON = False  # True — use downloaded file, False — download new
+CLUSTER_ENGINE = "hdbscan"  # "hdbscan", "graph" (kNN graph) or "sample" (fit on sample, assign rest)
+CLUSTER_INCREMENTAL = True  # True — assign new messages to the saved clusters, False — refit every run
+REDUCTION_MODE = "umap"  # "umap", "pca" (fast preview) or "none" (cluster raw embeddings)
 EXISTING_JSON_PATH = os.path.join(BASE_DIR, "model_lab", "messages.json")
 
-# === Step 1: Load or download messages ===
-if USE_EXISTING_JSON and os.path.exists(EXISTING_JSON_PATH):
-    json_path = EXISTING_JSON_PATH
-    print(f"📁 Using existing file: {json_path}")
-    logging.info(f"Using existing message file: {json_path}")
-else:
-    json_path = download_messages(limit=LIMIT_MESSAGES)
-
-if not json_path or not os.path.exists(json_path):
-    logging.warning("⚠️ No messages downloaded or file not found. Exiting.")
-    print("⚠️ No messages downloaded. Exiting.")
-    exit(0)
-
-# === Step 2: Load and validate JSON ===
-try:
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    if not data or not isinstance(data, list):
-        raise ValueError("Invalid or empty JSON format")
-
-    message_count = len(data)
-    print(f"📄 Using data file: {json_path}")
-    print(f"💬 Loaded {message_count} messages")
-    logging.info(f"✅ Loaded {message_count} messages from {json_path}")
-
-except Exception as e:
-    logging.error(f"Failed to load JSON: {e}")
-    exit("❌ Error loading JSON.")
-
-# === Step 3: Frequency Analysis ===
-try:
-    analyze_messages(json_path)
-    logging.info("✅ Word frequency analysis completed.")
-except Exception as e:
-    logging.error(f"analyze_messages() failed: {e}")
-
-# === Step 4: Skip rest if too few messages ===
-if message_count < MIN_MESSAGES_FOR_FULL_ANALYSIS:
-    print(f"⚠️ Not enough messages for full analysis (min {MIN_MESSAGES_FOR_FULL_ANALYSIS} required). Skipping topic modeling and clustering.")
-    logging.warning("Too few messages for NMF and clustering. Pipeline ends here.")
-    exit(0)
-
-# === Step 5: Topic Modeling ===
-try:
-    topic_modeling_nmf(json_path, n_topics=10, n_words=10)
-    logging.info("✅ NMF topic modeling completed.")
-except Exception as e:
-    logging.error(f"topic_modeling_nmf() failed: {e}")
-
-# === Step 6: Plot Message Activity ===
-try:
-    plot_message_activity(json_path)
-    logging.info("✅ Message activity plot generated.")
-except Exception as e:
-    logging.error(f"plot_message_activity() failed: {e}")
-
-# === Step 7: User Activity Chart ===
-try:
-    plot_user_activity(json_path)
-    logging.info("✅ User activity plot generated.")
-except Exception as e:
-    logging.error(f"plot_user_activity() failed: {e}")
-
-# === Step 8: Markdown Report ===
-try:
-    generate_report(os.path.join(BASE_DIR, 'tg_analyst', 'data', 'results'))  # ✅
-    logging.info("✅ Markdown report generated.")
-except Exception as e:
-    logging.error(f"generate_report() failed: {e}")
-
-# === Step 9: Clustering ===
-try:
-    cluster_with_embeddings(json_path)
-    summarize_clusters()
-    logging.info("✅ HDBSCAN clustering and summary completed.")
-except Exception as e:
-    logging.error(f"Clustering or summarizing clusters failed: {e}")
-
-# === Step 10: GPT Summary ===
-if USE_GPT:
+
+def main():
+    """Download (or reuse) messages and run the analysis stage graph on them."""
+    # === Logging setup ===
+    log_dir = os.path.join(BASE_DIR, 'tg_analyst', 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, 'analysis.log')
+
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    logging.basicConfig(
+        filename=log_path,
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        encoding='utf-8',
+        filemode='w',
+    )
+
+    logging.info("🚀 Starting Telegram Chat Analysis Pipeline...")
+
+    # === Step 1: Load or download messages ===
+    if USE_EXISTING_JSON and os.path.exists(EXISTING_JSON_PATH):
+        json_path = EXISTING_JSON_PATH
+        print(f"📁 Using existing file: {json_path}")
+        logging.info(f"Using existing message file: {json_path}")
+    else:
+        json_path = download_messages(limit=LIMIT_MESSAGES)
+
+    if not json_path or not os.path.exists(json_path):
+        logging.warning("⚠️ No messages downloaded or file not found. Exiting.")
+        print("⚠️ No messages downloaded. Exiting.")
+        return
+
+    # === Step 2: Load and validate JSON (parsed once, shared by all steps) ===
+    metrics = JobMetrics()
     try:
-        gpt_summary_main()
-        logging.info("✅ GPT summary generated.")
+        with metrics.stage("load") as record:
+            corpus = MessageCorpus.load(json_path, chat_id=ChatMessageStore.chat_id_for(json_path))
+            record["items"] = len(corpus)
+
+        if not len(corpus):
+            raise ValueError("Invalid or empty JSON format")
+
+        message_count = len(corpus)
+        print(f"📄 Using data file: {json_path}")
+        print(f"💬 Loaded {message_count} messages")
+        logging.info(f"✅ Loaded {message_count} messages from {json_path}")
+
     except Exception as e:
-        logging.error(f"gpt_summary_main() failed: {e}")
-else:
-    print("⚠️ GPT summary skipped (USE_GPT=False)")
-    logging.info("⚠️ GPT summary skipped by config.")
-
-# === Done ===
-logging.info("🏁 Chat analysis pipeline completed successfully.")
-print("\n✅ Analysis pipeline completed successfully.")
-print(f"📁 Results saved in: {os.path.join(BASE_DIR, 'tg_analyst', 'data', 'results')}")
+        logging.error(f"Failed to load JSON: {e}")
+        sys.exit("❌ Error loading JSON.")
+
+    # Each run writes into its own job workspace
+    cleanup_workspaces()
+    job = JobContext.create(chat_id=corpus.chat_id)
+    metrics.job_id = job.job_id
+
+    # === Step 3: Run the stage graph (unchanged stages are restored from the cache) ===
+    stages = build_stages(
+        engine=CLUSTER_ENGINE,
+        incremental=CLUSTER_INCREMENTAL,
+        reduction=REDUCTION_MODE,
+        n_topics=10,
+        n_words=10,
+        use_gpt=USE_GPT,
+        min_messages=MIN_MESSAGES_FOR_FULL_ANALYSIS,
+    )
+
+    if message_count < MIN_MESSAGES_FOR_FULL_ANALYSIS:
+        print(f"⚠️ Not enough messages for full analysis (min {MIN_MESSAGES_FOR_FULL_ANALYSIS} required). Skipping topic modeling and clustering.")
+        logging.warning("Too few messages for NMF and clustering.")
+
+    if not USE_GPT:
+        print("⚠️ GPT summary skipped (USE_GPT=False)")
+        logging.info("⚠️ GPT summary skipped by config.")
+
+    with job.hold():
+        results = run_pipeline(corpus, job, stages, progress=print, metrics=metrics)
+
+    print("\n⏱️ Stages:")
+    for name, record in metrics.stages.items():
+        rss = record.get("peak_rss_mb")
+        print(f"  {name:<18} {record.get('status', 'done'):<8} {record.get('wall_seconds', 0):6.2f}s wall "
+              f"{record.get('cpu_seconds') or 0:6.2f}s cpu {rss or 0:7.0f} MB peak RSS")
+
+    # === Done ===
+    failed = [name for name, result in results.items() if result.status == "failed"]
+    if failed:
+        logging.warning(f"⚠️ Chat analysis pipeline completed with failed stages: {', '.join(failed)}")
+        print(f"\n⚠️ Analysis pipeline completed with failed stages: {', '.join(failed)}")
+    else:
+        logging.info("🏁 Chat analysis pipeline completed successfully.")
+        print("\n✅ Analysis pipeline completed successfully.")
+    print(f"📁 Results saved in: {job.output_dir}")
+
+
+# Guarded: chart rendering uses spawned processes, which re-import this module
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Persistent per-chat cluster models for incremental clustering.
+
+A full clustering run stores its result (cluster centroids, the label of every message and,
+for HDBSCAN, the clusterer fitted with `prediction_data=True`). Later runs only assign the
+messages that are new or edited since then: HDBSCAN via `approximate_predict`, the graph
+engines via the nearest centroid. A full refit happens when the new messages no longer fit
+the model (too much noise, lower similarity to their centroids, or too many of them).
+
+Cluster ids are stable: after a refit every new cluster inherits the id of the most similar
+old cluster, and clusters without a counterpart get fresh ids.
+
+- TGA_CLUSTER_INCREMENTAL: "0" to always refit from scratch
+- TGA_CLUSTER_REFIT_NOISE: refit when more than this share of new messages is noise
+- TGA_CLUSTER_REFIT_DRIFT: refit when new messages are this much less similar to their centroids
+- TGA_CLUSTER_REFIT_GROWTH: refit when messages added since the last fit exceed this share of it
+"""
+
+import os
+import re
+import logging
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import joblib
+
+from tg_analyst.utils.embedding_store import text_hash
+from tg_analyst.utils.graph_clustering import assign_to_centroids, centroids_for, normalize
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+)
+
+CLUSTER_MODELS_DIR = os.path.join(BASE_DIR, "models", "clusters")
+
+INCREMENTAL_DEFAULT = os.getenv("TGA_CLUSTER_INCREMENTAL", "1") == "1"
+REFIT_NOISE_RATIO = float(os.getenv("TGA_CLUSTER_REFIT_NOISE", "0.35"))
+REFIT_DRIFT = float(os.getenv("TGA_CLUSTER_REFIT_DRIFT", "0.1"))
+REFIT_GROWTH = float(os.getenv("TGA_CLUSTER_REFIT_GROWTH", "0.5"))
+
+# Cosine similarity a new cluster centroid needs to inherit an old cluster id
+MATCH_THRESHOLD = 0.8
+# Minimum similarity for assigning a message to a centroid (graph engines)
+ASSIGN_THRESHOLD = 0.6
+
+
+def _safe_name(value: Any) -> str:
+    return re.sub(r"[^\w.-]", "_", str(value))
+
+
+def _keys(message_ids: Sequence[Any], texts: Sequence[str]):
+    """Store keys (message id, or text hash for messages without one) and text hashes."""
+    digests = [text_hash(t) for t in texts]
+    keys = [str(i) if i is not None else f"h:{d}" for i, d in zip(message_ids, digests)]
+    return keys, digests
+
+
+def _cohesion(X: np.ndarray, labels: np.ndarray, cluster_ids: np.ndarray, centroids: np.ndarray) -> float:
+    """Mean cosine similarity of clustered rows to their own centroid."""
+    clustered = labels != -1
+    if not clustered.any() or not len(cluster_ids):
+        return 0.0
+    rows = np.searchsorted(cluster_ids, labels[clustered])
+    return float(np.einsum("ij,ij->i", X[clustered], centroids[rows]).mean())
+
+
+class ClusterModel:
+    """
+    Fitted clustering of one chat that can assign new messages without a full refit.
+
+    Args:
+        engine (str): "hdbscan", "graph" or "sample" (see stages.clustering.cluster_embeddings).
+        min_cluster_size (int): Passed to the engine on every (re)fit.
+        min_samples (int): Passed to the engine on every (re)fit.
+    """
+
+    def __init__(self, engine: str, min_cluster_size: int, min_samples: int):
+        self.engine = engine
+        self.min_cluster_size = min_cluster_size
+        self.min_samples = min_samples
+        self.cluster_ids = np.empty(0, dtype=np.int64)
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.assignments: Dict[str, Tuple[str, int]] = {}
+        self.clusterer = None
+        self.label_map: Dict[int, int] = {}
+        self.next_id = 0
+        self.cohesion = 0.0
+        self.n_fitted = 0
+        self.n_added = 0
+        self.refits = 0
+
+    @property
+    def fitted(self) -> bool:
+        return self.n_fitted > 0
+
+    def _fit_raw(self, embeddings: np.ndarray) -> np.ndarray:
+        if self.engine == "hdbscan":
+            import hdbscan
+
+            self.clusterer = hdbscan.HDBSCAN(
+                min_cluster_size=self.min_cluster_size,
+                min_samples=self.min_samples,
+                metric='euclidean',
+                prediction_data=True,
+            )
+            return self.clusterer.fit_predict(embeddings)
+
+        from tg_analyst.utils.stages.clustering import cluster_embeddings
+        return cluster_embeddings(embeddings, self.engine, self.min_cluster_size, self.min_samples)
+
+    def _stable_ids(self, X: np.ndarray, raw: np.ndarray) -> Dict[int, int]:
+        """Map raw engine labels to stable ids by matching centroids with the previous fit."""
+        from scipy.optimize import linear_sum_assignment
+
+        raw_ids, raw_centroids = centroids_for(X, raw)
+        mapping: Dict[int, int] = {}
+        if len(self.cluster_ids) and len(raw_ids) and self.centroids.shape[1] == X.shape[1]:
+            sims = raw_centroids @ self.centroids.T
+            rows, cols = linear_sum_assignment(-sims)
+            for r, c in zip(rows, cols):
+                if sims[r, c] >= MATCH_THRESHOLD:
+                    mapping[int(raw_ids[r])] = int(self.cluster_ids[c])
+        for raw_id in raw_ids.tolist():
+            if raw_id not in mapping:
+                mapping[raw_id] = self.next_id
+                self.next_id += 1
+        return mapping
+
+    def fit(self, keys: Sequence[str], digests: Sequence[str], embeddings: np.ndarray) -> np.ndarray:
+        """
+        Cluster all messages from scratch, keeping ids of clusters that survive the refit.
+
+        Returns:
+            np.ndarray: Stable cluster label per row, -1 for noise.
+        """
+        X = normalize(embeddings)
+        raw = np.asarray(self._fit_raw(embeddings), dtype=np.int64)
+        self.label_map = self._stable_ids(X, raw)
+        labels = np.array([self.label_map.get(int(r), -1) for r in raw], dtype=np.int64)
+
+        self.cluster_ids, self.centroids = centroids_for(X, labels)
+        self.cohesion = _cohesion(X, labels, self.cluster_ids, self.centroids)
+        self.assignments = {k: (d, int(l)) for k, d, l in zip(keys, digests, labels)}
+        self.n_fitted = len(keys)
+        self.n_added = 0
+        self.refits += 1
+        return labels
+
+    def predict(self, embeddings: np.ndarray) -> np.ndarray:
+        """Assign rows to existing clusters (stable ids), -1 where none fits."""
+        if self.engine == "hdbscan" and self.clusterer is not None:
+            import hdbscan
+
+            raw, _ = hdbscan.approximate_predict(self.clusterer, embeddings)
+            return np.array([self.label_map.get(int(r), -1) for r in raw], dtype=np.int64)
+        return assign_to_centroids(normalize(embeddings), self.cluster_ids, self.centroids, ASSIGN_THRESHOLD)
+
+    def _refit_reason(self, X_new: np.ndarray, new_labels: np.ndarray) -> Optional[str]:
+        noise = float((new_labels == -1).mean())
+        if noise > REFIT_NOISE_RATIO:
+            return f"noise ratio of new messages {noise:.2f} > {REFIT_NOISE_RATIO}"
+        drift = self.cohesion - _cohesion(X_new, new_labels, self.cluster_ids, self.centroids)
+        if (new_labels != -1).any() and drift > REFIT_DRIFT:
+            return f"similarity to centroids dropped by {drift:.2f} > {REFIT_DRIFT}"
+        growth = (self.n_added + len(new_labels)) / max(1, self.n_fitted)
+        if growth > REFIT_GROWTH:
+            return f"{growth:.0%} new messages since the last fit > {REFIT_GROWTH:.0%}"
+        return None
+
+    def update(
+            self,
+            message_ids: Sequence[Any],
+            texts: Sequence[str],
+            embeddings: np.ndarray,
+    ) -> Tuple[np.ndarray, bool]:
+        """
+        Label the current messages of the chat, reusing earlier assignments.
+
+        Messages seen before with the same text keep their cluster; new and edited ones are
+        assigned incrementally, unless that would degrade the model enough to warrant a refit.
+
+        Returns:
+            (labels, refitted): Stable cluster label per row and whether a full refit ran.
+        """
+        keys, digests = _keys(message_ids, texts)
+        if not self.fitted:
+            return self.fit(keys, digests, embeddings), True
+
+        labels = np.full(len(keys), -1, dtype=np.int64)
+        new_rows = []
+        for row, (key, digest) in enumerate(zip(keys, digests)):
+            known = self.assignments.get(key)
+            if known is not None and known[0] == digest:
+                labels[row] = known[1]
+            else:
+                new_rows.append(row)
+
+        if not new_rows:
+            return labels, False
+
+        new_rows = np.array(new_rows)
+        new_labels = self.predict(embeddings[new_rows])
+        reason = self._refit_reason(normalize(embeddings[new_rows]), new_labels)
+        if reason:
+            logging.info(f"♻️ Refitting clusters: {reason}")
+            return self.fit(keys, digests, embeddings), True
+
+        labels[new_rows] = new_labels
+        for row, label in zip(new_rows.tolist(), new_labels.tolist()):
+            self.assignments[keys[row]] = (digests[row], label)
+        self.n_added += len(new_rows)
+        logging.info(f"🧩 Assigned {len(new_rows)} new messages to {len(self.cluster_ids)} existing clusters")
+        return labels, False
+
+    @staticmethod
+    def path_for(chat_id: Any, root: str = CLUSTER_MODELS_DIR) -> str:
+        return os.path.join(root, f"{_safe_name(chat_id)}.joblib")
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        joblib.dump(self, tmp_path, compress=3)
+        os.replace(tmp_path, path)
+        logging.info(f"💾 Cluster model saved to {path}")
+
+    @classmethod
+    def load_or_create(
+            cls,
+            chat_id: Optional[Any],
+            engine: str,
+            min_cluster_size: int,
+            min_samples: int,
+    ) -> Tuple["ClusterModel", Optional[str]]:
+        """
+        Load the persisted model for `chat_id`, or create a new one.
+
+        A model fitted with a different engine or parameters is replaced by a new one
+        that inherits its cluster ids on the first fit.
+
+        Returns:
+            (model, path): `path` is None when the chat is unknown and nothing is persisted.
+        """
+        fresh = cls(engine, min_cluster_size, min_samples)
+        if chat_id is None:
+            return fresh, None
+
+        path = cls.path_for(chat_id)
+        if os.path.exists(path):
+            try:
+                model = joblib.load(path)
+                if not isinstance(model, cls):
+                    raise TypeError(f"unexpected object {type(model).__name__}")
+                if (model.engine, model.min_cluster_size, model.min_samples) == (engine, min_cluster_size, min_samples):
+                    return model, path
+                logging.info(f"♻️ Cluster model for chat {chat_id} has different settings, refitting.")
+                fresh.cluster_ids, fresh.centroids, fresh.next_id = model.cluster_ids, model.centroids, model.next_id
+            except Exception as e:
+                logging.warning(f"⚠️ Could not load cluster model {path}, starting a new one: {e}")
+        return fresh, path
@@ -10,15 +10,22 @@ BASE_DIR = os.getenv(
 
 
 def summarize_clusters(
-        csv_path=os.path.join(BASE_DIR, "results", "hdbscan_clusters.csv"),
-        output_path=os.path.join(BASE_DIR, "results", "cluster_summaries.txt"),
-        max_messages_per_cluster=5
+        csv_path=None,
+        output_path=None,
+        max_messages_per_cluster=5,
+        job=None
 ):
     """
     Reads clustered messages from CSV, groups them by cluster (excluding -1),
     and writes a readable summary per cluster to a .txt file.
     Filters out clusters with only 1 message.
+
+    Paths default to the `job` workspace when a JobContext is given,
+    otherwise to the shared results directory.
     """
+    results_dir = job.output_dir if job is not None else os.path.join(BASE_DIR, "results")
+    csv_path = csv_path or os.path.join(results_dir, "hdbscan_clusters.csv")
+    output_path = output_path or os.path.join(results_dir, "cluster_summaries.txt")
     if not os.path.exists(csv_path):
         print(f"❌ File not found: {csv_path}")
         logging.warning(f"❌ Cluster file missing: {csv_path}")
@@ -0,0 +1,213 @@
+import os
+import hashlib
+import logging
+from datetime import datetime, date
+from typing import Any, Iterable, List, Optional, Sequence, Union
+
+from tg_analyst.utils.json_stream import iter_messages
+
+
+def _parse_date(value: Any) -> Optional[datetime]:
+    """Parse an ISO date string, returning None for missing or invalid values."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class MessageCorpus:
+    """
+    In-memory, column-oriented view of a chat export.
+
+    The JSON file is parsed once and every analyzer stage reads the columns it needs
+    instead of re-loading and re-filtering the raw records.
+
+    Columns (all of equal length):
+    - ids: message ids
+    - dates: parsed datetimes (None where missing or invalid)
+    - sender_ids / sender_names: message authors
+    - texts: stripped message text ("" for missing or non-string text)
+    - mask: True where the message has non-empty text
+
+    `chat_id` identifies the chat the messages belong to (used as a cache key by later stages).
+    """
+
+    def __init__(
+            self,
+            ids: List[Any],
+            dates: List[Optional[datetime]],
+            sender_ids: List[Any],
+            sender_names: List[Optional[str]],
+            texts: List[str],
+            has_sender_names: bool = True,
+            source: Optional[str] = None,
+            chat_id: Optional[str] = None,
+    ):
+        self.ids = ids
+        self.dates = dates
+        self.sender_ids = sender_ids
+        self.sender_names = sender_names
+        self.texts = texts
+        self.mask = [bool(t) for t in texts]
+        self.has_sender_names = has_sender_names
+        self.source = source
+        self.chat_id = chat_id
+        self._messages = None
+        self._message_ids = None
+        self._digest = None
+
+    @classmethod
+    def from_records(
+            cls,
+            records: Iterable[dict],
+            source: Optional[str] = None,
+            chat_id: Optional[str] = None,
+    ) -> "MessageCorpus":
+        """
+        Build a corpus from an iterable of message dicts (the downloader's JSON format).
+
+        Args:
+            records (Iterable[dict]): Message records with id/date/sender_id/sender_name/text keys.
+            source (str, optional): Where the records came from, used in log messages.
+            chat_id (str, optional): Identifier of the chat the records belong to.
+
+        Returns:
+            MessageCorpus: The column-oriented corpus.
+        """
+        ids, dates, sender_ids, sender_names, texts = [], [], [], [], []
+        has_sender_names = False
+
+        for item in records:
+            if not isinstance(item, dict):
+                continue
+            text = item.get('text')
+            ids.append(item.get('id'))
+            dates.append(_parse_date(item.get('date')))
+            sender_ids.append(item.get('sender_id'))
+            if 'sender_name' in item:
+                has_sender_names = True
+            sender_names.append(item.get('sender_name'))
+            texts.append(text.strip() if isinstance(text, str) else "")
+
+        return cls(ids, dates, sender_ids, sender_names, texts,
+                   has_sender_names=has_sender_names, source=source, chat_id=chat_id)
+
+    @classmethod
+    def from_arrow(cls, table, source: Optional[str] = None, chat_id: Optional[str] = None) -> "MessageCorpus":
+        """
+        Build a corpus from a pyarrow Table with (a subset of) the message columns.
+        Columns that were not read are filled with empty values.
+        """
+        n = table.num_rows
+
+        def column(name: str) -> List[Any]:
+            return table.column(name).to_pylist() if name in table.column_names else [None] * n
+
+        texts = [t.strip() if isinstance(t, str) else "" for t in column("text")]
+        return cls(
+            column("id"),
+            [_parse_date(d) for d in column("date")],
+            column("sender_id"),
+            column("sender_name"),
+            texts,
+            has_sender_names="sender_name" in table.column_names,
+            source=source,
+            chat_id=chat_id,
+        )
+
+    @classmethod
+    def load(
+            cls,
+            path: str,
+            chat_id: Optional[str] = None,
+            columns: Optional[Sequence[str]] = None,
+    ) -> "MessageCorpus":
+        """
+        Load a corpus from a JSON file or a Parquet message table directory.
+
+        Args:
+            path (str): messages.json-style file or messages.parquet directory.
+            chat_id (str, optional): Identifier of the chat the messages belong to.
+            columns (Sequence[str], optional): Message fields to read; only honoured for
+                Parquet, where unread columns are never loaded from disk.
+
+        Returns:
+            MessageCorpus: The loaded corpus.
+        """
+        if os.path.isdir(path):
+            from tg_analyst.utils.parquet_store import ParquetMessageTable
+
+            table = ParquetMessageTable(path).read(columns)
+            corpus = cls.from_arrow(table, source=path, chat_id=chat_id)
+            logging.info(f"📚 Message corpus read from {path}: {len(corpus)} messages, columns {table.column_names}")
+            return corpus
+        return cls.from_json(path, chat_id=chat_id)
+
+    @classmethod
+    def from_json(cls, path: str, chat_id: Optional[str] = None) -> "MessageCorpus":
+        """
+        Load a corpus from a JSON file produced by the downloader or a Telegram Desktop export.
+        The file is parsed incrementally, so only the corpus columns are held in memory.
+
+        Args:
+            path (str): Path to the JSON file with a list of messages, or a result.json export.
+            chat_id (str, optional): Identifier of the chat the file belongs to.
+
+        Returns:
+            MessageCorpus: The loaded corpus.
+
+        Raises:
+            ValueError: If the file does not contain a list of messages.
+        """
+        corpus = cls.from_records(iter_messages(path), source=path, chat_id=chat_id)
+        logging.info(f"📚 Message corpus built from {path}: {len(corpus)} messages, {len(corpus.messages)} with text")
+        return corpus
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __repr__(self) -> str:
+        return f"MessageCorpus(source={self.source!r}, messages={len(self)})"
+
+    @property
+    def messages(self) -> List[str]:
+        """Non-empty message texts, in corpus order."""
+        if self._messages is None:
+            self._messages = [t for t, keep in zip(self.texts, self.mask) if keep]
+        return self._messages
+
+    @property
+    def message_ids(self) -> List[Any]:
+        """Ids of the messages returned by `messages`, in the same order."""
+        if self._message_ids is None:
+            self._message_ids = [i for i, keep in zip(self.ids, self.mask) if keep]
+        return self._message_ids
+
+    def valid_days(self) -> List[date]:
+        """Calendar days of all messages with a valid date."""
+        return [d.date() for d in self.dates if d is not None]
+
+    def digest(self) -> str:
+        """Content hash of all columns; equal digests mean equal analysis inputs."""
+        if self._digest is None:
+            h = hashlib.sha256(f"{self.chat_id}|{self.has_sender_names}\n".encode("utf-8"))
+            for row in zip(self.ids, self.dates, self.sender_ids, self.sender_names, self.texts):
+                h.update(repr(row).encode("utf-8"))
+            self._digest = h.hexdigest()
+        return self._digest
+
+
+def as_corpus(
+        source: Union[str, "os.PathLike", MessageCorpus],
+        columns: Optional[Sequence[str]] = None,
+) -> MessageCorpus:
+    """
+    Return `source` unchanged if it is already a MessageCorpus, otherwise load it from
+    JSON or a Parquet message table (reading only `columns` when given).
+    Lets analyzer functions keep accepting a file path as before.
+    """
+    if isinstance(source, MessageCorpus):
+        return source
+    return MessageCorpus.load(os.fspath(source), columns=columns)
@@ -3,6 +3,7 @@ from telethon.errors import SessionPasswordNeededError
 
 from tg_analyst.config import API_ID, API_HASH, SESSION_NAME, TARGET_CHAT
 from tg_analyst.utils.json_loader import save_json
+from tg_analyst.utils.message_store import ChatMessageStore
 
 from datetime import datetime
 import os
@@ -14,17 +15,25 @@ BASE_DIR = os.getenv(
 )
 
 
-def download_messages(limit=1000) -> str:
+def download_messages(limit=1000, chat=None, incremental=True) -> str:
     """
     Downloads messages from a Telegram chat using Telethon and saves them to a JSON file,
     including sender's name and username.
 
+    With `incremental=True` (default) messages are appended to the chat's local store:
+    the first run fetches the latest `limit` messages, later runs fetch only messages
+    newer than the stored checkpoint (Telethon `min_id`).
+
     Args:
-        limit (int): The maximum number of messages to retrieve.
+        limit (int): The maximum number of messages to retrieve on the first download
+            (or on every download when incremental is off).
+        chat (str, optional): Chat link or username. Defaults to TARGET_CHAT.
+        incremental (bool): Use the per-chat message store and checkpoint.
 
     Returns:
         str: Path to the saved JSON file.
     """
+    chat = chat or TARGET_CHAT
     client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
 
     try:
@@ -34,10 +43,18 @@ def download_messages(limit=1000) -> str:
         raise
 
     messages = []
-    print(f"📥 Connecting to chat: {TARGET_CHAT} ...")
+    max_seen_id = None
+    print(f"📥 Connecting to chat: {chat} ...")
 
     try:
-        for msg in client.iter_messages(TARGET_CHAT, limit=limit):
+        entity = client.get_entity(chat)
+        store = ChatMessageStore(entity.id) if incremental else None
+        fetch_kwargs = store.fetch_kwargs(limit) if store else {"limit": limit}
+        if "min_id" in fetch_kwargs:
+            print(f"🔁 Fetching messages newer than id {fetch_kwargs['min_id']}")
+
+        for msg in client.iter_messages(entity, **fetch_kwargs):
+            max_seen_id = max(max_seen_id or 0, msg.id)
             if msg.text and isinstance(msg.text, str) and msg.text.strip():
                 sender = msg.sender
 
@@ -60,6 +77,21 @@ def download_messages(limit=1000) -> str:
         logging.error(f"❌ Failed to download messages: {e}")
         raise
 
+    if store is not None:
+        added = store.append(messages, max_seen_id=max_seen_id)
+        print(f"✅ {added} new messages, {store.load_checkpoint().get('count', 0)} stored in {store.messages_path}")
+
+        if not os.path.exists(store.messages_path):
+            logging.warning("⚠️ No messages downloaded.")
+            print("⚠️ No messages were retrieved from the chat.")
+            return ""
+
+        if "min_id" not in fetch_kwargs and len(messages) < limit:
+            print(f"⚠️ Only {len(messages)} messages found (requested {limit})")
+            logging.warning(f"⚠️ Only {len(messages)} messages found (requested {limit})")
+
+        return store.messages_path
+
     if not messages:
         logging.warning("⚠️ No messages downloaded.")
         print("⚠️ No messages were retrieved from the chat.")
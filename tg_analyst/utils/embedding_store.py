@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+)
+
+EMBEDDINGS_DIR = os.getenv("TGA_EMBEDDINGS_DIR", os.path.join(BASE_DIR, "embeddings"))
+
+# float16 halves disk usage; vectors are always returned as float32
+EMBEDDING_DTYPE = os.getenv("TGA_EMBEDDING_DTYPE", "float32")
+
+# Merge segments into one once there are this many, or once half of the stored rows are stale
+MAX_SEGMENTS = 16
+MAX_STALE_RATIO = 0.5
+
+# Taken exclusively for every read-modify-write of a store (see EmbeddingStore._locked)
+LOCK_FILE = ".lock"
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def text_hash(text: str) -> str:
+    """Short, stable hash of a message text used to detect edited messages."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _safe_name(value: Any) -> str:
+    return re.sub(r"[^\w.-]", "_", str(value)) or "default"
+
+
+def _dir_lock(path: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+class EmbeddingStore:
+    """
+    On-disk embedding cache for one (chat, model) pair.
+
+    Vectors live in append-only `.npy` segments that are opened memory-mapped, and
+    `index.json` maps each message key to (segment, row, text hash). A message is
+    re-encoded only if it is new or its text hash changed since it was stored.
+    Several processes may share a store; its index is re-read under a file lock.
+    """
+
+    def __init__(self, chat_id: Any, model_name: str, root: str = EMBEDDINGS_DIR, dtype: str = EMBEDDING_DTYPE):
+        self.chat_id = chat_id if chat_id is not None else "default"
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.path = os.path.join(root, _safe_name(self.chat_id), _safe_name(model_name))
+        self.index_path = os.path.join(self.path, "index.json")
+        self._lock = _dir_lock(self.path)
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict:
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                if index.get("dtype") == self.dtype.name:
+                    return index
+                logging.info(f"♻️ Embedding store dtype changed, rebuilding {self.path}")
+            except Exception as e:
+                logging.warning(f"⚠️ Corrupt embedding index {self.index_path}, rebuilding: {e}")
+        return {"model": self.model_name, "dtype": self.dtype.name, "dim": None, "segments": [], "entries": {}}
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the store exclusively: the per-process lock plus an fcntl lock on the store
+        directory, as queue workers, executor processes, the CLI and benchmarks can open the
+        same store at once. Without fcntl (Windows) only threads are kept apart.
+        """
+        with self._lock:
+            try:
+                import fcntl
+            except ImportError:
+                yield
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, LOCK_FILE), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _drop_missing_segments(self) -> None:
+        """Forget segments that are gone from disk; their messages are re-encoded like cache misses."""
+        gone = {name for name in self._index["segments"] if not os.path.exists(os.path.join(self.path, name))}
+        if not gone:
+            return
+        logging.warning(f"⚠️ {len(gone)} embedding segment(s) missing in {self.path}, re-encoding their messages")
+        self._index["segments"] = [name for name in self._index["segments"] if name not in gone]
+        self._index["entries"] = {key: e for key, e in self._index["entries"].items() if e[0] not in gone}
+        self._save_index()
+
+    def _save_index(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def _key(message_id: Any, digest: str) -> str:
+        # Messages without an id can only be matched by their text
+        return str(message_id) if message_id is not None else f"h:{digest}"
+
+    def __len__(self) -> int:
+        return len(self._index["entries"])
+
+    def _open_segment(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, name), mmap_mode="r")
+
+    def _write_segment(self, vectors: np.ndarray) -> str:
+        os.makedirs(self.path, exist_ok=True)
+        name = f"seg_{uuid.uuid4().hex[:12]}.npy"
+        out = np.lib.format.open_memmap(
+            os.path.join(self.path, name), mode="w+", dtype=self.dtype, shape=vectors.shape
+        )
+        out[:] = vectors
+        out.flush()
+        del out
+        return name
+
+    def _gather(self, keys: Sequence[str]) -> np.ndarray:
+        """Read the stored vectors for `keys` (all must be present), grouped by segment."""
+        entries = self._index["entries"]
+        result = np.empty((len(keys), self._index["dim"]), dtype=np.float32)
+        by_segment: Dict[str, List[tuple]] = {}
+        for pos, key in enumerate(keys):
+            segment, row, _ = entries[key]
+            by_segment.setdefault(segment, []).append((pos, row))
+
+        for segment, pairs in by_segment.items():
+            data = self._open_segment(segment)
+            positions, rows = zip(*pairs)
+            result[list(positions)] = data[list(rows)]
+        return result
+
+    def get_or_encode(
+            self,
+            message_ids: Sequence[Any],
+            texts: Sequence[str],
+            encode: Callable[[List[str]], np.ndarray],
+    ) -> np.ndarray:
+        """
+        Return embeddings for `texts`, encoding only messages missing from the store.
+
+        Args:
+            message_ids (Sequence): Message ids aligned with `texts` (None allowed).
+            texts (Sequence[str]): Message texts.
+            encode (Callable): Function mapping a list of texts to a 2-D array of embeddings.
+
+        Returns:
+            np.ndarray: float32 matrix of shape (len(texts), dim).
+        """
+        with self._locked():
+            # Other processes may have appended or compacted since this store was opened
+            self._index = self._load_index()
+            self._drop_missing_segments()
+            return self._get_or_encode(message_ids, texts, encode)
+
+    def _get_or_encode(self, message_ids, texts, encode) -> np.ndarray:
+        """`get_or_encode` with the store held."""
+        entries = self._index["entries"]
+        keys, digests = [], []
+        missing: Dict[str, int] = {}
+        for message_id, text in zip(message_ids, texts):
+            digest = text_hash(text)
+            key = self._key(message_id, digest)
+            keys.append(key)
+            digests.append(digest)
+            entry = entries.get(key)
+            if (entry is None or entry[2] != digest) and key not in missing:
+                missing[key] = len(keys) - 1
+
+        if missing:
+            positions = list(missing.values())
+            new_vectors = np.asarray(encode([texts[i] for i in positions]), dtype=np.float32)
+            if self._index["dim"] not in (None, new_vectors.shape[1]):
+                # Model output size changed under the same name — start over
+                logging.warning(f"⚠️ Embedding dimension changed in {self.path}, discarding old vectors")
+                self._index.update({"dim": None, "segments": [], "entries": {}})
+                self._save_index()
+                self._cleanup_segments()
+                return self._get_or_encode(message_ids, texts, encode)
+
+            self._index["dim"] = int(new_vectors.shape[1])
+            segment = self._write_segment(new_vectors.astype(self.dtype))
+            self._index["segments"].append(segment)
+            for row, (key, pos) in enumerate(missing.items()):
+                entries[key] = [segment, row, digests[pos]]
+            self._maybe_compact()
+            self._save_index()
+
+        logging.info(
+            f"🧮 Embeddings for chat {self.chat_id}: {len(keys) - len(missing)} cached, {len(missing)} encoded"
+        )
+        return self._gather(keys)
+
+    def _stale_ratio(self) -> float:
+        total_rows = 0
+        for segment in self._index["segments"]:
+            total_rows += self._open_segment(segment).shape[0]
+        return 1 - len(self._index["entries"]) / total_rows if total_rows else 0.0
+
+    def _maybe_compact(self) -> None:
+        if len(self._index["segments"]) > MAX_SEGMENTS or self._stale_ratio() > MAX_STALE_RATIO:
+            self._compact()
+
+    def compact(self) -> None:
+        """Rewrite all live vectors into a single segment and delete the old ones."""
+        with self._locked():
+            self._index = self._load_index()
+            self._drop_missing_segments()
+            self._compact()
+
+    def _compact(self) -> None:
+        entries = self._index["entries"]
+        if not entries:
+            return
+        keys = list(entries)
+        vectors = self._gather(keys)
+        segment = self._write_segment(vectors.astype(self.dtype))
+        for row, key in enumerate(keys):
+            entries[key] = [segment, row, entries[key][2]]
+        self._index["segments"] = [segment]
+        self._save_index()
+        self._cleanup_segments()
+        logging.info(f"🗜️ Compacted embedding store {self.path} to {len(keys)} vectors")
+
+    def _cleanup_segments(self) -> None:
+        live = set(self._index["segments"])
+        for name in os.listdir(self.path):
+            if name.startswith("seg_") and name.endswith(".npy") and name not in live:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError as e:
+                    logging.warning(f"⚠️ Could not remove stale segment {name}: {e}")
+
+
+def encode_with_cache(
+        model_name: str,
+        chat_id: Optional[Any],
+        message_ids: Sequence[Any],
+        texts: Sequence[str],
+        encode: Callable[[List[str]], np.ndarray],
+) -> np.ndarray:
+    """
+    Convenience wrapper: embed `texts` through the persistent store for (chat_id, model_name).
+    """
+    store = EmbeddingStore(chat_id, model_name)
+    return store.get_or_encode(message_ids, texts, encode)
@@ -0,0 +1,176 @@
+from collections import Counter, defaultdict
+from datetime import date
+from itertools import filterfalse, islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tg_analyst.utils.preprocessing import TOKEN_RE
+
+# Custom Russian stopwords
+stopwords_local = {
+    'в', 'на', 'и', 'а', 'но', 'что', 'как', 'уже', 'будет', 'это', 'то',
+    'не', 'да', 'с', 'по', 'за', 'от', 'для', 'к', 'о', 'об', 'из', 'при',
+    'быть', 'есть', 'его', 'ее', 'их', 'мы', 'вы', 'он', 'она', 'они', 'кто'
+}
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Separates messages in a batch's token stream; str.lower() never leaves an uppercase
+# omega behind, so no token of the lowered texts can equal it
+_BOUNDARY = "Ω"
+
+
+def _batched(iterable: Iterable, size: int):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+class FrequencyCounter:
+    """
+    Streaming, mergeable word-frequency counts.
+
+    Messages are consumed in batches; each batch is tokenized in one regex pass and
+    counted straight into Counters, so the full token list is never materialized. Counters built over different parts of a chat
+    (or in different processes) can be combined with `merge` / `+`.
+
+    Args:
+        stopwords (set): Tokens to ignore.
+        bigrams (bool): Also count adjacent word pairs (within a message).
+        breakdowns (bool): Also keep word counts per sender and per day.
+    """
+
+    def __init__(self, stopwords=stopwords_local, bigrams: bool = True, breakdowns: bool = False):
+        self.stopwords = frozenset(stopwords)
+        self.track_bigrams = bigrams
+        self.track_breakdowns = breakdowns
+        self.words: Counter = Counter()
+        self.bigrams: Counter = Counter()
+        self.by_sender: Dict[Any, Counter] = defaultdict(Counter)
+        self.by_day: Dict[date, Counter] = defaultdict(Counter)
+        self.messages = 0
+
+    def _filtered(self, tokens: Iterable[str]):
+        return filterfalse(self.stopwords.__contains__, tokens)
+
+    def update(
+            self,
+            texts: Sequence[str],
+            senders: Optional[Sequence[Any]] = None,
+            days: Optional[Sequence[Optional[date]]] = None,
+    ) -> "FrequencyCounter":
+        """
+        Count one batch of messages.
+
+        Args:
+            texts (Sequence[str]): Message texts.
+            senders (Sequence, optional): Sender of each text (for per-sender breakdowns).
+            days (Sequence[date], optional): Day of each text (for per-day breakdowns).
+        """
+        self.messages += len(texts)
+
+        tokens = self._tokens(texts)
+        self.words.update(tokens)
+        del self.words[_BOUNDARY]
+        if self.track_bigrams:
+            pairs = Counter(zip(tokens, tokens[1:]))
+            for pair in [pair for pair in pairs if _BOUNDARY in pair]:
+                del pairs[pair]
+            self.bigrams.update(pairs)
+
+        if self.track_breakdowns and (senders is not None or days is not None):
+            self._update_breakdowns(texts, senders, days)
+        return self
+
+    def _tokens(self, texts: Sequence[str]) -> List[str]:
+        """
+        Non-stopword tokens of a whole batch from one regex pass, with a _BOUNDARY
+        token between messages so that no pair spans two of them.
+        """
+        joined = f" {_BOUNDARY} ".join(map(str.lower, texts))
+        return list(self._filtered(TOKEN_RE.findall(joined)))
+
+    def _update_breakdowns(self, texts, senders, days) -> None:
+        """Per-sender and per-day counts, one regex pass per (sender, day) group."""
+        groups: Dict[Tuple[Any, Any], List[str]] = defaultdict(list)
+        for i, text in enumerate(texts):
+            groups[senders[i] if senders is not None else None, days[i] if days is not None else None].append(text)
+        for (sender, day), group in groups.items():
+            counts = Counter(self._filtered(TOKEN_RE.findall("\n".join(group).lower())))
+            if not counts:
+                continue
+            if senders is not None:
+                self.by_sender[sender].update(counts)
+            if day is not None:
+                self.by_day[day].update(counts)
+
+    def update_corpus(
+            self,
+            corpus,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            transform: Optional[Callable[[Sequence[str]], Sequence[str]]] = None,
+    ) -> "FrequencyCounter":
+        """
+        Count every non-empty message of a MessageCorpus in batches of `batch_size`.
+        `transform` (e.g. lemmatize_texts) is applied to each batch of texts before counting.
+        """
+        rows = (
+            (text, sender, dt.date() if dt is not None else None)
+            for text, keep, sender, dt in zip(corpus.texts, corpus.mask, corpus.sender_names, corpus.dates)
+            if keep
+        )
+        for batch in _batched(rows, batch_size):
+            texts, senders, days = zip(*batch)
+            if transform is not None:
+                texts = transform(texts)
+            self.update(texts, senders, days)
+        return self
+
+    def update_stream(
+            self,
+            texts: Iterable[str],
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            transform: Optional[Callable[[Sequence[str]], Sequence[str]]] = None,
+    ) -> "FrequencyCounter":
+        """Count texts from any iterable (e.g. a generator over a huge export) in batches."""
+        for batch in _batched((t for t in texts if t), batch_size):
+            self.update(transform(batch) if transform is not None else batch)
+        return self
+
+    def merge(self, other: "FrequencyCounter") -> "FrequencyCounter":
+        """Add the counts of `other` into this counter."""
+        self.words.update(other.words)
+        self.bigrams.update(other.bigrams)
+        for sender, counts in other.by_sender.items():
+            self.by_sender[sender].update(counts)
+        for day, counts in other.by_day.items():
+            self.by_day[day].update(counts)
+        self.messages += other.messages
+        return self
+
+    def __iadd__(self, other: "FrequencyCounter") -> "FrequencyCounter":
+        return self.merge(other)
+
+    def __add__(self, other: "FrequencyCounter") -> "FrequencyCounter":
+        result = FrequencyCounter(self.stopwords, self.track_bigrams, self.track_breakdowns)
+        return result.merge(self).merge(other)
+
+    def top_k(self, k: int = 20, min_count: int = 1) -> List[Tuple[str, int]]:
+        """The `k` most frequent words occurring at least `min_count` times."""
+        return [(w, c) for w, c in self.words.most_common(k) if c >= min_count]
+
+    def top_bigrams(self, k: int = 20, min_count: int = 1) -> List[Tuple[str, int]]:
+        """The `k` most frequent word pairs, joined with a space."""
+        return [(f"{a} {b}", c) for (a, b), c in self.bigrams.most_common(k) if c >= min_count]
+
+    def top_by_sender(self, k: int = 10) -> Dict[Any, List[Tuple[str, int]]]:
+        return {sender: counts.most_common(k) for sender, counts in self.by_sender.items()}
+
+    def top_by_day(self, k: int = 10) -> Dict[date, List[Tuple[str, int]]]:
+        return {day: counts.most_common(k) for day, counts in sorted(self.by_day.items())}
+
+    def counts_above(self, min_count: int) -> Counter:
+        """Word counts restricted to words occurring more than `min_count` times."""
+        return Counter({w: c for w, c in self.words.items() if c > min_count})
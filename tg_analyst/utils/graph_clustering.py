@@ -0,0 +1,197 @@
+"""
+kNN-graph clustering for large embedding sets.
+
+Embeddings are L2-normalized, a k-nearest-neighbour graph is built (HNSW via the optional
+`hnswlib` package, otherwise an exact blocked NumPy search), and clusters are the connected
+components of the mutual-kNN graph restricted to edges above a cosine-similarity threshold.
+Components smaller than `min_cluster_size` are labelled noise (-1), like HDBSCAN does;
+points left out only because no neighbour picked them back (common in high dimensions)
+join the cluster of their most similar clustered neighbour above the threshold.
+
+`cluster_subsample` fits on a random sample and assigns every other message to the nearest
+cluster centroid, which keeps very large chats cheap.
+"""
+
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+# Rows per block in the exact search; bounds the block x n similarity matrix
+BLOCK_SIZE = 2048
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so that dot products are cosine similarities."""
+    X = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return X / norms
+
+
+def _knn_exact(X: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    n = X.shape[0]
+    indices = np.empty((n, k), dtype=np.int64)
+    sims = np.empty((n, k), dtype=np.float32)
+    for start in range(0, n, BLOCK_SIZE):
+        block = X[start:start + BLOCK_SIZE] @ X.T
+        # Exclude self-matches
+        block[np.arange(block.shape[0]), np.arange(start, start + block.shape[0])] = -np.inf
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        indices[start:start + block.shape[0]] = np.take_along_axis(top, order, axis=1)
+        sims[start:start + block.shape[0]] = np.take_along_axis(top_sims, order, axis=1)
+    return indices, sims
+
+
+def _knn_hnsw(X: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    import hnswlib
+
+    index = hnswlib.Index(space="cosine", dim=X.shape[1])
+    index.init_index(max_elements=X.shape[0], ef_construction=200, M=16, random_seed=42)
+    index.add_items(X, np.arange(X.shape[0]))
+    index.set_ef(max(50, 2 * k))
+    labels, distances = index.knn_query(X, k=k + 1)
+    # Drop the self-match (first column in almost all cases)
+    indices, sims = [], []
+    for row, (lab, dist) in enumerate(zip(labels, distances)):
+        keep = lab != row
+        indices.append(lab[keep][:k])
+        sims.append(1 - dist[keep][:k])
+    return np.array(indices, dtype=np.int64), np.array(sims, dtype=np.float32)
+
+
+def knn_graph(X: np.ndarray, k: int = 15, backend: str = "auto") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nearest neighbours of every row of normalized `X`.
+
+    Args:
+        X (np.ndarray): L2-normalized embeddings.
+        k (int): Neighbours per point.
+        backend (str): "hnsw", "exact" or "auto" (HNSW when hnswlib is installed and n is large).
+
+    Returns:
+        (indices, similarities): Arrays of shape (n, k), most similar first.
+    """
+    k = min(k, X.shape[0] - 1)
+    if backend == "auto":
+        try:
+            import hnswlib  # noqa: F401
+            backend = "hnsw" if X.shape[0] > 5000 else "exact"
+        except ImportError:
+            backend = "exact"
+    if backend == "hnsw":
+        return _knn_hnsw(X, k)
+    return _knn_exact(X, k)
+
+
+def cluster_knn_graph(
+        embeddings: np.ndarray,
+        k: int = 15,
+        threshold: float = 0.6,
+        min_cluster_size: int = 5,
+        backend: str = "auto",
+) -> np.ndarray:
+    """
+    Cluster embeddings as connected components of the thresholded mutual-kNN graph.
+
+    Returns:
+        np.ndarray: Cluster label per row, -1 for noise; clusters are numbered by size.
+    """
+    X = normalize(embeddings)
+    n = X.shape[0]
+    if n < 2:
+        return np.full(n, -1, dtype=np.int64)
+
+    indices, sims = knn_graph(X, k=k, backend=backend)
+    rows = np.repeat(np.arange(n), indices.shape[1])
+    cols = indices.ravel()
+    mask = sims.ravel() >= threshold
+    graph = sparse.csr_matrix((np.ones(mask.sum(), dtype=np.int8), (rows[mask], cols[mask])), shape=(n, n))
+    # Keep only mutual neighbours to avoid chaining through hubs
+    mutual = graph.multiply(graph.T)
+
+    _, components = connected_components(mutual, directed=False)
+    labels = _relabel_by_size(components, min_cluster_size)
+
+    # Attach unclustered points to their nearest clustered neighbour
+    for row in np.flatnonzero(labels == -1):
+        for neighbour, sim in zip(indices[row], sims[row]):
+            if sim < threshold:
+                break
+            if labels[neighbour] != -1:
+                labels[row] = labels[neighbour]
+                break
+    return labels
+
+
+def _relabel_by_size(components: np.ndarray, min_cluster_size: int) -> np.ndarray:
+    ids, counts = np.unique(components, return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    labels = np.full(components.shape[0], -1, dtype=np.int64)
+    next_label = 0
+    for idx in order:
+        if counts[idx] < min_cluster_size:
+            break
+        labels[components == ids[idx]] = next_label
+        next_label += 1
+    return labels
+
+
+def centroids_for(X: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Normalized centroid of every non-noise cluster: (cluster ids, centroid matrix)."""
+    cluster_ids = np.array(sorted(set(labels.tolist()) - {-1}), dtype=np.int64)
+    if not len(cluster_ids):
+        return cluster_ids, np.empty((0, X.shape[1]), dtype=np.float32)
+    centroids = np.stack([X[labels == c].mean(axis=0) for c in cluster_ids])
+    return cluster_ids, normalize(centroids)
+
+
+def assign_to_centroids(
+        X: np.ndarray,
+        cluster_ids: np.ndarray,
+        centroids: np.ndarray,
+        threshold: float,
+) -> np.ndarray:
+    """Label each normalized row with its most similar centroid, or -1 below `threshold`."""
+    labels = np.full(X.shape[0], -1, dtype=np.int64)
+    if not len(cluster_ids):
+        return labels
+    for start in range(0, X.shape[0], BLOCK_SIZE):
+        sims = X[start:start + BLOCK_SIZE] @ centroids.T
+        best = sims.argmax(axis=1)
+        ok = sims[np.arange(len(best)), best] >= threshold
+        labels[start:start + len(best)][ok] = cluster_ids[best[ok]]
+    return labels
+
+
+def cluster_subsample(
+        embeddings: np.ndarray,
+        sample_size: int = 20000,
+        k: int = 15,
+        threshold: float = 0.6,
+        min_cluster_size: int = 5,
+        assign_threshold: Optional[float] = None,
+        backend: str = "auto",
+        random_state: int = 42,
+) -> np.ndarray:
+    """
+    Fit graph clustering on a random sample, then assign every message to the nearest centroid.
+
+    Returns:
+        np.ndarray: Cluster label per row, -1 for noise.
+    """
+    X = normalize(embeddings)
+    n = X.shape[0]
+    if n <= sample_size:
+        return cluster_knn_graph(X, k, threshold, min_cluster_size, backend)
+
+    rng = np.random.default_rng(random_state)
+    sample = np.sort(rng.choice(n, size=sample_size, replace=False))
+    sample_labels = cluster_knn_graph(X[sample], k, threshold, min_cluster_size, backend)
+    cluster_ids, centroids = centroids_for(X[sample], sample_labels)
+    logging.info(f"🧩 Subsample clustering: {len(cluster_ids)} clusters from {sample_size} of {n} messages")
+    return assign_to_centroids(X, cluster_ids, centroids, threshold if assign_threshold is None else assign_threshold)
@@ -0,0 +1,209 @@
+"""
+Incremental reading of large JSON message files.
+
+Message lists are parsed one element at a time instead of with a single `json.load`,
+so memory is bounded by one batch of records rather than by the file size. Two layouts
+are recognised:
+
+- the downloader's format: a top-level list of message dicts
+- the Telegram Desktop export (result.json): an object whose "messages" list holds
+  messages in Desktop's format, converted to the downloader's fields on the fly
+
+The optional `ijson` package is used when installed; otherwise a stdlib parser
+decodes the list elements from a sliding buffer.
+"""
+
+import json
+import logging
+from itertools import islice
+from typing import Any, Iterator, List, Optional
+
+READ_SIZE = 1 << 20
+DEFAULT_BATCH_SIZE = 5000
+
+FORMAT_RECORDS = "records"
+FORMAT_TELEGRAM_DESKTOP = "telegram_desktop"
+
+
+class _JsonStream:
+    """Minimal pull parser over a text file: enough to walk into one list and decode its elements."""
+
+    def __init__(self, f, read_size: int = READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.read_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop consumed text so the buffer never holds more than a read or two
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ("" at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Invalid JSON: expected {char!r}, found {found[:1]!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number at the end of the buffer may continue in the next read
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow the buffer geometrically, so a value larger than one read is not re-parsed once per read
+            if not self._fill(max(self.read_size, len(self.buf) - self.pos)):
+                value, self.pos = self.decoder.raw_decode(self.buf, self.pos)
+                return value
+
+    def items(self) -> Iterator[Any]:
+        """Elements of the list starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Invalid JSON: expected ',' or ']' in list, found {char!r}")
+
+    def find_key(self, key: str) -> bool:
+        """Move into the top-level object up to the value of `key`; False if it has no such key."""
+        self.expect("{")
+        while True:
+            char = self.peek()
+            if char == "}":
+                return False
+            if char == ",":
+                self.pos += 1
+                continue
+            name = self.value()
+            self.expect(":")
+            if name == key:
+                return True
+            self.value()
+
+
+def detect_format(path: str) -> str:
+    """FORMAT_RECORDS for a list of messages, FORMAT_TELEGRAM_DESKTOP for a Desktop export."""
+    with open(path, "r", encoding="utf-8") as f:
+        first = _JsonStream(f, read_size=4096).peek()
+    if first == "[":
+        return FORMAT_RECORDS
+    if first == "{":
+        return FORMAT_TELEGRAM_DESKTOP
+    raise ValueError(f"Invalid JSON format in {path}: expected a list of messages or a Telegram export")
+
+
+def iter_items(path: str, key: Optional[str] = None) -> Iterator[Any]:
+    """
+    Yield the elements of the top-level list, or of the list under top-level `key`, one by one.
+    """
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, f"{key}.item" if key else "item", use_float=True)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        if key is not None and not stream.find_key(key):
+            return
+        yield from stream.items()
+
+
+def _desktop_text(text: Any) -> str:
+    # Desktop exports split formatted text into a list of strings and {"type", "text"} entities
+    if isinstance(text, str):
+        return text
+    if isinstance(text, list):
+        return "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in text)
+    return ""
+
+
+def _desktop_sender_id(from_id: Any) -> Optional[int]:
+    # "user123", "channel456" -> 123, 456
+    if isinstance(from_id, int):
+        return from_id
+    if isinstance(from_id, str):
+        digits = from_id.lstrip("abcdefghijklmnopqrstuvwxyz")
+        if digits.isdigit():
+            return int(digits)
+    return None
+
+
+def desktop_record(message: dict) -> Optional[dict]:
+    """
+    Convert one message of a Telegram Desktop export to the downloader's record format.
+    Service messages (joins, pins, ...) have no author text and return None.
+    """
+    if not isinstance(message, dict) or message.get("type", "message") != "message":
+        return None
+    return {
+        "id": message.get("id"),
+        "date": message.get("date"),
+        "sender_id": _desktop_sender_id(message.get("from_id")),
+        "sender_username": None,
+        "sender_name": message.get("from"),
+        "text": _desktop_text(message.get("text")).strip(),
+    }
+
+
+def iter_messages(path: str) -> Iterator[dict]:
+    """Yield message records from a downloader JSON file or a Telegram Desktop export."""
+    if detect_format(path) == FORMAT_TELEGRAM_DESKTOP:
+        logging.info(f"📥 Streaming Telegram Desktop export {path}")
+        for message in iter_items(path, key="messages"):
+            record = desktop_record(message)
+            if record is not None:
+                yield record
+        return
+
+    logging.info(f"📥 Streaming message list {path}")
+    for record in iter_items(path):
+        if isinstance(record, dict):
+            yield record
+
+
+def iter_message_batches(path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[dict]]:
+    """Yield message records in lists of at most `batch_size`."""
+    it = iter_messages(path)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,124 @@
+"""
+Russian lemmatization built on pymorphy3.
+
+Chat vocabulary is heavily Zipfian, so each distinct word is parsed once and memoized
+in a bounded per-process LRU cache. Large batches with many unseen words can be spread
+over a process pool.
+
+- TGA_LEMMATIZE: "1" to lemmatize in the frequency and NMF stages by default
+- TGA_LEMMA_CACHE_SIZE: maximum number of memoized words
+- TGA_LEMMA_WORKERS: worker processes for large batches (0 or 1 = in-process)
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from tg_analyst.utils.preprocessing import TOKEN_RE
+
+LEMMATIZE_DEFAULT = os.getenv("TGA_LEMMATIZE", "0") == "1"
+LEMMA_CACHE_SIZE = int(os.getenv("TGA_LEMMA_CACHE_SIZE", "200000"))
+LEMMA_WORKERS = int(os.getenv("TGA_LEMMA_WORKERS", "0"))
+
+# Below this many unseen words a pool costs more than it saves
+MIN_WORDS_FOR_POOL = 20000
+
+_morph = None
+_morph_lock = threading.Lock()
+_memo: "OrderedDict[str, str]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _get_morph():
+    global _morph
+    if _morph is None:
+        with _morph_lock:
+            if _morph is None:
+                import pymorphy3
+                _morph = pymorphy3.MorphAnalyzer()
+    return _morph
+
+
+def _parse_words(words: Sequence[str]) -> List[str]:
+    morph = _get_morph()
+    return [morph.parse(w)[0].normal_form for w in words]
+
+
+def _remember(pairs: Iterable) -> None:
+    with _memo_lock:
+        for word, lemma in pairs:
+            _memo[word] = lemma
+            _memo.move_to_end(word)
+            if len(_memo) > LEMMA_CACHE_SIZE:
+                # Least recently used first
+                _memo.popitem(last=False)
+
+
+def _lookup(words: Iterable[str]) -> Dict[str, str]:
+    """Memoized lemmas of `words`, marking each hit as recently used."""
+    found = {}
+    with _memo_lock:
+        for word in words:
+            lemma = _memo.get(word)
+            if lemma is not None:
+                _memo.move_to_end(word)
+                found[word] = lemma
+    return found
+
+
+def lemmatize_word(word: str) -> str:
+    """Normal form of a single lowercase word."""
+    lemma = _lookup([word]).get(word)
+    if lemma is None:
+        lemma = _parse_words([word])[0]
+        _remember([(word, lemma)])
+    return lemma
+
+
+def _resolve_missing(words: List[str], workers: int) -> Dict[str, str]:
+    if workers > 1 and len(words) >= MIN_WORDS_FOR_POOL:
+        chunk = -(-len(words) // workers)
+        chunks = [words[i:i + chunk] for i in range(0, len(words), chunk)]
+        # Spawned workers do not inherit the parent's threads and locks (the bot runs this off its event loop)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            lemmas = [lemma for part in pool.map(_parse_words, chunks) for lemma in part]
+        logging.info(f"🔤 Lemmatized {len(words)} new words with {workers} workers")
+    else:
+        lemmas = _parse_words(words)
+    resolved = dict(zip(words, lemmas))
+    _remember(resolved.items())
+    return resolved
+
+
+def lemmatize_texts(texts: Sequence[str], workers: Optional[int] = None) -> List[str]:
+    """
+    Lemmatize a batch of texts.
+
+    Each text is tokenized like the frequency engine does and returned as its
+    space-joined lemmas. Only words not yet in the memo cache are parsed.
+
+    Args:
+        texts (Sequence[str]): Raw message texts.
+        workers (int, optional): Worker processes for unseen words (default: TGA_LEMMA_WORKERS).
+
+    Returns:
+        List[str]: Lemmatized texts, aligned with `texts`.
+    """
+    workers = LEMMA_WORKERS if workers is None else workers
+    tokenized = [TOKEN_RE.findall(t.lower()) for t in texts]
+
+    # Lemmas of the batch's distinct words, so a batch larger than the cache never re-parses
+    lemmas = _lookup({w for tokens in tokenized for w in tokens})
+    missing = {w for tokens in tokenized for w in tokens if w not in lemmas}
+    if missing:
+        lemmas.update(_resolve_missing(sorted(missing), workers))
+
+    return [" ".join(lemmas[w] for w in tokens) for tokens in tokenized]
+
+
+def cache_info() -> Dict[str, int]:
+    return {"size": len(_memo), "maxsize": LEMMA_CACHE_SIZE}
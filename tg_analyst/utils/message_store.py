@@ -0,0 +1,193 @@
+import os
+import re
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from tg_analyst.utils.json_loader import save_json, load_json
+from tg_analyst.utils.json_stream import iter_message_batches, iter_messages
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+)
+
+CHATS_DIR = os.path.join(BASE_DIR, "raw", "chats")
+
+MESSAGES_FILE = "messages.json"
+PARQUET_DIR = "messages.parquet"
+CHECKPOINT_FILE = "checkpoint.json"
+
+# "parquet" (columnar, needs pyarrow), "json" (a single JSON file) or "auto" (parquet when pyarrow is installed)
+MESSAGE_FORMAT = os.getenv("TGA_MESSAGE_FORMAT", "auto")
+
+# Messages per Parquet append when importing a JSON file
+IMPORT_BATCH_SIZE = int(os.getenv("TGA_IMPORT_BATCH_SIZE", "50000"))
+
+
+def _resolve_format(fmt: str) -> str:
+    if fmt == "auto":
+        try:
+            import pyarrow  # noqa: F401
+            return "parquet"
+        except ImportError:
+            return "json"
+    if fmt not in ("parquet", "json"):
+        raise ValueError(f"Unknown message store format: {fmt!r}")
+    return fmt
+
+
+def _safe_name(value: Any) -> str:
+    return re.sub(r"[^\w.-]", "_", str(value))
+
+
+class ChatMessageStore:
+    """
+    Local per-chat message store with a download checkpoint.
+
+    Layout: <root>/<chat_id>/ holds every message downloaded so far, either as a
+    month-partitioned Parquet table (messages.parquet/) or as messages.json (sorted by id),
+    and checkpoint.json records the highest message id seen, so the next download only
+    asks Telegram for newer messages (`min_id`).
+
+    `messages_path` is the file or directory to hand to `MessageCorpus.load`. A store
+    switched to Parquet imports an existing messages.json on first use.
+    """
+
+    def __init__(self, chat_id: Any, root: str = CHATS_DIR, fmt: Optional[str] = None):
+        self.chat_id = str(chat_id)
+        self.path = os.path.join(root, _safe_name(chat_id))
+        self.format = _resolve_format(fmt or MESSAGE_FORMAT)
+        self.json_path = os.path.join(self.path, MESSAGES_FILE)
+        self.parquet_path = os.path.join(self.path, PARQUET_DIR)
+        self.messages_path = self.parquet_path if self.format == "parquet" else self.json_path
+        self.checkpoint_path = os.path.join(self.path, CHECKPOINT_FILE)
+        if self.format == "parquet":
+            self._migrate_json()
+
+    @staticmethod
+    def chat_id_for(path: str) -> Optional[str]:
+        """Return the chat id if `path` is a store's messages file or table, otherwise None."""
+        path = os.path.abspath(path)
+        if os.path.basename(path) not in (MESSAGES_FILE, PARQUET_DIR):
+            return None
+        if not os.path.exists(os.path.join(os.path.dirname(path), CHECKPOINT_FILE)):
+            return None
+        return os.path.basename(os.path.dirname(path))
+
+    def _table(self):
+        from tg_analyst.utils.parquet_store import ParquetMessageTable
+        return ParquetMessageTable(self.parquet_path)
+
+    def _migrate_json(self) -> None:
+        if not os.path.exists(self.json_path) or self._table().exists():
+            return
+        added = self._table().import_json(self.json_path)
+        # Kept for reference; the store no longer reads it
+        os.replace(self.json_path, f"{self.json_path}.migrated")
+        logging.info(f"📦 Chat {self.chat_id}: imported {added} messages from JSON into {self.parquet_path}")
+
+    def load_checkpoint(self) -> Dict[str, Any]:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            return load_json(self.checkpoint_path)
+        except Exception:
+            logging.warning(f"⚠️ Unreadable checkpoint for chat {self.chat_id}, starting from scratch.")
+            return {}
+
+    @property
+    def last_id(self) -> Optional[int]:
+        """Highest message id downloaded so far, or None for a fresh chat."""
+        return self.load_checkpoint().get("max_id")
+
+    def fetch_kwargs(self, limit: Optional[int]) -> Dict[str, Any]:
+        """
+        Keyword arguments for Telethon's `iter_messages`.
+
+        A fresh chat fetches the latest `limit` messages; afterwards only messages newer
+        than the checkpoint are fetched, however many there are.
+        """
+        last_id = self.last_id
+        if last_id:
+            return {"min_id": last_id, "limit": None}
+        return {"limit": limit}
+
+    def load(self, columns: Optional[Sequence[str]] = None) -> List[dict]:
+        """Stored messages as dicts; `columns` limits the fields read (Parquet only)."""
+        if self.format == "parquet":
+            return self._table().to_records(columns)
+        if not os.path.exists(self.json_path):
+            return []
+        return load_json(self.json_path)
+
+    def load_corpus(self, columns: Optional[Sequence[str]] = None):
+        """Stored messages as a MessageCorpus, reading only `columns` when given."""
+        from tg_analyst.utils.corpus import MessageCorpus
+        return MessageCorpus.load(self.messages_path, chat_id=self.chat_id, columns=columns)
+
+    def import_json(self, path: str, max_seen_id: Optional[int] = None) -> int:
+        """
+        Add the messages of a JSON file (downloader format or Telegram Desktop export) to the store;
+        returns the number of new messages. Parquet stores take the file in streamed batches.
+        """
+        if self.format != "parquet":
+            messages = [m for m in iter_messages(path) if m.get("id") is not None]
+            return self.append(messages, max_seen_id=max_seen_id)
+
+        added = 0
+        for batch in iter_message_batches(path, IMPORT_BATCH_SIZE):
+            added += self.append([m for m in batch if m.get("id") is not None])
+        if max_seen_id is not None:
+            self.append([], max_seen_id=max_seen_id)
+        return added
+
+    def export_json(self, path: Optional[str] = None) -> str:
+        """Write all stored messages to a JSON file (default: messages.json next to the store)."""
+        path = path or self.json_path
+        save_json(self.load(), path)
+        return path
+
+    def append(self, messages: List[dict], max_seen_id: Optional[int] = None) -> int:
+        """
+        Merge newly downloaded messages into the store and advance the checkpoint.
+
+        Args:
+            messages (List[dict]): New message records (must have an 'id').
+            max_seen_id (int, optional): Highest id seen while downloading, including
+                messages that were filtered out (e.g. without text).
+
+        Returns:
+            int: Number of messages that were not already in the store.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        if self.format == "parquet":
+            table = self._table()
+            added = table.append(messages)
+            count = len(table)
+        else:
+            by_id = {m["id"]: m for m in self.load()}
+            added = sum(1 for m in messages if m["id"] not in by_id)
+            by_id.update({m["id"]: m for m in messages})
+            count = len(by_id)
+
+            if messages:
+                merged = sorted(by_id.values(), key=lambda m: m["id"])
+                save_json(merged, self.json_path)
+
+        ids = [m["id"] for m in messages]
+        if max_seen_id is not None:
+            ids.append(max_seen_id)
+        previous = self.last_id
+        if previous is not None:
+            ids.append(previous)
+
+        save_json({
+            "chat_id": self.chat_id,
+            "max_id": max(ids) if ids else None,
+            "count": count,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }, self.checkpoint_path)
+
+        logging.info(f"💾 Chat {self.chat_id}: {added} new messages, {count} stored, checkpoint at id {max(ids) if ids else None}")
+        return added
@@ -0,0 +1,243 @@
+"""
+Columnar on-disk message table (Parquet, partitioned by month).
+
+Layout: <path>/month=YYYY-MM/part-<seq>-<uid>.parquet (messages without a date go to
+month=unknown). Appends write new part files, so existing data is never rewritten.
+The exception is a message re-downloaded with the same id: its month is rewritten.
+Months with many small parts are compacted into one.
+
+Reads go through `pyarrow.dataset` on a memory-mapped filesystem and can project
+columns, so e.g. the activity plots read only `date` or `sender_name`.
+
+Requires the optional `pyarrow` package.
+"""
+
+import os
+import uuid
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow.fs import LocalFileSystem
+
+from tg_analyst.utils.json_loader import save_json
+from tg_analyst.utils.json_stream import iter_message_batches
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("date", pa.string()),
+    ("sender_id", pa.int64()),
+    ("sender_username", pa.string()),
+    ("sender_name", pa.string()),
+    ("text", pa.string()),
+])
+
+COLUMNS = SCHEMA.names
+
+UNKNOWN_MONTH = "unknown"
+
+# Compact a month once it has more part files than this
+MAX_PARTS_PER_MONTH = 8
+
+_mmap_fs = LocalFileSystem(use_mmap=True)
+
+
+def _read_parts(parts: Sequence[str], columns: Optional[Sequence[str]] = None) -> pa.Table:
+    dataset = ds.dataset(list(parts), format="parquet", schema=SCHEMA, filesystem=_mmap_fs)
+    return dataset.to_table(columns=list(columns) if columns is not None else None)
+
+
+def _month_of(record: dict) -> str:
+    date = record.get("date")
+    if isinstance(date, str) and len(date) >= 7 and date[4] == "-":
+        return date[:7]
+    return UNKNOWN_MONTH
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_table(records: Sequence[dict]) -> pa.Table:
+    columns = {name: [r.get(name) for r in records] for name in COLUMNS}
+    columns["id"] = [_as_int(v) for v in columns["id"]]
+    columns["sender_id"] = [_as_int(v) for v in columns["sender_id"]]
+    for name in ("date", "sender_username", "sender_name", "text"):
+        columns[name] = [v if isinstance(v, str) else None for v in columns[name]]
+    return pa.table(columns, schema=SCHEMA)
+
+
+class ParquetMessageTable:
+    """
+    Message records of one chat stored as month-partitioned Parquet files.
+
+    Args:
+        path (str): Directory of the table.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.path) and any(self._parts())
+
+    def _month_dir(self, month: str) -> str:
+        return os.path.join(self.path, f"month={month}")
+
+    def months(self) -> List[str]:
+        """Stored "YYYY-MM" partitions (and "unknown"), in order."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name[len("month="):] for name in os.listdir(self.path) if name.startswith("month="))
+
+    def _parts(self, month: Optional[str] = None) -> List[str]:
+        parts = []
+        for m in ([month] if month else self.months()):
+            directory = self._month_dir(m)
+            if os.path.isdir(directory):
+                parts.extend(
+                    os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith(".parquet")
+                )
+        return parts
+
+    def _write_part(self, month: str, table: pa.Table) -> str:
+        directory = self._month_dir(month)
+        os.makedirs(directory, exist_ok=True)
+        seq = len([f for f in os.listdir(directory) if f.endswith(".parquet")])
+        path = os.path.join(directory, f"part-{seq:06d}-{uuid.uuid4().hex[:8]}.parquet")
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        return path
+
+    def read(self, columns: Optional[Sequence[str]] = None, months: Optional[Iterable[str]] = None) -> pa.Table:
+        """
+        Read the table (sorted by message id), optionally only some columns or months.
+
+        Args:
+            columns (Sequence[str], optional): Columns to read (default: all).
+            months (Iterable[str], optional): "YYYY-MM" partitions to read (default: all).
+
+        Returns:
+            pyarrow.Table: The requested columns.
+        """
+        columns = list(columns) if columns is not None else list(COLUMNS)
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown message columns: {', '.join(sorted(unknown))}")
+
+        parts = self._parts() if months is None else [p for m in months for p in self._parts(m)]
+        if not parts:
+            return SCHEMA.empty_table().select(columns)
+
+        # id is always read to restore message order, then dropped if not requested
+        read_columns = columns if "id" in columns else ["id", *columns]
+        table = _read_parts(parts, read_columns).sort_by("id")
+        return table.select(columns)
+
+    def ids(self) -> pa.Array:
+        """All stored message ids."""
+        return self.read(["id"]).column("id").combine_chunks()
+
+    def __len__(self) -> int:
+        if not self.exists():
+            return 0
+        return sum(pq.ParquetFile(p).metadata.num_rows for p in self._parts())
+
+    def append(self, records: Sequence[dict]) -> int:
+        """
+        Add message records; a record whose id is already stored replaces the old one.
+
+        Returns:
+            int: Number of records with ids that were not stored before.
+        """
+        if not records:
+            return 0
+
+        # Last record wins for duplicate ids within the batch; records need an id
+        by_id: Dict[int, dict] = {}
+        for record in records:
+            message_id = _as_int(record.get("id"))
+            if message_id is not None:
+                by_id[message_id] = record
+        if len(by_id) < len(records):
+            logging.info(f"ℹ️ {len(records) - len(by_id)} duplicate or id-less records not stored")
+        records = list(by_id.values())
+
+        stored = set(self.ids().to_pylist()) if self.exists() else set()
+        new = [r for r in records if _as_int(r.get("id")) not in stored]
+        updated = [r for r in records if _as_int(r.get("id")) in stored]
+
+        by_month: Dict[str, List[dict]] = {}
+        for record in new:
+            by_month.setdefault(_month_of(record), []).append(record)
+        for month, rows in by_month.items():
+            self._write_part(month, _to_table(rows))
+
+        if updated:
+            self._replace(updated)
+
+        for month in by_month:
+            if len(self._parts(month)) > MAX_PARTS_PER_MONTH:
+                self.compact(month)
+
+        logging.info(f"💾 Parquet table {self.path}: {len(new)} new, {len(updated)} updated messages")
+        return len(new)
+
+    def _replace(self, records: List[dict]) -> None:
+        """Rewrite the months holding stored copies of `records`."""
+        ids = pa.array([_as_int(r.get("id")) for r in records], type=pa.int64())
+        for month in self.months():
+            parts = self._parts(month)
+            if not parts or not pc.any(pc.is_in(_read_parts(parts, ["id"]).column("id"), value_set=ids)).as_py():
+                continue
+            table = _read_parts(parts)
+            hit = pc.is_in(table.column("id"), value_set=ids)
+            kept = table.filter(pc.invert(hit))
+            replacements = [r for r in records if _month_of(r) == month]
+            merged = pa.concat_tables([kept, _to_table(replacements)]) if replacements else kept
+            self._rewrite(month, merged, parts)
+            records = [r for r in records if _month_of(r) != month]
+
+        # Replacements whose date moved them to another month
+        by_month: Dict[str, List[dict]] = {}
+        for record in records:
+            by_month.setdefault(_month_of(record), []).append(record)
+        for month, rows in by_month.items():
+            self._write_part(month, _to_table(rows))
+
+    def _rewrite(self, month: str, table: pa.Table, old_parts: Sequence[str]) -> None:
+        # Write the replacement first, so an interrupted rewrite never loses data
+        self._write_part(month, table.sort_by("id"))
+        for part in old_parts:
+            os.remove(part)
+
+    def compact(self, month: Optional[str] = None) -> None:
+        """Merge the part files of one month (or every month) into a single file."""
+        for m in ([month] if month else self.months()):
+            parts = self._parts(m)
+            if len(parts) > 1:
+                self._rewrite(m, _read_parts(parts), parts)
+                logging.info(f"🗜️ Compacted {len(parts)} parts of {self.path} month {m}")
+
+    def to_records(self, columns: Optional[Sequence[str]] = None) -> List[dict]:
+        """The stored messages as dicts (the downloader's JSON format)."""
+        return self.read(columns).to_pylist()
+
+    def import_json(self, path: str, batch_size: int = 50000) -> int:
+        """
+        Append the messages of a JSON file (downloader format or Telegram Desktop export)
+        in streamed batches; returns the number of new messages.
+        """
+        return sum(self.append(batch) for batch in iter_message_batches(path, batch_size))
+
+    def export_json(self, path: str) -> str:
+        """Write all messages to a JSON file in the downloader's format."""
+        save_json(self.to_records(), path)
+        return path
@@ -1,12 +1,18 @@
 import re
+from typing import List
+
+# Precompiled once; TOKEN_RE is the one tokenizer of preprocess_text, tokenize and the frequency engine
+URL_RE = re.compile(r"http\S+|www\.\S+")
+TOKEN_RE = re.compile(r"\b\w+\b")
+
 
 def preprocess_text(text: str) -> str:
     """
     Clean and normalize input text:
     - Convert to lowercase
     - Remove URLs
-    - Remove emojis and special characters (leave Cyrillic, Latin, digits)
-    - Normalize whitespace
+    - Keep the word tokens of `tokenize` (drops emojis and special characters),
+      joined by single spaces
 
     Args:
         text (str): Raw input string
@@ -17,15 +23,20 @@ def preprocess_text(text: str) -> str:
     if not isinstance(text, str):
         return ""
 
-    text = text.lower()
+    # Remove URLs, then keep the same tokens the frequency engine counts
+    return " ".join(tokenize(URL_RE.sub("", text.lower())))
 
-    # Remove URLs
-    text = re.sub(r"http\S+|www\.\S+", "", text)
 
-    # Remove emojis and non-text symbols (optionally keep !?., if needed)
-    text = re.sub(r"[^\w\sа-яА-Яa-zA-Z0-9]", "", text)
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens (the same tokens used for word frequency).
 
-    # Remove excess whitespace
-    text = re.sub(r"\s+", " ", text).strip()
+    Args:
+        text (str): Raw or preprocessed input string
 
-    return text
+    Returns:
+        List[str]: Word tokens
+    """
+    if not isinstance(text, str):
+        return []
+    return TOKEN_RE.findall(text.lower())
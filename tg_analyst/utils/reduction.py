@@ -0,0 +1,163 @@
+"""
+One dimensionality-reduction pass shared by clustering and plotting.
+
+The kNN graph of the embeddings (the expensive part of UMAP) is computed once and reused
+for two layouts: a 5–15 dimensional one that clustering runs on, and a 2-d one for the
+scatter plot. The "pca" mode replaces UMAP with a single PCA fit for quick previews.
+
+Results are cached next to the chat's embeddings, keyed by the message ids and text hashes
+they were computed for, so re-running an analysis of an unchanged chat costs nothing.
+
+- TGA_REDUCTION_MODE: "umap" (default), "pca" or "none" (cluster the raw embeddings)
+- TGA_REDUCTION_DIMS: dimensions of the clustering layout (default 10)
+"""
+
+import os
+import time
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from tg_analyst.utils.embedding_store import EmbeddingStore, text_hash
+
+REDUCTION_MODE = os.getenv("TGA_REDUCTION_MODE", "umap")
+REDUCTION_DIMS = int(os.getenv("TGA_REDUCTION_DIMS", "10"))
+
+N_NEIGHBORS = 15
+RANDOM_STATE = 42
+
+
+@dataclass
+class Reduction:
+    """
+    Reduced layouts of one set of embeddings.
+
+    Attributes:
+        mode (str): "umap", "pca" or "none".
+        cluster (np.ndarray): Layout clustering runs on, shape (n, dims).
+        display (np.ndarray): 2-d layout for plotting, shape (n, 2).
+        timings (dict): Seconds spent per step ("knn", "cluster", "display", "total").
+        cached (bool): True if the layouts were read from the cache.
+    """
+    mode: str
+    cluster: np.ndarray
+    display: np.ndarray
+    timings: Dict[str, float] = field(default_factory=dict)
+    cached: bool = False
+
+
+def _digest(message_ids: Sequence[Any], texts: Sequence[str]) -> str:
+    h = hashlib.sha1()
+    for message_id, text in zip(message_ids, texts):
+        h.update(f"{message_id}:{text_hash(text)}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _reduce_umap(embeddings: np.ndarray, dims: Optional[int], timings: Dict[str, float]):
+    """UMAP layouts for clustering (skipped when `dims` is None) and display from one kNN graph."""
+    import umap
+    from umap.umap_ import nearest_neighbors
+
+    start = time.perf_counter()
+    n_neighbors = min(N_NEIGHBORS, embeddings.shape[0] - 1)
+    knn = nearest_neighbors(
+        embeddings, n_neighbors=n_neighbors, metric="cosine", metric_kwds=None,
+        angular=False, random_state=RANDOM_STATE,
+    )
+    timings["knn"] = time.perf_counter() - start
+
+    targets = [("display", 2, 0.1)]
+    if dims is not None:
+        # min_dist=0 packs clusters tightly, which suits density-based clustering
+        targets.insert(0, ("cluster", dims, 0.0))
+
+    layouts = {}
+    for name, n_components, min_dist in targets:
+        start = time.perf_counter()
+        reducer = umap.UMAP(
+            n_components=n_components, n_neighbors=n_neighbors, min_dist=min_dist,
+            metric="cosine", random_state=RANDOM_STATE, precomputed_knn=knn,
+        )
+        layouts[name] = reducer.fit_transform(embeddings).astype(np.float32)
+        timings[name] = time.perf_counter() - start
+    return layouts.get("cluster"), layouts["display"]
+
+
+def _reduce_pca(embeddings: np.ndarray, dims: int, timings: Dict[str, float]):
+    from sklearn.decomposition import PCA
+
+    start = time.perf_counter()
+    n_components = min(max(dims, 2), *embeddings.shape)
+    layout = PCA(n_components=n_components, random_state=RANDOM_STATE).fit_transform(embeddings).astype(np.float32)
+    timings["cluster"] = time.perf_counter() - start
+    # The leading components double as the display layout
+    return layout, layout[:, :2]
+
+
+def reduce_embeddings(
+        embeddings: np.ndarray,
+        mode: Optional[str] = None,
+        dims: Optional[int] = None,
+        store: Optional[EmbeddingStore] = None,
+        message_ids: Optional[Sequence[Any]] = None,
+        texts: Optional[Sequence[str]] = None,
+) -> Reduction:
+    """
+    Reduce embeddings once for clustering and display.
+
+    Args:
+        embeddings (np.ndarray): Embedding matrix, one row per message.
+        mode (str, optional): "umap", "pca" or "none" (default: TGA_REDUCTION_MODE).
+        dims (int, optional): Dimensions of the clustering layout (default: TGA_REDUCTION_DIMS).
+        store (EmbeddingStore, optional): Store whose directory holds the cache.
+        message_ids, texts (Sequence, optional): Identify the rows for the cache key.
+
+    Returns:
+        Reduction: Both layouts and the time each step took.
+    """
+    mode = mode or REDUCTION_MODE
+    dims = dims or REDUCTION_DIMS
+    if mode not in ("umap", "pca", "none"):
+        raise ValueError(f"Unknown reduction mode: {mode!r}")
+
+    cache_path = digest = None
+    if store is not None and message_ids is not None and texts is not None:
+        cache_path = os.path.join(store.path, "reductions", f"{mode}_{dims}.npz")
+        digest = _digest(message_ids, texts)
+        if os.path.exists(cache_path):
+            try:
+                with np.load(cache_path) as cached:
+                    if str(cached["digest"]) == digest:
+                        logging.info(f"📦 Reusing cached {mode} reduction from {cache_path}")
+                        cluster = embeddings if mode == "none" else cached["cluster"]
+                        return Reduction(mode, cluster, cached["display"], {"total": 0.0}, cached=True)
+            except Exception as e:
+                logging.warning(f"⚠️ Could not read cached reduction {cache_path}: {e}")
+
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    if mode == "umap":
+        cluster, display = _reduce_umap(embeddings, dims, timings)
+    elif mode == "pca":
+        cluster, display = _reduce_pca(embeddings, dims, timings)
+    else:
+        # Cluster the raw embeddings; the plot still needs a 2-d layout
+        _, display = _reduce_umap(embeddings, None, timings)
+        cluster = embeddings
+    timings["total"] = time.perf_counter() - start
+    logging.info(
+        f"⏱️ {mode} reduction of {embeddings.shape[0]} vectors: "
+        + ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items())
+    )
+
+    if cache_path is not None:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.tmp.npz"
+        layouts = {"display": display} if mode == "none" else {"cluster": cluster, "display": display}
+        np.savez(tmp_path, digest=np.array(digest), **layouts)
+        os.replace(tmp_path, cache_path)
+
+    return Reduction(mode, cluster, display, timings)
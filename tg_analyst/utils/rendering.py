@@ -0,0 +1,291 @@
+"""
+Chart rendering without pyplot.
+
+Analysis stages describe a chart as a `ChartSpec` (plain data), and this module draws it
+with matplotlib's object-oriented API on an Agg canvas. Nothing touches pyplot's global
+state, so charts can be built from any thread. Rendering runs in a small process pool, so
+charts from parallel stages are drawn at the same time. The PNG bytes are cached by
+the hash of the spec and the output profile, so unchanged charts are never drawn twice.
+
+Profiles:
+- "full": report quality
+- "preview": lower DPI for Telegram, where photos are downscaled anyway
+
+- TGA_RENDER_WORKERS: rendering processes (0 = render in the calling process)
+- TGA_CHART_PROFILE: default profile ("full")
+- TGA_PREVIEW_DPI: DPI of the preview profile
+- TGA_CHART_CACHE_MAX_MB: size limit of the PNG cache
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+)
+
+CHART_CACHE_DIR = os.path.join(BASE_DIR, "cache", "charts")
+CHART_CACHE_MAX_MB = float(os.getenv("TGA_CHART_CACHE_MAX_MB", "256"))
+
+RENDER_WORKERS = int(os.getenv("TGA_RENDER_WORKERS", "2"))
+CHART_PROFILE = os.getenv("TGA_CHART_PROFILE", "full")
+
+PROFILES = {
+    "full": 100,
+    "preview": int(os.getenv("TGA_PREVIEW_DPI", "60")),
+}
+
+# Bump when drawing code changes, so cached PNGs are redrawn
+RENDERER_VERSION = "1"
+
+# Uncached renders between full scans of the PNG cache (other processes write to it too)
+PRUNE_EVERY = 100
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Running size of the PNG cache as of the last scan plus this process' writes since
+_cache_bytes: Optional[int] = None
+_writes_since_scan = 0
+_cache_lock = threading.Lock()
+
+
+@dataclass
+class ChartSpec:
+    """
+    Everything needed to draw one chart.
+
+    Attributes:
+        kind (str): "bar" (vertical, labelled ticks), "barh" (horizontal) or "scatter".
+        title, xlabel, ylabel (str): Texts of the chart.
+        labels (Sequence[str]): Bar labels ("bar", "barh").
+        values (Sequence[float]): Bar heights ("bar", "barh").
+        x, y (Sequence[float]): Point coordinates ("scatter").
+        groups (Sequence[int]): Category of each point, -1 drawn grey as noise ("scatter").
+        figsize (tuple): Figure size in inches.
+        style (dict): Colors and tick rotation ("color", "edgecolor", "rotation", "ha").
+    """
+    kind: str
+    title: str = ""
+    xlabel: str = ""
+    ylabel: str = ""
+    labels: Sequence[str] = ()
+    values: Sequence[float] = ()
+    x: Sequence[float] = ()
+    y: Sequence[float] = ()
+    groups: Sequence[int] = ()
+    figsize: Tuple[float, float] = (10, 6)
+    style: Dict[str, Any] = field(default_factory=dict)
+
+    def digest(self, dpi: int) -> str:
+        h = hashlib.sha256(f"{RENDERER_VERSION}|{dpi}|{self.kind}|{self.title}|{self.xlabel}|{self.ylabel}|"
+                           f"{self.figsize}|{sorted(self.style.items())}".encode("utf-8"))
+        h.update("\x1f".join(map(str, self.labels)).encode("utf-8"))
+        for column in (self.values, self.x, self.y, self.groups):
+            h.update(np.ascontiguousarray(column, dtype=np.float64).tobytes())
+            h.update(b"|")
+        return h.hexdigest()
+
+
+def _draw_bar(ax, spec: ChartSpec) -> None:
+    positions = np.arange(len(spec.labels))
+    color = spec.style.get("color")
+    edgecolor = spec.style.get("edgecolor")
+    if spec.kind == "barh":
+        ax.barh(positions, spec.values, color=color, edgecolor=edgecolor)
+        ax.set_yticks(positions)
+        ax.set_yticklabels(spec.labels)
+    else:
+        ax.bar(positions, spec.values, color=color, edgecolor=edgecolor)
+        ax.set_xticks(positions)
+        ax.set_xticklabels(spec.labels, rotation=spec.style.get("rotation", 0), ha=spec.style.get("ha", "center"))
+
+
+def _draw_scatter(ax, spec: ChartSpec) -> None:
+    from matplotlib import colormaps
+
+    x, y = np.asarray(spec.x), np.asarray(spec.y)
+    groups = np.asarray(spec.groups) if len(spec.groups) else np.zeros(len(x), dtype=int)
+    palette = colormaps["tab10"]
+    for i, group in enumerate(sorted(set(groups.tolist()))):
+        mask = groups == group
+        color = "lightgrey" if group == -1 else palette(i % palette.N)
+        ax.scatter(x[mask], y[mask], s=12, color=color, label=str(group), linewidths=0)
+    ax.legend(title="cluster", fontsize="small", markerscale=1.5, loc="best")
+
+
+def draw_png(spec: ChartSpec, dpi: int) -> bytes:
+    """Draw a chart on a private Agg canvas and return the PNG bytes."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=spec.figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    if spec.kind in ("bar", "barh"):
+        _draw_bar(ax, spec)
+    elif spec.kind == "scatter":
+        _draw_scatter(ax, spec)
+    else:
+        raise ValueError(f"Unknown chart kind: {spec.kind!r}")
+
+    ax.set_title(spec.title)
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+    fig.tight_layout()
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    return buffer.getvalue()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if RENDER_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: workers must not inherit threads or locks of the analysis process
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def warm_up() -> None:
+    """Start the rendering processes and import matplotlib in them ahead of the first chart."""
+    pool = _get_pool()
+    spec = ChartSpec("bar", labels=["warm-up"], values=[1], figsize=(1, 1))
+    if pool is None:
+        draw_png(spec, 10)
+        return
+    for future in [pool.submit(draw_png, spec, 10) for _ in range(RENDER_WORKERS)]:
+        future.result()
+
+
+def shutdown() -> None:
+    """Stop the rendering processes (they are started again on the next render)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(CHART_CACHE_DIR, key[:2], f"{key}.png")
+
+
+def _prune_cache(max_mb: float = CHART_CACHE_MAX_MB) -> int:
+    """Delete the least recently used PNGs above `max_mb`; returns the remaining cache size in bytes."""
+    files = []
+    for dirpath, _, filenames in os.walk(CHART_CACHE_DIR):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(f[1] for f in files)
+    for _, size, path in sorted(files):
+        if total <= max_mb * 2 ** 20:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+def _account(size: int) -> None:
+    """
+    Add a new cache entry to the running size and scan the cache only when the limit
+    is exceeded, the size is unknown, or every PRUNE_EVERY writes.
+    """
+    global _cache_bytes, _writes_since_scan
+    with _cache_lock:
+        _writes_since_scan += 1
+        if _cache_bytes is not None:
+            _cache_bytes += size
+            if _cache_bytes <= CHART_CACHE_MAX_MB * 2 ** 20 and _writes_since_scan < PRUNE_EVERY:
+                return
+        _cache_bytes = _prune_cache()
+        _writes_since_scan = 0
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def submit(spec: ChartSpec, output_path: str, profile: Optional[str] = None) -> Future:
+    """
+    Start rendering a chart to `output_path` and return a future that resolves to the path.
+    Cached charts are written immediately.
+    """
+    dpi = PROFILES[profile or CHART_PROFILE]
+    key = spec.digest(dpi)
+    cache_path = _cache_path(key)
+
+    result: Future = Future()
+    try:
+        with open(cache_path, "rb") as f:
+            png = f.read()
+        os.utime(cache_path)
+    except FileNotFoundError:
+        # Not cached, or pruned by another process since; render it
+        pass
+    else:
+        _write(output_path, png)
+        result.set_result(output_path)
+        return result
+
+    def finish(png: bytes) -> None:
+        _write(cache_path, png)
+        _write(output_path, png)
+        _account(len(png))
+
+    pool = _get_pool()
+    if pool is None:
+        finish(draw_png(spec, dpi))
+        result.set_result(output_path)
+        return result
+
+    def done(future: Future) -> None:
+        try:
+            finish(future.result())
+            result.set_result(output_path)
+        except Exception as e:
+            result.set_exception(e)
+
+    pool.submit(draw_png, spec, dpi).add_done_callback(done)
+    return result
+
+
+def render_chart(spec: ChartSpec, output_path: str, profile: Optional[str] = None) -> str:
+    """Render one chart to `output_path` (PNG), reusing the cached image when possible."""
+    start = time.perf_counter()
+    path = submit(spec, output_path, profile).result()
+    logging.info(f"🖼️ Rendered {os.path.basename(output_path)} in {time.perf_counter() - start:.2f}s")
+    return path
+
+
+def render_charts(charts: Dict[str, ChartSpec], profile: Optional[str] = None) -> List[str]:
+    """Render several charts ({output path: spec}) concurrently; returns the written paths."""
+    futures = [submit(spec, path, profile) for path, spec in charts.items()]
+    return [future.result() for future in futures]
@@ -0,0 +1,158 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# (username, display name)
+SenderInfo = Tuple[Optional[str], str]
+
+SENDER_CACHE_SIZE = int(os.getenv("TGA_SENDER_CACHE_SIZE", "10000"))
+SENDER_CACHE_TTL = float(os.getenv("TGA_SENDER_CACHE_TTL", "3600"))
+
+UNKNOWN_SENDER: SenderInfo = (None, "Unknown")
+
+
+def sender_fields(sender: Any) -> SenderInfo:
+    """
+    Extract (username, display name) from a Telethon sender entity.
+    """
+    if sender is None:
+        return UNKNOWN_SENDER
+
+    sender_username = getattr(sender, "username", None)
+    first = (getattr(sender, 'first_name', '') or '').strip()
+    last = (getattr(sender, 'last_name', '') or '').strip()
+
+    if first.lower() == 'none':
+        first = ''
+    if last.lower() == 'none':
+        last = ''
+
+    sender_name = f"{first} {last}".strip() or "Unknown"
+    return sender_username, sender_name
+
+
+class SenderCache:
+    """
+    Thread-safe LRU cache of resolved senders with a per-entry TTL.
+
+    Args:
+        maxsize (int): Maximum number of senders kept.
+        ttl (float): Seconds after which an entry is considered stale.
+    """
+
+    def __init__(self, maxsize: int = SENDER_CACHE_SIZE, ttl: float = SENDER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[int, Tuple[float, SenderInfo]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sender_id: int) -> Optional[SenderInfo]:
+        with self._lock:
+            item = self._data.get(sender_id)
+            if item is None or time.monotonic() - item[0] > self.ttl:
+                if item is not None:
+                    del self._data[sender_id]
+                self.misses += 1
+                return None
+            self._data.move_to_end(sender_id)
+            self.hits += 1
+            return item[1]
+
+    def put(self, sender_id: int, info: SenderInfo) -> None:
+        with self._lock:
+            self._data[sender_id] = (time.monotonic(), info)
+            self._data.move_to_end(sender_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SenderResolver:
+    """
+    Resolves message senders with as few Telegram round trips as possible.
+
+    For a batch of messages the unique sender ids are collected and looked up in order:
+    1. the shared LRU/TTL cache,
+    2. the entity Telethon already attached to the message from the batch response,
+    3. one batched `client.get_entity([...])` call for whatever is still unknown,
+    4. if that batch fails (one id Telegram can't resolve fails the whole list), each sender
+       on its own: `client.get_entity(id)`, then `get_sender()` of one of its messages.
+    Only successful lookups are cached.
+    """
+
+    def __init__(self, cache: Optional[SenderCache] = None):
+        self.cache = cache or SenderCache()
+
+    @staticmethod
+    async def _resolve_one(client: Any, sender_id: int, msg: Any) -> Optional[Any]:
+        """The entity of one sender, or None if neither lookup finds it (e.g. a deleted account)."""
+        try:
+            return await client.get_entity(sender_id)
+        except Exception:
+            pass
+        try:
+            return await msg.get_sender()
+        except Exception as e:
+            logging.warning(f"⚠️ Could not resolve sender {sender_id}: {e}")
+            return None
+
+    async def resolve(self, client: Any, messages: Iterable[Any]) -> Dict[int, SenderInfo]:
+        """
+        Resolve senders for `messages`.
+
+        Args:
+            client: Connected Telethon client.
+            messages (Iterable): Telethon Message objects.
+
+        Returns:
+            Dict[int, SenderInfo]: sender_id -> (username, display name).
+        """
+        resolved: Dict[int, SenderInfo] = {}
+        # sender id -> one of its messages, for the per-sender fallback
+        missing: Dict[int, Any] = {}
+
+        for msg in messages:
+            sender_id = msg.sender_id
+            if sender_id is None or sender_id in resolved:
+                continue
+
+            cached = self.cache.get(sender_id)
+            if cached is not None:
+                resolved[sender_id] = cached
+                continue
+
+            # Telethon fills msg.sender from the users/chats returned with the batch
+            sender = getattr(msg, "sender", None)
+            if sender is not None:
+                resolved[sender_id] = sender_fields(sender)
+                self.cache.put(sender_id, resolved[sender_id])
+            else:
+                resolved[sender_id] = UNKNOWN_SENDER
+                missing[sender_id] = msg
+
+        if missing:
+            sender_ids = list(missing)
+            try:
+                entities = await client.get_entity(sender_ids)
+            except Exception as e:
+                logging.warning(f"⚠️ Batched sender lookup failed for {len(missing)} senders, "
+                                f"resolving them one by one: {e}")
+                entities = [await self._resolve_one(client, sender_id, missing[sender_id]) for sender_id in sender_ids]
+            for sender_id, entity in zip(sender_ids, entities):
+                if entity is not None:
+                    resolved[sender_id] = sender_fields(entity)
+                    self.cache.put(sender_id, resolved[sender_id])
+
+        logging.info(f"👥 Resolved {len(resolved)} senders ({len(missing)} via network lookup)")
+        return resolved
+
+
+# Shared across analyses so popular authors are not looked up again
+resolver = SenderResolver()
@@ -0,0 +1,135 @@
+import os
+import logging
+
+from tg_analyst.utils.corpus import as_corpus
+from tg_analyst.utils.stages.common import results_dir as _results_dir
+from tg_analyst.utils.rendering import ChartSpec, render_chart
+
+
+def plot_message_activity(source, job=None, chart_profile=None):
+    """
+    Plots the number of messages per day using the 'date' field in the dataset.
+    Saves the bar chart to a PNG file.
+    Accepts a JSON path or a loaded MessageCorpus; outputs go to `job`'s workspace if given.
+    `chart_profile` selects the rendering profile, "full" or "preview" (default: TGA_CHART_PROFILE).
+    """
+    import pandas as pd
+
+    try:
+        # Dates are parsed once by the corpus; invalid ones are already dropped
+        dates = as_corpus(source, columns=["date"]).valid_days()
+
+        if not dates:
+            logging.warning("⚠️ No valid dates found in the dataset.")
+            print("⚠️ No valid dates to plot message activity.")
+            return
+
+        df = pd.DataFrame({'date': dates})
+        plot_day_counts(df['date'].value_counts(), job=job, chart_profile=chart_profile)
+
+    except Exception as e:
+        logging.error(f"❌ Failed to plot message activity: {e}")
+        print(f"❌ Error in plot_message_activity: {e}")
+
+
+def plot_day_counts(day_counts, job=None, chart_profile=None):
+    """
+    Plots precomputed message counts per day (a pandas Series or a mapping of date -> count).
+    Shared by plot_message_activity and the single-pass streaming analysis.
+    """
+    import pandas as pd
+
+    try:
+        df_grouped = pd.Series(day_counts, dtype="int64").sort_index()
+
+        if df_grouped.empty:
+            logging.warning("⚠️ Message count per date is empty after grouping.")
+            print("⚠️ No activity to visualize.")
+            return
+
+        # Plot
+        spec = ChartSpec(
+            kind="bar",
+            title="Message Activity by Date",
+            xlabel="Date",
+            ylabel="Message Count",
+            labels=[str(d) for d in df_grouped.index],
+            values=df_grouped.to_numpy(),
+            figsize=(10, 4),
+            style={"color": "skyblue", "edgecolor": "black", "rotation": 45, "ha": "right"},
+        )
+
+        os.makedirs(_results_dir(job), exist_ok=True)
+        output_path = os.path.join(_results_dir(job), 'message_activity.png')
+        render_chart(spec, output_path, chart_profile)
+
+        logging.info(f"📊 Message activity plot saved to {output_path}")
+        print(f"📊 Message activity plot saved to {output_path}")
+
+    except Exception as e:
+        logging.error(f"❌ Failed to plot message activity: {e}")
+        print(f"❌ Error in plot_message_activity: {e}")
+
+
+def plot_user_activity(source, job=None, chart_profile=None):
+    """
+    Plots the number of messages per user using 'sender_name' or 'sender_id'.
+    Saves the bar chart as a PNG image.
+    Accepts a JSON path or a loaded MessageCorpus; outputs go to `job`'s workspace if given.
+    `chart_profile` selects the rendering profile, "full" or "preview" (default: TGA_CHART_PROFILE).
+    """
+    import pandas as pd
+
+    try:
+        corpus = as_corpus(source, columns=["sender_name"])
+
+        if not len(corpus) or not corpus.has_sender_names:
+            logging.warning("⚠️ No sender_name data available.")
+            print("⚠️ Cannot plot user activity — sender_name missing.")
+            return
+
+        user_counts = pd.Series(corpus.sender_names, dtype=object).fillna("Unknown").value_counts()
+        plot_user_counts(user_counts, job=job, chart_profile=chart_profile)
+
+    except Exception as e:
+        logging.error(f"❌ Failed to plot user activity: {e}")
+        print(f"❌ Error in plot_user_activity: {e}")
+
+
+def plot_user_counts(user_counts, job=None, chart_profile=None):
+    """
+    Plots the 15 most active users from precomputed message counts per sender
+    (a pandas Series or a mapping of sender name -> count).
+    """
+    import pandas as pd
+
+    try:
+        user_counts = pd.Series(user_counts, dtype="int64").sort_values(ascending=False, kind="stable").head(15)
+
+        if user_counts.empty:
+            logging.warning("⚠️ No user activity to visualize.")
+            print("⚠️ No user activity data to plot.")
+            return
+
+        # Plot (most active user on top)
+        user_counts = user_counts[::-1]
+        spec = ChartSpec(
+            kind="barh",
+            title="Top 15 Most Active Users",
+            xlabel="Message Count",
+            ylabel="User",
+            labels=[str(name) for name in user_counts.index],
+            values=user_counts.to_numpy(),
+            style={"color": "orange", "edgecolor": "black"},
+        )
+
+        os.makedirs(_results_dir(job), exist_ok=True)
+        output_path = os.path.join(_results_dir(job), 'user_activity.png')
+        render_chart(spec, output_path, chart_profile)
+
+        logging.info(f"📊 User activity plot saved to {output_path}")
+        print(f"📊 User activity plot saved to {output_path}")
+
+    except Exception as e:
+        logging.error(f"❌ Failed to plot user activity: {e}")
+        print(f"❌ Error in plot_user_activity: {e}")
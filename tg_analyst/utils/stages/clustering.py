@@ -0,0 +1,187 @@
+import os
+import logging
+
+from tg_analyst.utils.corpus import as_corpus
+from tg_analyst.utils.stages.common import results_dir as _results_dir
+from tg_analyst.model_registry import DEFAULT_EMBEDDING_MODEL
+
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL
+
+# "hdbscan" (default), "graph" (kNN-graph components) or "sample" (fit on a sample, assign the rest)
+CLUSTER_ENGINE = os.getenv("TGA_CLUSTER_ENGINE", "hdbscan")
+
+
+def cluster_embeddings(embeddings, engine, min_cluster_size, min_samples):
+    """
+    Cluster an embedding matrix with the selected engine.
+
+    Returns:
+        np.ndarray: Cluster label per row, -1 for noise.
+    """
+    if engine == "hdbscan":
+        import hdbscan
+
+        clusterer = hdbscan.HDBSCAN(
+            min_cluster_size=min_cluster_size,
+            min_samples=min_samples,
+            metric='euclidean'
+        )
+        return clusterer.fit_predict(embeddings)
+
+    from tg_analyst.utils import graph_clustering
+
+    # A cluster of one message is not a cluster
+    min_size = max(2, min_cluster_size)
+    if engine == "graph":
+        return graph_clustering.cluster_knn_graph(embeddings, min_cluster_size=min_size)
+    if engine == "sample":
+        return graph_clustering.cluster_subsample(embeddings, min_cluster_size=min_size)
+    raise ValueError(f"Unknown clustering engine: {engine!r}")
+
+
+def _embed(corpus):
+    """Embeddings of the corpus' messages from the per-chat store (only new or edited messages are encoded)."""
+    from tg_analyst.utils.embedding_store import EmbeddingStore
+    from tg_analyst.model_registry import get_embedding_model
+
+    def encode(batch):
+        model = get_embedding_model(EMBEDDING_MODEL)
+        return model.encode(batch, show_progress_bar=True)
+
+    store = EmbeddingStore(corpus.chat_id, EMBEDDING_MODEL)
+    return store, store.get_or_encode(corpus.message_ids, corpus.messages, encode)
+
+
+def _reduction_mode(corpus, reduction, engine, incremental):
+    """
+    The reduction pass clustering `corpus` needs. When clustering runs on the raw embeddings
+    (incremental models, graph engines), UMAP only fits the 2-d display layout ("none").
+    """
+    from tg_analyst.utils.reduction import REDUCTION_MODE
+    from tg_analyst.utils.cluster_model import INCREMENTAL_DEFAULT
+
+    mode = reduction or REDUCTION_MODE
+    incremental = INCREMENTAL_DEFAULT if incremental is None else incremental
+    raw = (engine or CLUSTER_ENGINE) != "hdbscan" or (incremental and corpus.chat_id is not None)
+    return "none" if raw and mode == "umap" else mode
+
+
+def embed_messages(source, job=None, reduction=None, engine=None, incremental=None, reduce=True):
+    """
+    Fill the embedding store and the reduction cache for a corpus without clustering it.
+    Lets the pipeline encode messages in parallel with the other stages;
+    `cluster_with_embeddings` then reads both from the caches. Writes nothing to `job`.
+    `engine` and `incremental` must match the clustering stage's, so that only the layouts
+    it uses are computed; `reduce=False` only fills the embedding store.
+    """
+    from tg_analyst.utils.reduction import reduce_embeddings
+
+    corpus = as_corpus(source)
+    if len(corpus.messages) < 10:
+        logging.warning("⚠️ Not enough messages to embed. Skipping.")
+        return
+    store, embeddings = _embed(corpus)
+    if reduce:
+        reduce_embeddings(embeddings, mode=_reduction_mode(corpus, reduction, engine, incremental), store=store,
+                          message_ids=corpus.message_ids, texts=corpus.messages)
+
+
+def cluster_with_embeddings(source, job=None, engine=None, incremental=None, reduction=None, chart_profile=None):
+    """
+    Cluster messages using sentence embeddings + HDBSCAN, save labels and UMAP plot.
+    Automatically adjusts clustering sensitivity based on number of messages.
+    Accepts a JSON path or a loaded MessageCorpus; outputs go to `job`'s workspace if given.
+    Embeddings are read from the per-chat embedding store; only new or edited messages are encoded.
+    `engine` selects "hdbscan", "graph" or "sample" clustering (default: TGA_CLUSTER_ENGINE).
+    With `incremental` (default: TGA_CLUSTER_INCREMENTAL) the fitted model is persisted per chat
+    and later runs only assign new messages, refitting when they no longer fit the model.
+    `reduction` selects the shared reduction pass, "umap", "pca" or "none" (default: TGA_REDUCTION_MODE).
+    `chart_profile` selects the plot's rendering profile, "full" or "preview" (default: TGA_CHART_PROFILE).
+    """
+    import pandas as pd
+
+    from tg_analyst.utils.rendering import ChartSpec, render_chart
+
+    from tg_analyst.utils.reduction import reduce_embeddings
+    from tg_analyst.utils.cluster_model import ClusterModel, INCREMENTAL_DEFAULT
+
+    try:
+        corpus = as_corpus(source)
+        texts = corpus.messages
+
+        total_messages = len(texts)
+        if total_messages < 10:
+            logging.warning(f"⚠️ Not enough messages for clustering (found {total_messages}). Skipping.")
+            print(f"⚠️ Not enough messages for clustering (need ≥10, found {total_messages}).")
+            return
+
+        # Auto-tune parameters
+        if total_messages < 100:
+            min_cluster_size = 1
+            min_samples = 1
+        elif total_messages < 300:
+            min_cluster_size = 2
+            min_samples = 1
+        else:
+            min_cluster_size = 3
+            min_samples = 2
+
+        engine = engine or CLUSTER_ENGINE
+        logging.info(f"Using {engine} clustering with min_cluster_size={min_cluster_size}, min_samples={min_samples}")
+        print(f"🔧 Clustering params: engine={engine}, min_cluster_size={min_cluster_size}, min_samples={min_samples}")
+
+        # Embedding (cached on disk by chat, message id, text hash and model)
+        store, embeddings = _embed(corpus)
+
+        # One reduction pass (cached with the embeddings) for clustering and the plot
+        incremental = INCREMENTAL_DEFAULT if incremental is None else incremental
+        mode = _reduction_mode(corpus, reduction, engine, incremental)
+        reduced = reduce_embeddings(embeddings, mode=mode, store=store, message_ids=corpus.message_ids, texts=texts)
+        print(f"⏱️ {reduced.mode} reduction: {reduced.timings['total']:.1f}s{' (cached)' if reduced.cached else ''}")
+
+        # Clustering
+        if incremental and corpus.chat_id is not None:
+            # Reduced layouts are refitted whenever the chat changes, so the persisted
+            # model works in the stable embedding space
+            model, model_path = ClusterModel.load_or_create(corpus.chat_id, engine, min_cluster_size, min_samples)
+            labels, refitted = model.update(corpus.message_ids, texts, embeddings)
+            model.save(model_path)
+            print(f"🧩 Clusters {'refitted' if refitted else 'updated incrementally'} ({model.refits} fits so far)")
+        else:
+            # The graph engines threshold cosine similarities, which only mean something in embedding space
+            space = reduced.cluster if engine == "hdbscan" else embeddings
+            labels = cluster_embeddings(space, engine, min_cluster_size, min_samples)
+
+        if len(set(labels)) <= 1:
+            logging.warning(f"⚠️ {engine} found only one cluster or marked all as noise.")
+            print("⚠️ Clustering result not meaningful — skipping output.")
+            return
+
+        # Save results
+        df = pd.DataFrame({'text': texts, 'cluster': labels})
+        os.makedirs(_results_dir(job), exist_ok=True)
+        output_csv = os.path.join(_results_dir(job), 'hdbscan_clusters.csv')
+        df.to_csv(output_csv, index=False)
+        logging.info(f"📂 HDBSCAN cluster labels saved to {output_csv}")
+        print(f"📂 Clusters saved to {output_csv}")
+
+        # Visualization of the 2-d layout from the same reduction pass
+        spec = ChartSpec(
+            kind="scatter",
+            title=f"{engine.upper()} Clusters via {'PCA' if reduced.mode == 'pca' else 'UMAP'}",
+            xlabel="x",
+            ylabel="y",
+            x=reduced.display[:, 0],
+            y=reduced.display[:, 1],
+            groups=labels,
+        )
+
+        output_img = os.path.join(_results_dir(job), 'hdbscan_umap.png')
+        render_chart(spec, output_img, chart_profile)
+
+        logging.info(f"📊 HDBSCAN UMAP plot saved to {output_img}")
+        print(f"📊 UMAP plot saved to {output_img}")
+
+    except Exception as e:
+        logging.error(f"❌ Error in cluster_with_embeddings: {e}")
+        print(f"❌ Error in cluster_with_embeddings: {e}")
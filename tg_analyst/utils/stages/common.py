@@ -0,0 +1,11 @@
+import os
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+)
+
+
+def results_dir(job=None):
+    """Output directory of `job`, or the shared results directory when no job is given."""
+    return job.output_dir if job is not None else os.path.join(BASE_DIR, 'results')
@@ -0,0 +1,134 @@
+import os
+import logging
+
+from tg_analyst.utils.corpus import as_corpus
+from tg_analyst.utils.frequency import FrequencyCounter, stopwords_local
+from tg_analyst.utils.lemmatizer import LEMMATIZE_DEFAULT
+from tg_analyst.utils.stages.common import results_dir as _results_dir
+from tg_analyst.utils.rendering import ChartSpec, render_chart
+
+
+def analyze_messages(source, job=None, breakdowns=False, lemmatize=None, chart_profile=None):
+    """
+    Analyze Telegram messages and save the top frequent words (and word pairs) to CSV and a plot.
+
+    Parameters:
+    - source (str | MessageCorpus): Path to the input JSON file with messages, or an already loaded corpus.
+    - job (JobContext, optional): Job whose workspace receives the outputs.
+    - breakdowns (bool): Also count words per sender and per day.
+    - lemmatize (bool, optional): Count lemmas instead of word forms (default: TGA_LEMMATIZE).
+    - chart_profile (str, optional): Rendering profile of the plot, "full" or "preview".
+
+    Returns:
+    - FrequencyCounter | None: The counts, or None if there was nothing to count.
+    """
+    corpus = as_corpus(source)
+    logging.info(f"🔍 Starting word frequency analysis for: {corpus.source}")
+
+    messages = corpus.messages
+
+    if not messages:
+        logging.warning("⚠️ No valid messages with text found for frequency analysis.")
+        print("⚠️ No messages with valid text for frequency analysis.")
+        return
+
+    # Tokenize and count in batches, without building the full token list
+    transform = None
+    if LEMMATIZE_DEFAULT if lemmatize is None else lemmatize:
+        from tg_analyst.utils.lemmatizer import lemmatize_texts
+        transform = lemmatize_texts
+
+    counter = FrequencyCounter(stopwords_local, bigrams=True, breakdowns=breakdowns).update_corpus(
+        corpus, transform=transform
+    )
+
+    return save_frequency(counter, job=job, chart_profile=chart_profile)
+
+
+def save_frequency(counter, job=None, chart_profile=None):
+    """
+    Save the top words and word pairs of a FrequencyCounter to CSV and plot the top words.
+
+    Parameters:
+    - counter (FrequencyCounter): Counts of one chat.
+    - job (JobContext, optional): Job whose workspace receives the outputs.
+    - chart_profile (str, optional): Rendering profile of the plot, "full" or "preview".
+
+    Returns:
+    - FrequencyCounter | None: The counts, or None if there was nothing to save.
+    """
+    import pandas as pd
+
+    if not counter.words:
+        logging.warning("⚠️ No valid words found after removing stopwords.")
+        print("⚠️ No valid words found after removing stopwords.")
+        return
+
+    # Filter words
+    word_counts = counter.counts_above(1)
+
+    if not word_counts:
+        logging.warning("⚠️ No words with frequency > 1 found.")
+        print("⚠️ No words with frequency > 1 found.")
+        return
+
+    # Prepare and save top words
+    top_words = word_counts.most_common(20)
+    os.makedirs(_results_dir(job), exist_ok=True)
+    df = pd.DataFrame(top_words, columns=['word', 'count'])
+    df.to_csv(os.path.join(_results_dir(job), 'word_frequency.csv'), index=False)
+
+    top_bigrams = counter.top_bigrams(20, min_count=2)
+    if top_bigrams:
+        pd.DataFrame(top_bigrams, columns=['bigram', 'count']).to_csv(
+            os.path.join(_results_dir(job), 'word_bigrams.csv'), index=False
+        )
+
+    logging.info("✅ Top frequent words saved to word_frequency.csv")
+    print('✅ Word frequency saved to data/results/word_frequency.csv')
+
+    # Plot result
+    plot_top_words(word_counts, job=job, chart_profile=chart_profile)
+
+    return counter
+
+
+def plot_top_words(word_counts, job=None, chart_profile=None):
+    """
+    Plot the top 20 most frequent words as a horizontal bar chart
+    and save the plot as an image.
+
+    Parameters:
+    - word_counts (Counter): A Counter object with word frequencies.
+    - job (JobContext, optional): Job whose workspace receives the plot.
+    - chart_profile (str, optional): Rendering profile, "full" or "preview" (default: TGA_CHART_PROFILE).
+    """
+
+    # Extract the 20 most frequent words
+    top_words = word_counts.most_common(20)
+    
+    if not top_words:
+        logging.warning("Not enough data to generate a plot of top words.")
+        print("⚠️ Not enough data to plot top words.")
+        return
+
+    # Separate words and their counts
+    words, counts = zip(*top_words)
+
+    # Create a bar chart
+    spec = ChartSpec(
+        kind="bar",
+        title='Top 20 Frequent Words',
+        xlabel='Words',
+        ylabel='Count',
+        labels=words,
+        values=counts,
+        style={"rotation": 45, "ha": "right"},
+    )
+
+    # Save plot to file
+    output_path = os.path.join(_results_dir(job), 'top_words.png')
+    render_chart(spec, output_path, chart_profile)
+
+    logging.info(f"Word frequency chart saved to {output_path}")
+    print(f"📊 Plot saved to {output_path}")
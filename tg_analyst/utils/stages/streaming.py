@@ -0,0 +1,107 @@
+import os
+import logging
+from collections import Counter
+
+from tg_analyst.utils.corpus import MessageCorpus
+from tg_analyst.utils.frequency import FrequencyCounter, stopwords_local
+from tg_analyst.metrics import METRICS_FILE, JobMetrics
+from tg_analyst.utils.json_stream import iter_message_batches
+from tg_analyst.utils.lemmatizer import LEMMATIZE_DEFAULT
+from tg_analyst.utils.stages.activity import plot_day_counts, plot_user_counts
+from tg_analyst.utils.stages.frequency import save_frequency
+from tg_analyst.utils.stages.topics import save_streaming_topics
+
+# Messages parsed, counted and fed to the topic model at a time
+STREAM_BATCH_SIZE = int(os.getenv("TGA_STREAM_BATCH_SIZE", "5000"))
+
+
+def analyze_export_stream(path, job=None, chat_id=None, batch_size=None, n_topics=10, n_words=10,
+                          lemmatize=None, chart_profile=None):
+    """
+    Analyze a JSON export of any size in one pass, holding a single batch of messages at a time.
+
+    The messages are read incrementally (downloader JSON or a Telegram Desktop result.json) and
+    each batch feeds the word counts, the per-day and per-sender activity counts and a streaming
+    NMF topic model. The outputs are the same files the frequency, activity and topic stages write,
+    plus metrics.json with the cost of the pass and of each output.
+    Clustering needs every embedding at once and is not part of the streaming pass.
+
+    Parameters:
+    - path (str): JSON file with a list of messages, or a Telegram Desktop result.json.
+    - job (JobContext, optional): Job whose workspace receives the outputs.
+    - chat_id (str, optional): Chat whose persisted topic model is refined (default: a fresh model).
+    - batch_size (int, optional): Messages per batch (default: TGA_STREAM_BATCH_SIZE).
+    - n_topics, n_words (int): Topic model size and words listed per topic.
+    - lemmatize (bool, optional): Count and model lemmas instead of word forms (default: TGA_LEMMATIZE).
+    - chart_profile (str, optional): Rendering profile of the plots, "full" or "preview".
+
+    Returns:
+    - dict: Number of messages read and of messages with text.
+    """
+    from tg_analyst.utils.streaming_topics import StreamingTopicModel
+
+    logging.info(f"🌊 Streaming analysis of {path}")
+    if LEMMATIZE_DEFAULT if lemmatize is None else lemmatize:
+        from tg_analyst.utils.lemmatizer import lemmatize_texts
+        transform = lemmatize_texts
+    else:
+        transform = None
+
+    counter = FrequencyCounter(stopwords_local, bigrams=True)
+    day_counts = Counter()
+    user_counts = Counter()
+    has_sender_names = False
+    model, model_path = StreamingTopicModel.load_or_create(chat_id, n_topics)
+    last_id = model.last_message_id
+    max_id = last_id
+    total = consumed = 0
+    metrics = JobMetrics(job.job_id if job is not None else None)
+
+    with metrics.stage("stream") as record:
+        for records in iter_message_batches(path, batch_size or STREAM_BATCH_SIZE):
+            # A columnar view of one batch: the same parsing and filtering as the in-memory stages
+            batch = MessageCorpus.from_records(records, source=path, chat_id=chat_id)
+            total += len(batch)
+            day_counts.update(batch.valid_days())
+            if batch.has_sender_names:
+                has_sender_names = True
+                user_counts.update(name if name is not None else "Unknown" for name in batch.sender_names)
+
+            texts = batch.messages
+            if not texts:
+                continue
+            if transform is not None:
+                texts = transform(texts)
+            counter.update(texts)
+
+            new_texts = [
+                text for message_id, text in zip(batch.message_ids, texts)
+                if last_id is None or message_id is None or message_id > last_id
+            ]
+            consumed += model.partial_fit(new_texts)
+            known_ids = [i for i in batch.message_ids if i is not None]
+            if known_ids:
+                max_id = max(known_ids + ([max_id] if max_id is not None else []))
+        record["items"] = total
+
+    logging.info(f"🌊 Streamed {total} messages ({counter.messages} with text) from {path}")
+    print(f"🌊 Streamed {total} messages from {path}")
+
+    with metrics.stage("frequency", counter.messages):
+        save_frequency(counter, job=job, chart_profile=chart_profile)
+    with metrics.stage("activity", total):
+        plot_day_counts(day_counts, job=job, chart_profile=chart_profile)
+        if has_sender_names:
+            plot_user_counts(user_counts, job=job, chart_profile=chart_profile)
+        else:
+            logging.warning("⚠️ No sender_name data available.")
+
+    # Texts held back until NMF can start are read again on the next run
+    if model.fitted:
+        model.last_message_id = max_id
+    with metrics.stage("topics", consumed):
+        save_streaming_topics(model, model_path, consumed, n_words, job)
+    if job is not None:
+        metrics.write(job.path(METRICS_FILE))
+
+    return {"messages": total, "with_text": counter.messages}
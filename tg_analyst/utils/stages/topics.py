@@ -0,0 +1,147 @@
+import os
+import logging
+from itertools import islice
+
+from tg_analyst.utils.corpus import as_corpus
+from tg_analyst.utils.stages.common import results_dir as _results_dir
+from tg_analyst.utils.lemmatizer import LEMMATIZE_DEFAULT
+
+# "batch" (in-memory TF-IDF + NMF), "streaming" (hashed TF-IDF + MiniBatchNMF, persisted per chat)
+# or "auto" (streaming above STREAMING_THRESHOLD messages)
+TOPIC_MODE = os.getenv("TGA_TOPIC_MODE", "auto")
+STREAMING_THRESHOLD = int(os.getenv("TGA_TOPIC_STREAMING_THRESHOLD", "100000"))
+
+
+def _write_topics(topic_words, job=None):
+    os.makedirs(_results_dir(job), exist_ok=True)
+    output_path = os.path.join(_results_dir(job), 'nmf_topics.txt')
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        for topic_idx, words in enumerate(topic_words):
+            f.write(f"Topic {topic_idx + 1}: {' '.join(words)}\n")
+
+    logging.info(f"✅ NMF topic summary saved to {output_path}")
+    print(f"🧠 NMF topics saved to {output_path}")
+
+
+def topic_modeling_nmf(source, n_topics=10, n_words=10, job=None, lemmatize=None, mode=None):
+    """
+    Perform topic modeling using TF-IDF + NMF and save topic summary.
+    Skips if too few messages or sparse vocabulary.
+    Accepts a JSON path or a loaded MessageCorpus; outputs go to `job`'s workspace if given.
+    With `lemmatize` (default: TGA_LEMMATIZE) texts are reduced to lemmas before TF-IDF.
+    `mode` selects "batch", "streaming" or "auto" (default: TGA_TOPIC_MODE).
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.decomposition import NMF
+    from nltk.corpus import stopwords
+
+    try:
+        corpus = as_corpus(source)
+        texts = corpus.messages
+
+        if len(texts) < 10:
+            logging.warning(f"⚠️ Not enough messages for NMF topic modeling (found {len(texts)}). Skipping.")
+            print(f"⚠️ Not enough messages for NMF topic modeling (need ≥10, found {len(texts)}).")
+            return
+
+        mode = mode or TOPIC_MODE
+        if mode == "streaming" or (mode == "auto" and len(texts) > STREAMING_THRESHOLD):
+            _topic_modeling_streaming(corpus, n_topics, n_words, job, lemmatize)
+            return
+
+        if LEMMATIZE_DEFAULT if lemmatize is None else lemmatize:
+            from tg_analyst.utils.lemmatizer import lemmatize_texts
+            logging.info("🔤 Lemmatizing texts for NMF...")
+            texts = lemmatize_texts(texts)
+
+        # Use Russian stopwords from NLTK
+        stop_words = stopwords.words("russian")
+
+        logging.info("📐 Vectorizing texts with TF-IDF...")
+        tfidf = TfidfVectorizer(max_df=0.95, min_df=2, stop_words=stop_words)
+        tfidf_matrix = tfidf.fit_transform(texts)
+
+        if tfidf_matrix.shape[0] == 0 or tfidf_matrix.shape[1] == 0:
+            logging.warning("⚠️ TF-IDF matrix is empty after vectorization. Skipping NMF.")
+            print("⚠️ TF-IDF matrix is empty — no suitable vocabulary. Skipping NMF.")
+            return
+
+        if tfidf_matrix.shape[0] < n_topics:
+            n_topics = max(2, tfidf_matrix.shape[0] // 2)
+            logging.info(f"ℹ️ Adjusted n_topics to {n_topics} due to small number of documents.")
+
+        logging.info(f"🧠 Fitting NMF with n_topics={n_topics}...")
+        nmf = NMF(n_components=n_topics, random_state=42)
+        W = nmf.fit_transform(tfidf_matrix)
+        H = nmf.components_
+
+        feature_names = tfidf.get_feature_names_out()
+        _write_topics(
+            [[feature_names[i] for i in topic.argsort()[:-n_words - 1:-1]] for topic in H],
+            job=job
+        )
+
+    except Exception as e:
+        logging.error(f"❌ Error in topic_modeling_nmf: {e}")
+        print(f"❌ Error in topic_modeling_nmf: {e}")
+
+
+def _topic_modeling_streaming(corpus, n_topics, n_words, job, lemmatize):
+    """
+    Streaming variant of topic_modeling_nmf: refines the chat's persisted model with
+    messages newer than the last one it has seen, in bounded memory.
+    """
+    from tg_analyst.utils.streaming_topics import StreamingTopicModel
+
+    model, path = StreamingTopicModel.load_or_create(corpus.chat_id, n_topics)
+    last_id = model.last_message_id
+
+    new_ids = []
+
+    def new_texts():
+        for message_id, text in zip(corpus.message_ids, corpus.messages):
+            if last_id is None or message_id is None or message_id > last_id:
+                new_ids.append(message_id)
+                yield text
+
+    texts = new_texts()
+    if LEMMATIZE_DEFAULT if lemmatize is None else lemmatize:
+        from tg_analyst.utils.lemmatizer import lemmatize_texts
+
+        def lemmatized(texts):
+            # One batched lemmatize_texts call per model chunk keeps the stream lazy
+            while True:
+                batch = list(islice(texts, model.chunk_size))
+                if not batch:
+                    return
+                yield from lemmatize_texts(batch)
+
+        texts = lemmatized(texts)
+
+    logging.info(f"🧠 Streaming NMF for chat {corpus.chat_id} (last seen message id: {last_id})...")
+    consumed = model.partial_fit(texts)
+    known_ids = [i for i in new_ids if i is not None]
+    # Texts held back until NMF can start are read again on the next run
+    if known_ids and model.fitted:
+        model.last_message_id = max(known_ids + ([last_id] if last_id is not None else []))
+
+    save_streaming_topics(model, path, consumed, n_words, job)
+
+
+def save_streaming_topics(model, path, consumed, n_words=10, job=None):
+    """
+    Persist a refined StreamingTopicModel (if it has a `path`) and write its topic summary.
+    `consumed` is the number of texts the last refinement took in.
+    """
+    topic_words = model.topics(n_words)
+    if not topic_words:
+        logging.warning("⚠️ Streaming NMF has not seen enough documents yet. Skipping.")
+        print("⚠️ Not enough documents for streaming NMF yet.")
+        return
+
+    if path is not None and consumed:
+        model.save(path)
+
+    logging.info(f"🧠 Streaming NMF refined with {consumed} new messages")
+    _write_topics(topic_words, job=job)
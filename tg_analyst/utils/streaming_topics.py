@@ -0,0 +1,194 @@
+"""
+Out-of-core topic modeling: hashed TF-IDF + MiniBatchNMF fitted with `partial_fit`.
+
+Texts are consumed from any iterator in fixed-size chunks, so memory stays bounded by
+the chunk size and the hashing space regardless of corpus size. The fitted model is
+persisted per chat; later runs feed only messages newer than the last one seen, which
+refines the existing topics instead of re-fitting from scratch.
+"""
+
+import os
+import re
+import logging
+from collections import Counter
+from itertools import islice
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import joblib
+from scipy import sparse
+from sklearn.decomposition import MiniBatchNMF
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.utils import murmurhash3_32
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+)
+
+TOPIC_MODELS_DIR = os.path.join(BASE_DIR, "models", "topics")
+
+N_FEATURES = 2 ** 18
+CHUNK_SIZE = 5000
+
+
+def _safe_name(value: Any) -> str:
+    return re.sub(r"[^\w.-]", "_", str(value))
+
+
+def _russian_stopwords() -> List[str]:
+    try:
+        from nltk.corpus import stopwords
+        return stopwords.words("russian")
+    except LookupError:
+        from tg_analyst.utils.frequency import stopwords_local
+        logging.warning("⚠️ NLTK stopwords not downloaded, using the built-in list.")
+        return sorted(stopwords_local)
+
+
+class StreamingTopicModel:
+    """
+    Incrementally trained NMF topic model over hashed term counts.
+
+    Hashing has no vocabulary, so for naming topics the model remembers the most
+    frequent term seen in each hash bucket (at most `n_features` entries).
+
+    Args:
+        n_topics (int): Number of topics.
+        n_features (int): Size of the hashing space.
+        chunk_size (int): Texts per `partial_fit` step.
+    """
+
+    def __init__(self, n_topics: int = 10, n_features: int = N_FEATURES, chunk_size: int = CHUNK_SIZE):
+        self.n_topics = n_topics
+        self.n_features = n_features
+        self.chunk_size = chunk_size
+        self.stop_words = _russian_stopwords()
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        self.n_docs = 0
+        self.bucket_terms: dict = {}
+        self.last_message_id: Optional[int] = None
+        self.nmf = MiniBatchNMF(n_components=n_topics, batch_size=min(1024, chunk_size), random_state=42)
+        self._fitted = False
+        # Texts waiting for enough documents to start NMF (not yet counted or consumed)
+        self._pending: List[str] = []
+
+    @property
+    def fitted(self) -> bool:
+        """True once NMF has been started; texts given before that are still pending."""
+        return self._fitted
+
+    def _vectorizer(self) -> HashingVectorizer:
+        return HashingVectorizer(
+            n_features=self.n_features, alternate_sign=False, norm=None, stop_words=self.stop_words
+        )
+
+    def _remember_terms(self, texts: Sequence[str], analyzer) -> None:
+        counts = Counter(term for text in texts for term in analyzer(text))
+        for term, count in counts.items():
+            bucket = abs(murmurhash3_32(term, seed=0)) % self.n_features
+            current = self.bucket_terms.get(bucket)
+            if current is None or current[0] == term:
+                self.bucket_terms[bucket] = (term, (current[1] if current else 0) + count)
+            elif count > current[1]:
+                self.bucket_terms[bucket] = (term, count)
+
+    def _tfidf(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        idf = np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1
+        X = counts.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ X
+
+    def partial_fit(self, texts: Iterable[str]) -> int:
+        """
+        Refine the model with texts from an iterator, one chunk at a time.
+
+        Until NMF has been started, texts are held back (across calls) until there are at
+        least `n_topics` of them; held-back texts are neither counted nor consumed.
+
+        Returns:
+            int: Number of texts consumed, including held-back texts of earlier calls.
+        """
+        vectorizer = self._vectorizer()
+        analyzer = vectorizer.build_analyzer()
+        it = iter(texts)
+        consumed = 0
+
+        while True:
+            raw = list(islice(it, self.chunk_size))
+            if not raw:
+                break
+            # A slice of only empty texts (e.g. nothing left after lemmatizing) is skipped, not the end
+            chunk = [t for t in raw if t]
+            if not chunk:
+                continue
+            if not self._fitted:
+                # The first fit needs at least n_topics documents to initialize NMF
+                self._pending.extend(chunk)
+                if len(self._pending) < self.n_topics:
+                    continue
+                chunk, self._pending = self._pending, []
+            counts = vectorizer.transform(chunk)
+            self.doc_freq += np.bincount(counts.indices, minlength=self.n_features)
+            self.n_docs += counts.shape[0]
+            self._remember_terms(chunk, analyzer)
+
+            X = self._tfidf(counts)
+            self.nmf.partial_fit(X)
+            self._fitted = True
+            consumed += len(chunk)
+            logging.info(f"🧠 Streaming NMF: {self.n_docs} documents seen")
+
+        return consumed
+
+    def topics(self, n_words: int = 10) -> List[List[str]]:
+        """Top terms of each topic (buckets without a remembered term are skipped)."""
+        if not self._fitted:
+            return []
+        result = []
+        for component in self.nmf.components_:
+            words = []
+            for bucket in component.argsort()[::-1]:
+                if component[bucket] <= 0:
+                    break
+                term = self.bucket_terms.get(int(bucket))
+                if term is not None:
+                    words.append(term[0])
+                if len(words) == n_words:
+                    break
+            result.append(words)
+        return result
+
+    @staticmethod
+    def path_for(chat_id: Any, root: str = TOPIC_MODELS_DIR) -> str:
+        return os.path.join(root, f"{_safe_name(chat_id)}.joblib")
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        joblib.dump(self, tmp_path, compress=3)
+        os.replace(tmp_path, path)
+        logging.info(f"💾 Streaming topic model saved to {path}")
+
+    @classmethod
+    def load_or_create(cls, chat_id: Optional[Any], n_topics: int) -> Tuple["StreamingTopicModel", Optional[str]]:
+        """
+        Load the persisted model for `chat_id`, or create a new one.
+
+        Returns:
+            (model, path): `path` is None when the chat is unknown and nothing is persisted.
+        """
+        if chat_id is None:
+            return cls(n_topics=n_topics), None
+
+        path = cls.path_for(chat_id)
+        if os.path.exists(path):
+            try:
+                model = joblib.load(path)
+                if isinstance(model, cls) and model.n_topics == n_topics:
+                    return model, path
+                logging.info(f"♻️ Topic model for chat {chat_id} has different settings, starting a new one.")
+            except Exception as e:
+                logging.warning(f"⚠️ Could not load topic model {path}, starting a new one: {e}")
+        return cls(n_topics=n_topics), path
@@ -0,0 +1,196 @@
+"""
+Worker processes for the analysis job queue (see tg_analyst/job_queue.py).
+
+    python -m tg_analyst.worker [--workers N] [--once]
+
+Each worker process claims one job at a time, runs it in the job's workspace and records
+its progress messages and result in the queue, where the bot picks them up. While a job
+runs, a heartbeat renews its lease. If a worker is killed, another one takes the job over
+once the lease expires. It reopens the same workspace, and the pipeline skips the stages
+the job's checkpoint records as finished.
+
+Jobs raising an exception are marked failed and not retried; only interrupted jobs are.
+
+- TGA_QUEUE_WORKERS: worker processes started (default: half the CPU cores)
+- TGA_QUEUE_POLL_SECONDS: pause between polls of an empty queue
+
+Idle workers also prune delivered jobs past the queue's retention (TGA_QUEUE_RETENTION_HOURS).
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import importlib
+import threading
+import multiprocessing
+from typing import Any, Dict, List
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(BASE_DIR)
+os.environ.setdefault("TGANALYST_BASE_DIR", BASE_DIR)
+# The bot's data directory (see bot_main.py): both processes must see the same queue, chat stores and caches
+os.environ.setdefault("TGA_OUTPUT_DIR", os.path.join(BASE_DIR, "tg_bot", "data"))
+
+from tg_analyst.job import JobContext
+from tg_analyst.job_queue import JobQueue, LEASE_SECONDS
+
+WORKERS = int(os.getenv("TGA_QUEUE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+POLL_SECONDS = float(os.getenv("TGA_QUEUE_POLL_SECONDS", "2"))
+HEARTBEAT_SECONDS = max(1.0, LEASE_SECONDS / 4)
+PRUNE_SECONDS = 3600
+
+LOGS_DIR = os.path.join(BASE_DIR, "tg_bot", "logs")
+
+
+def _setup_logging() -> None:
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    logging.basicConfig(
+        filename=os.path.join(LOGS_DIR, "worker.log"),
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - [worker %(process)d] %(message)s",
+        encoding="utf-8"
+    )
+
+
+def _warm_up() -> None:
+    # Load the models once per worker instead of in the first job
+    if os.getenv("TGA_WARM_UP_MODELS", "1") == "0":
+        return
+    from tg_analyst.model_registry import warm_up
+    try:
+        warm_up()
+    except Exception as e:
+        logging.error(f"❌ Model warm-up failed in worker: {e}")
+    from tg_analyst.utils import rendering
+    try:
+        rendering.warm_up()
+    except Exception as e:
+        logging.error(f"❌ Chart renderer warm-up failed in worker: {e}")
+
+
+def run_job(queue: JobQueue, job: Dict[str, Any], worker_id: str) -> None:
+    """Run one claimed job, keeping its lease alive, and record the outcome in the queue."""
+    job_id = job["id"]
+    kwargs = dict(job["kwargs"])
+    context = JobContext.open(job_id, chat_id=kwargs.get("chat_id"))
+
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                queue.heartbeat(worker_id, job_id)
+            except Exception as e:
+                logging.warning(f"⚠️ Heartbeat for job {job_id} failed: {e}")
+
+    def progress(text: str) -> None:
+        queue.add_event(job_id, text)
+
+    beat = threading.Thread(target=heartbeat, name=f"heartbeat-{job_id}", daemon=True)
+    beat.start()
+    started = time.perf_counter()
+    logging.info(f"🏃 Worker {worker_id} running job {job_id} ({job['fn']}, attempt {job['attempts']})")
+    try:
+        if job["attempts"] > 1:
+            progress("🔁 Resuming the analysis after an interruption...")
+        module, _, name = job["fn"].partition(":")
+        fn = getattr(importlib.import_module(module), name)
+        with context.hold():
+            result = fn(**kwargs, job=context, progress=progress)
+        if queue.finish(job_id, result, worker_id):
+            logging.info(f"✅ Job {job_id} finished in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        logging.exception(f"❌ Job {job_id} failed:")
+        queue.fail(job_id, f"{type(e).__name__}: {e}", worker_id)
+    finally:
+        stop.set()
+        beat.join()
+
+
+def worker_loop(once: bool = False) -> None:
+    """
+    Claim and run jobs until interrupted.
+
+    Args:
+        once (bool): Return as soon as the queue is empty instead of polling.
+    """
+    _setup_logging()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue()
+    queue.heartbeat(worker_id)
+    _warm_up()
+    logging.info(f"👷 Worker {worker_id} waiting for jobs in {queue.path}")
+
+    pruned = 0.0
+    try:
+        while True:
+            queue.heartbeat(worker_id)
+            job = queue.claim(worker_id)
+            if job is None:
+                if time.monotonic() - pruned > PRUNE_SECONDS:
+                    queue.prune()
+                    pruned = time.monotonic()
+                if once:
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+            run_job(queue, job, worker_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.remove_worker(worker_id)
+        logging.info(f"👋 Worker {worker_id} stopped")
+
+
+def start_workers(count: int, once: bool = False) -> List[multiprocessing.Process]:
+    """Start `count` worker processes (spawned, so they don't inherit the caller's threads and clients)."""
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=worker_loop, args=(once,), name=f"worker-{i}") for i in range(count)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def stop_workers(processes: List[multiprocessing.Process], timeout: float = 10, interrupt: bool = False) -> None:
+    """
+    Wait for workers to leave; terminate those that don't. Their jobs are resumed later.
+
+    Args:
+        interrupt (bool): Send SIGINT first (when the workers did not get the terminal's Ctrl+C).
+    """
+    if interrupt:
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+    for process in processes:
+        process.join(timeout=timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run analysis jobs queued by the Telegram bot.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes to start")
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    args = parser.parse_args(argv)
+
+    if args.workers <= 1:
+        worker_loop(args.once)
+        return
+
+    processes = start_workers(args.workers, args.once)
+    print(f"👷 Started {len(processes)} workers, logging to {os.path.join(LOGS_DIR, 'worker.log')}")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_workers(processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+The bot's side of the analysis job queue: enqueueing analyses and delivering their
+progress messages and results.
+
+With the queue on, the bot never analyses a chat itself. It downloads the chat's new
+messages with its own Telegram client (the only one using the session) and enqueues a job
+for the worker processes (`python -m tg_analyst.worker`), which analyse the stored
+messages. A delivery loop then forwards the job's progress messages to every user
+waiting for it. When the job finishes, the loop stores
+the result in the result cache and sends it. Delivery state lives in the queue database,
+so a restarted bot delivers whatever finished while it was down.
+
+The bot starts TGA_BOT_WORKERS worker processes itself, so a plain `python bot_main.py`
+processes what it enqueues. Set it to 0 when the workers run separately (other hosts,
+their own service). A user whose job finds no live worker is told it will wait.
+
+- TGA_JOB_QUEUE: "0" to run analyses inside the bot process instead (the executor pool)
+- TGA_BOT_WORKERS: worker processes started with the bot (default: TGA_QUEUE_WORKERS)
+- TGA_DELIVERY_POLL_SECONDS: pause between polls of the queue
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.enums import ParseMode
+
+from tg_analyst.job_queue import JobQueue, DONE, FAILED
+from tg_analyst.worker import WORKERS
+from tg_bot.metrics_server import observe_job
+from tg_bot.result_cache import CachedResult, result_cache
+from tg_bot.user_state import user_states
+from tg_bot.utils.formatting import format_report_md
+
+JOB_QUEUE_ENABLED = os.getenv("TGA_JOB_QUEUE", "1") != "0"
+BOT_WORKERS = int(os.getenv("TGA_BOT_WORKERS", str(WORKERS)))
+DELIVERY_POLL_SECONDS = float(os.getenv("TGA_DELIVERY_POLL_SECONDS", "1"))
+
+# Queue job run by the workers for a chat link
+ANALYSIS_JOB = "tg_bot.logic:analyze_chat_job"
+
+job_queue = JobQueue()
+
+menu_kb = ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text="📊 User Activity"),
+            KeyboardButton(text="📝 Message Activity"),
+            KeyboardButton(text="🔄 Restart Analysis"),
+        ]
+    ],
+    resize_keyboard=True
+)
+
+FAILURE_TEXT = "⚠️ Failed to generate the report. Please try again later."
+
+
+async def send_result(bot, chat_id: int, user_id: int, cached: CachedResult) -> None:
+    """Sends a cached analysis to a user and shows the menu for its charts."""
+    with open(cached.report_path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    formatted_content = format_report_md(content)
+
+    chunks = [formatted_content[i:i + 4000] for i in range(0, len(formatted_content), 4000)]
+    for chunk in chunks:
+        await bot.send_message(chat_id, chunk, parse_mode=ParseMode.MARKDOWN_V2)
+
+    await asyncio.to_thread(user_states.__setitem__, user_id, {
+        "status": "ready",
+        "user_activity_path": cached.user_activity_path,
+        "message_activity_path": cached.message_activity_path
+    })
+
+    await bot.send_message(chat_id, "Choose an option:", reply_markup=menu_kb)
+
+
+def chat_job_key(chat_id: Any) -> str:
+    """Dedup key of the analysis job of a chat."""
+    return f"chat:{chat_id}"
+
+
+def enqueue_analysis(url: str, chat_id: Any, subscriber: Tuple[int, int]) -> Tuple[str, bool, Dict[str, Any]]:
+    """
+    Queue the analysis of a chat, or attach `subscriber` to the job already analysing it.
+    The chat's messages must already be in its message store (`update_chat_store`).
+
+    Args:
+        url (str): Link or @username the user sent.
+        chat_id: Chat id the link resolved to (jobs for the same chat are shared).
+        subscriber (tuple): (Telegram chat id, user id) the result is delivered to.
+
+    Returns:
+        tuple: (job id, True if a new job was created, where the job stands (`JobQueue.progress`))
+    """
+    job_id, created = job_queue.enqueue(
+        ANALYSIS_JOB, {"url": url, "chat_id": chat_id},
+        dedup_key=chat_job_key(chat_id), subscriber=subscriber,
+    )
+    return job_id, created, job_queue.progress(job_id)
+
+
+async def _send(bot, chat_id: int, text: str) -> None:
+    try:
+        await bot.send_message(chat_id, text)
+    except Exception as e:
+        # A user who blocked the bot must not stall delivery to everyone else
+        logging.warning(f"⚠️ Failed to deliver message to {chat_id}: {e}")
+
+
+async def _deliver_outcome(bot, job: Dict[str, Any]) -> None:
+    cached: Optional[CachedResult] = None
+    result = job.get("result")
+    if job["status"] == DONE and result:
+        observe_job(result.get("output_dir"))
+        cached = await asyncio.to_thread(
+            result_cache.put, result["chat_id"], result.get("last_message_id"), result["output_dir"],
+            refs=[job["kwargs"]["url"]],
+        )
+    elif job["status"] == FAILED:
+        logging.warning(f"⚠️ Job {job['id']} failed: {job.get('error')}")
+
+    for subscriber in job["subscribers"]:
+        if cached is None:
+            await _send(bot, subscriber["chat_id"], FAILURE_TEXT)
+            continue
+        try:
+            await send_result(bot, subscriber["chat_id"], subscriber["user_id"], cached)
+        except Exception as e:
+            logging.warning(f"⚠️ Failed to deliver result of job {job['id']} to {subscriber['chat_id']}: {e}")
+
+
+async def deliver_once(bot) -> int:
+    """Forward new progress messages and finished results; returns the number of jobs handled."""
+    jobs = await asyncio.to_thread(job_queue.undelivered)
+    for job in jobs:
+        for event in job["events"]:
+            for subscriber in job["subscribers"]:
+                await _send(bot, subscriber["chat_id"], event["text"])
+        last_seq = job["events"][-1]["seq"] if job["events"] else None
+        final = job["status"] in (DONE, FAILED)
+        if final:
+            await _deliver_outcome(bot, job)
+        await asyncio.to_thread(job_queue.mark_delivered, job["id"], last_seq, final)
+    return len(jobs)
+
+
+async def delivery_loop(bot, poll: float = DELIVERY_POLL_SECONDS) -> None:
+    """Deliver queued job updates until cancelled."""
+    logging.info(f"📬 Delivering analysis results from {job_queue.path}")
+    while True:
+        try:
+            await deliver_once(bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception("❌ Delivering job updates failed:")
+        await asyncio.sleep(poll)
@@ -0,0 +1,193 @@
+"""
+Runs CPU-bound analysis jobs in a process pool so the aiogram event loop stays responsive.
+
+- TGA_MAX_WORKERS: number of worker processes (default: half the CPU cores)
+- TGA_MAX_CONCURRENT_JOBS: jobs running at once across all users; the rest wait in a queue
+- TGA_MAX_JOBS_PER_USER: jobs a single user may have in flight
+"""
+
+import os
+import queue
+import asyncio
+import logging
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+MAX_WORKERS = int(os.getenv("TGA_MAX_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+MAX_CONCURRENT_JOBS = int(os.getenv("TGA_MAX_CONCURRENT_JOBS", str(MAX_WORKERS)))
+MAX_JOBS_PER_USER = int(os.getenv("TGA_MAX_JOBS_PER_USER", "1"))
+
+ProgressCallback = Callable[[str], Awaitable[Any]]
+
+
+class JobLimitExceeded(Exception):
+    """Raised when a user already has the maximum number of jobs in flight."""
+
+
+def _init_worker(log_path: Optional[str], warm_up_models: bool) -> None:
+    # Spawned workers don't inherit the bot's logging configuration
+    if log_path:
+        logging.basicConfig(
+            filename=log_path,
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - [worker %(process)d] %(message)s",
+            encoding="utf-8"
+        )
+    if warm_up_models:
+        from tg_analyst.model_registry import warm_up
+        try:
+            warm_up()
+        except Exception as e:
+            logging.error(f"❌ Model warm-up failed in worker: {e}")
+        from tg_analyst.utils import rendering
+        try:
+            rendering.warm_up()
+        except Exception as e:
+            logging.error(f"❌ Chart renderer warm-up failed in worker: {e}")
+
+
+def _run_job(fn: Callable, progress_queue: Any, args: tuple, kwargs: dict) -> Any:
+    """Worker-side wrapper: runs `fn` with a progress callback that feeds the parent's queue."""
+    return fn(*args, progress=progress_queue.put, **kwargs)
+
+
+def _worker_stats() -> dict:
+    from tg_analyst.model_registry import registry
+    return {"pid": os.getpid(), "models": registry.stats()}
+
+
+class AnalysisExecutor:
+    """
+    Process pool plus a small job queue with global and per-user concurrency limits.
+
+    Usage from a handler:
+
+        async with analysis_executor.user_slot(user_id):
+            result = await analysis_executor.submit(fn, *args, on_progress=message.answer)
+    """
+
+    def __init__(
+            self,
+            max_workers: int = MAX_WORKERS,
+            max_concurrent: int = MAX_CONCURRENT_JOBS,
+            max_per_user: int = MAX_JOBS_PER_USER,
+    ):
+        self.max_workers = max_workers
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._user_jobs = defaultdict(int)
+        self.waiting = 0
+        self.running = 0
+
+    def _ensure_started(self) -> None:
+        if self._pool is not None:
+            return
+        log_path = next(
+            (h.baseFilename for h in logging.getLogger().handlers if isinstance(h, logging.FileHandler)), None
+        )
+        context = multiprocessing.get_context("spawn")
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(log_path, os.getenv("TGA_WARM_UP_MODELS", "1") != "0"),
+        )
+        self._manager = context.Manager()
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        logging.info(
+            f"⚙️ Analysis executor started: {self.max_workers} workers, "
+            f"{self.max_concurrent} concurrent jobs, {self.max_per_user} per user"
+        )
+
+    async def warm_up(self) -> list:
+        """Start every worker process (loading models in each) ahead of the first request."""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        tasks = [loop.run_in_executor(self._pool, _worker_stats) for _ in range(self.max_workers)]
+        return await asyncio.gather(*tasks)
+
+    @asynccontextmanager
+    async def user_slot(self, user_id: Any):
+        """Reserve one of the user's job slots for the duration of the block."""
+        if self._user_jobs[user_id] >= self.max_per_user:
+            raise JobLimitExceeded(f"user {user_id} already has {self._user_jobs[user_id]} job(s) running")
+        self._user_jobs[user_id] += 1
+        try:
+            yield
+        finally:
+            self._user_jobs[user_id] -= 1
+            if self._user_jobs[user_id] <= 0:
+                del self._user_jobs[user_id]
+
+    async def submit(
+            self,
+            fn: Callable,
+            *args: Any,
+            on_progress: Optional[ProgressCallback] = None,
+            **kwargs: Any,
+    ) -> Any:
+        """
+        Run `fn(*args, progress=..., **kwargs)` in a worker process and await its result.
+        `fn` must be a picklable module-level function accepting a `progress` callback;
+        its progress messages are forwarded to `on_progress` on the event loop.
+        """
+        self._ensure_started()
+
+        async def notify(text: str) -> None:
+            if on_progress is None:
+                return
+            try:
+                await on_progress(text)
+            except Exception as e:
+                logging.warning(f"⚠️ Failed to deliver progress message: {e}")
+
+        if self._slots.locked():
+            await notify(f"🕒 All workers are busy, your analysis is queued (position {self.waiting + 1}).")
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            progress_queue = self._manager.Queue()
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool, _run_job, fn, progress_queue, args, kwargs)
+
+            while not future.done():
+                try:
+                    text = await asyncio.to_thread(progress_queue.get, True, 0.5)
+                except queue.Empty:
+                    continue
+                await notify(text)
+
+            # Flush anything sent right before the job finished
+            while True:
+                try:
+                    await notify(progress_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            return await future
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+
+analysis_executor = AnalysisExecutor()
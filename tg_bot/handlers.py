@@ -1,50 +1,104 @@
 import os
 import sys
+import asyncio
 import logging
 from aiogram import Router
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram.types import Message, ReplyKeyboardRemove
 from aiogram.types import FSInputFile
-from aiogram.enums import ParseMode
 
 BASE_DIR = os.environ.get("TGANALYST_BASE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(BASE_DIR)
 
-from tg_bot.logic import process_chat_analysis
-from tg_bot.utils.formatting import format_report_md
+from tg_bot.logic import process_chat_analysis, resolve_chat, update_chat_store
+from tg_bot.executor import analysis_executor, JobLimitExceeded, MAX_JOBS_PER_USER
+from tg_bot.result_cache import result_cache
+from tg_bot.single_flight import analysis_flights
+from tg_bot.delivery import JOB_QUEUE_ENABLED, chat_job_key, enqueue_analysis, job_queue, send_result
+from tg_bot.user_state import user_states
 
 
 
 router = Router()
 
-menu_kb = ReplyKeyboardMarkup(
-    keyboard=[
-        [
-            KeyboardButton(text="📊 User Activity"),
-            KeyboardButton(text="📝 Message Activity"),
-            KeyboardButton(text="🔄 Restart Analysis"),
-        ]
-    ],
-    resize_keyboard=True
-)
-
-user_states = {}
-
-# Cache for storing results keyed by chat URL
-analysis_cache = {}
-
 # Fake analysis function for testing — returns existing report path without real analysis
-async def fake_process_chat_analysis(url: str) -> str:
+async def fake_process_chat_analysis(url: str, progress=None) -> str:
     base_results = os.path.join(BASE_DIR, "tg_bot", "data", "results")
     return os.path.join(base_results, "final_analysis_gpt.txt")
 
 
+async def _send_result(message: Message, cached) -> None:
+    """Sends a cached analysis to the user and shows the menu for its charts."""
+    await send_result(message.bot, message.chat.id, message.from_user.id, cached)
+
+
+async def _enqueue(message: Message, text: str, chat_id) -> None:
+    """Hands the analysis to the worker processes; the delivery loop sends the result."""
+    user_id = message.from_user.id
+    if await asyncio.to_thread(job_queue.active_jobs, user_id) >= MAX_JOBS_PER_USER:
+        logging.info(f"User {user_id} already has an analysis queued")
+        await message.answer("⏳ Your previous analysis is still running. Please wait for it to finish.")
+        return
+
+    # A job that is queued or running already covers the chat; otherwise fetch its new messages
+    # here, as workers don't talk to Telegram
+    if await asyncio.to_thread(job_queue.active_job, chat_job_key(chat_id)) is None:
+        try:
+            store = await update_chat_store(text, chat_id)
+        except Exception:
+            logging.exception(f"❌ Failed to download {text}:")
+            await message.answer("⚠️ Failed to download the chat. Please try again later.")
+            return
+        if not os.path.exists(store.messages_path):
+            await message.answer("⚠️ No messages with text found in this chat.")
+            return
+
+    job_id, created, progress = await asyncio.to_thread(
+        enqueue_analysis, text, chat_id, (message.chat.id, user_id)
+    )
+    position = progress["position"]
+    if not created:
+        where = f"queued at position {position}" if position else f"running, requested {progress['age']:.0f}s ago"
+        notice = (f"⏳ This chat is already being analysed ({where}, {max(0, progress['waiting'] - 1)} other "
+                  f"request(s) waiting). You will get the same result.")
+        if progress["last_event"]:
+            notice += f"\nLatest status: {progress['last_event']}"
+        await message.answer(notice)
+    elif position > 1:
+        await message.answer(f"🕒 All workers are busy, your analysis is queued (position {position}).")
+    else:
+        await message.answer("⏳ Processing your request... Please wait a moment.")
+    if await asyncio.to_thread(job_queue.live_workers) == 0:
+        logging.warning(f"⚠️ Job {job_id} queued but no analysis worker is running")
+        await message.answer("⚠️ No analysis worker is running right now. Your request is saved and will be "
+                             "processed as soon as one starts.")
+
+
+async def _identify_chat(text: str):
+    """
+    Returns (chat id, id of the newest message) for a link. A link resolved before skips the
+    username lookup. If Telegram can't be reached, falls back to the chat id the link was
+    resolved to before (freshness is then decided by TTL only), or None for a link never
+    resolved: requests are only ever keyed by resolved chat ids, so one chat never runs
+    under both its id and its link.
+    """
+    known_chat_id = await asyncio.to_thread(result_cache.chat_id_for, text)
+    try:
+        chat_id, latest_id = await resolve_chat(text, known_chat_id)
+        if str(chat_id) != known_chat_id:
+            await asyncio.to_thread(result_cache.add_alias, text, chat_id)
+        return chat_id, latest_id
+    except Exception as e:
+        logging.warning(f"⚠️ Could not resolve {text!r}: {e}")
+        return known_chat_id, None
+
+
 @router.message()
 async def universal_handler(message: Message):
     text = message.text.strip()
     logging.info(f"Received message: {text!r} from user {message.from_user.id}")
 
     if text in ["📊 User Activity", "📝 Message Activity", "🔄 Restart Analysis"]:
-        state = user_states.get(message.from_user.id)
+        state = await asyncio.to_thread(user_states.get, message.from_user.id)
         logging.info(f"User state for buttons: {state}")
 
         if not state or state.get("status") != "ready":
@@ -69,68 +123,55 @@ async def universal_handler(message: Message):
 
         elif text == "🔄 Restart Analysis":
             logging.info("Restart pressed, clearing state")
-            user_states.pop(message.from_user.id, None)
+            await asyncio.to_thread(user_states.pop, message.from_user.id, None)
             await message.answer("Send me a new Telegram chat/group link to analyze:", reply_markup=ReplyKeyboardRemove())
 
         return
 
     # If not a button, treat as a link
     if text.startswith("https://t.me/") or text.startswith("@"):
-        # Check cache first
-        if text in analysis_cache:
-            cached = analysis_cache[text]
-            logging.info(f"Using cached results for {text}")
-
-            with open(cached['report_path'], "r", encoding="utf-8") as f:
-                content = f.read()
-
-            chunks = [content[i:i + 4000] for i in range(0, len(content), 4000)]
-            for chunk in chunks:
-                await message.answer(chunk)
-
-            user_states[message.from_user.id] = {
-                "status": "ready",
-                "user_activity_path": cached['user_activity_path'],
-                "message_activity_path": cached['message_activity_path']
-            }
-            await message.answer("Choose an option:", reply_markup=menu_kb)
+        # Same chat, same newest message: serve the stored result without re-analysing
+        chat_id, latest_id = await _identify_chat(text)
+        if chat_id is None:
+            await message.answer("⚠️ Could not find this chat. Check the link or try again later.")
+            return
+        cached = await asyncio.to_thread(result_cache.get, chat_id, latest_id)
+        if cached is not None:
+            logging.info(f"Using cached results for {text} (chat {chat_id})")
+            await _send_result(message, cached)
+            return
+
+        if JOB_QUEUE_ENABLED:
+            await _enqueue(message, text, chat_id)
             return
 
         await message.answer("⏳ Processing your request... Please wait a moment.")
 
-        try:
+        async def analyse(progress):
             # For real use uncomment below and comment fake function call
-            # report_path = await process_chat_analysis(text)
-            report_path = await fake_process_chat_analysis(text)  # test with fake
-
-            if report_path and os.path.exists(report_path):
-                results_dir = os.path.join(BASE_DIR, "tg_bot", "data", "results")
-                cached_paths = {
-                    'report_path': report_path,
-                    'user_activity_path': os.path.join(results_dir, "user_activity.png"),
-                    'message_activity_path': os.path.join(results_dir, "message_activity.png")
-                }
-                analysis_cache[text] = cached_paths
-
-                with open(report_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-
-                formatted_content = format_report_md(content)
-
-                chunks = [formatted_content[i:i + 4000] for i in range(0, len(formatted_content), 4000)]
-                for chunk in chunks:
-                    await message.answer(chunk, parse_mode=ParseMode.MARKDOWN_V2)
-
-                user_states[message.from_user.id] = {
-                    "status": "ready",
-                    "user_activity_path": cached_paths['user_activity_path'],
-                    "message_activity_path": cached_paths['message_activity_path']
-                }
-
-                await message.answer("Choose an option:", reply_markup=menu_kb)
+            # report_path = await process_chat_analysis(text, progress=progress)
+            report_path = await fake_process_chat_analysis(text, progress=progress)  # test with fake
+            if not report_path or not os.path.exists(report_path):
+                logging.warning(f"No report found at path: {report_path}")
+                return None
+            # Charts live in the same job workspace as the report; the cache keeps copies
+            return await asyncio.to_thread(
+                result_cache.put, chat_id, latest_id, os.path.dirname(report_path), refs=[text]
+            )
+
+        try:
+            async with analysis_executor.user_slot(message.from_user.id):
+                # Requests for a chat that is already being analysed share that job
+                cached = await analysis_flights.run(chat_id, analyse, on_progress=message.answer)
+
+            if cached is not None:
+                await _send_result(message, cached)
             else:
                 await message.answer("⚠️ Failed to generate the report. Please try again later.")
-                logging.warning(f"No report found at path: {report_path}")
+
+        except JobLimitExceeded:
+            logging.info(f"User {message.from_user.id} already has an analysis running")
+            await message.answer("⏳ Your previous analysis is still running. Please wait for it to finish.")
 
         except Exception as e:
             logging.exception("❌ An error occurred during analysis:")
@@ -1,24 +1,115 @@
+import asyncio
 import logging
 import os
 import sys
-from datetime import datetime
+from typing import Optional, Tuple
 from telethon.sync import TelegramClient
 from telethon import TelegramClient as AsyncTelegramClient
 from tg_analyst.config import API_ID, API_HASH, SESSION_NAME
-from tg_analyst.utils.json_loader import save_json
+from tg_analyst.utils.message_store import ChatMessageStore
+from tg_analyst.utils.senders import resolver, UNKNOWN_SENDER
+from tg_analyst.job import JobContext, cleanup_workspaces
 
 BASE_DIR = os.environ.get("TGANALYST_BASE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(BASE_DIR)
 
 from tg_bot.run_analytics import run_analysis_from_group
+from tg_bot.executor import analysis_executor
+from tg_bot.metrics_server import observe_job
+from tg_bot.single_flight import SingleFlight
 
+_client = None
+_client_lock = asyncio.Lock()
 
-async def process_chat_analysis(url: str) -> str:
+
+async def get_telegram_client():
+    """The bot's Telethon client, connected on first use and reused by every request."""
+    global _client
+    async with _client_lock:
+        if _client is None or not _client.is_connected():
+            _client = AsyncTelegramClient(SESSION_NAME, API_ID, API_HASH)
+            await _client.start()
+    return _client
+
+
+async def resolve_chat(url: str, known_chat_id=None) -> Tuple[int, Optional[int]]:
+    """
+    Resolves a link or @username to the chat id and the id of its newest message.
+    One cheap API round trip, used to decide whether a cached result is still fresh.
+
+    With `known_chat_id` (the id the link was resolved to before) the chat is looked up in
+    the session's entity cache, skipping the username resolution, which Telegram rate-limits.
+    """
+    client = await get_telegram_client()
+    entity = None
+    if known_chat_id is not None:
+        try:
+            entity = await client.get_input_entity(int(known_chat_id))
+            chat_id = int(known_chat_id)
+        except (TypeError, ValueError):
+            entity = None
+    if entity is None:
+        resolved = await client.get_entity(url)
+        entity, chat_id = resolved, resolved.id
+    latest = await client.get_messages(entity, limit=1)
+    return chat_id, (latest[0].id if latest else None)
+
+
+async def download_chat(client, url: str, limit: int = 500) -> ChatMessageStore:
+    """
+    Downloads the messages of a chat that are not stored locally yet into its message store.
+
+    Args:
+        client: Connected Telethon client.
+        url (str): Link or @username of the Telegram group/channel
+        limit (int): Number of latest messages fetched on the first download of a chat
+
+    Returns:
+        ChatMessageStore: The chat's store (its `messages_path` is missing if the chat has no text messages).
+    """
+    entity = await client.get_entity(url)
+
+    store = ChatMessageStore(entity.id)
+    fetch_kwargs = store.fetch_kwargs(limit)
+
+    raw_messages = []
+    max_seen_id = None
+    async for msg in client.iter_messages(entity, **fetch_kwargs):
+        max_seen_id = max(max_seen_id or 0, msg.id)
+        if msg.text and msg.sender_id:
+            raw_messages.append(msg)
+
+    # One lookup per unique author (cache / batch entities / single get_entity call)
+    senders = await resolver.resolve(client, raw_messages)
+
+    messages = []
+    for msg in raw_messages:
+        sender_username, sender_name = senders.get(msg.sender_id, UNKNOWN_SENDER)
+        messages.append({
+            "id": msg.id,
+            "date": msg.date.isoformat() if msg.date else None,
+            "sender_id": msg.sender_id,
+            "sender_username": sender_username,
+            "sender_name": sender_name,
+            "text": msg.text.strip()
+        })
+
+    # Append new messages to the chat's store
+    added = store.append(messages, max_seen_id=max_seen_id)
+    logging.info(f"✅ Saved {added} new messages to {store.messages_path}")
+    return store
+
+
+async def process_chat_analysis(url: str, limit: int = 500, progress=None) -> str:
     """
     Joins the Telegram group, downloads messages, and runs the analysis pipeline.
+    Messages are appended to the chat's local store; after the first run only
+    messages newer than the stored checkpoint are downloaded.
     
     Args:
         url (str): Link or @username of the Telegram group/channel
+        limit (int): Number of latest messages fetched on the first download of a chat
+        progress (async Callable[[str], Any], optional): Receives status messages while the job runs
     
     Returns:
         str: Path to the final GPT report file, or None if failed.
@@ -26,49 +117,27 @@ async def process_chat_analysis(url: str) -> str:
     logging.info(f"🚀 Starting chat analysis for: {url}")
 
     try:
-        client = AsyncTelegramClient(SESSION_NAME, API_ID, API_HASH)
-        await client.start()
-        entity = await client.get_entity(url)
-
-        messages = []
-        async for msg in client.iter_messages(entity, limit=500):
-            if msg.text and msg.sender_id:
-                sender = await msg.get_sender()
-                sender_username = getattr(sender, "username", None)
-                first = getattr(sender, 'first_name', '') or ''
-                last = getattr(sender, 'last_name', '') or ''
-
-                first = first.strip()
-                last = last.strip()
-
-                if first.lower() == 'none':
-                    first = ''
-                if last.lower() == 'none':
-                    last = ''
-
-                sender_name = f"{first} {last}".strip() or "Unknown"
-
-                messages.append({
-                    "id": msg.id,
-                    "date": msg.date.isoformat() if msg.date else None,
-                    "sender_id": msg.sender_id,
-                    "sender_username": sender_username,
-                    "sender_name": sender_name,
-                    "text": msg.text.strip()
-                })
-
-        # Save messages
-        raw_dir = os.path.join(BASE_DIR, "tg_bot", "data", "raw")
-        os.makedirs(raw_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        json_path = os.path.join(raw_dir, f"chat_{timestamp}.json")
-        save_json(messages, json_path)
-        logging.info(f"✅ Saved {len(messages)} messages to {json_path}")
-
-        # Run analysis
-        run_analysis_from_group(json_path)
-
-        final_path = os.path.join(BASE_DIR, "tg_bot", "data", "results", "final_analysis_gpt.txt")
+        client = await get_telegram_client()
+        store = await download_chat(client, url, limit)
+        json_path = store.messages_path
+
+        if not os.path.exists(json_path):
+            logging.warning(f"⚠️ No messages with text found in {url}")
+            return None
+
+        # Each run writes to its own workspace; drop workspaces past the retention policy first
+        cleanup_workspaces()
+        job = JobContext.create(chat_id=store.chat_id)
+
+        # Run analysis in a worker process so the bot keeps answering other users;
+        # the workspace is held while the job waits for a worker, too
+        with job.hold():
+            await analysis_executor.submit(
+                run_analysis_from_group, json_path, chat_id=store.chat_id, job=job, on_progress=progress
+            )
+        observe_job(job.output_dir)
+
+        final_path = job.path("final_analysis_gpt.txt")
         if os.path.exists(final_path):
             logging.info(f"📄 Final report found at {final_path}")
             return final_path
@@ -79,3 +148,51 @@ async def process_chat_analysis(url: str) -> str:
     except Exception as e:
         logging.exception("❌ Failed to process chat:")
         return None
+
+
+# Concurrent requests for one chat share its download
+_downloads = SingleFlight()
+
+
+async def update_chat_store(url: str, chat_id, limit: int = 500) -> ChatMessageStore:
+    """
+    Downloads the new messages of a chat with the bot's client before its analysis is queued.
+    Only the bot talks to Telegram (its session can't be shared by the worker processes);
+    workers analyse the chat's stored messages.
+
+    Args:
+        url (str): Link or @username of the Telegram group/channel
+        chat_id: Resolved chat id (concurrent downloads of the same chat are shared)
+        limit (int): Number of latest messages fetched on the first download of a chat
+    """
+    async def download(progress):
+        return await download_chat(await get_telegram_client(), url, limit)
+
+    return await _downloads.run(chat_id, download)
+
+
+def analyze_chat_job(url: str, chat_id=None, limit: Optional[int] = None, job: JobContext = None,
+                     progress=None) -> dict:
+    """
+    Queue job (run by `python -m tg_analyst.worker`): analyzes the stored messages of a chat.
+    The bot downloads them (`update_chat_store`) before it queues the job.
+
+    Args:
+        url (str): Link or @username of the Telegram group/channel
+        chat_id: Chat id the bot resolved the link to
+        limit (int, optional): Unused; accepted for jobs queued by bots that downloaded in the workers
+        job (JobContext): Workspace of the job; reopened with its finished stages when the job is resumed
+        progress (Callable[[str], None], optional): Receives status messages while the job runs
+
+    Returns:
+        dict: "chat_id", "last_message_id" (newest message covered) and "output_dir" of the analysis.
+    """
+    logging.info(f"🚀 Starting queued chat analysis for: {url}")
+    store = ChatMessageStore(chat_id) if chat_id is not None else None
+    if store is None or not os.path.exists(store.messages_path):
+        raise ValueError(f"No stored messages with text for {url}")
+
+    # Drop workspaces past the retention policy, never this job's own
+    cleanup_workspaces(keep=[job.job_id] if job is not None else ())
+    output_dir = run_analysis_from_group(store.messages_path, chat_id=store.chat_id, progress=progress, job=job)
+    return {"chat_id": store.chat_id, "last_message_id": store.last_id, "output_dir": output_dir}
@@ -0,0 +1,125 @@
+"""
+Prometheus metrics of the bot, served as text on a local port (GET /metrics).
+
+- Queue depth: jobs per status in the job queue, live workers, requests waiting for or
+  running in the in-process executor, analyses in flight
+- Stage latency: histograms of the wall time of every pipeline stage and of whole jobs,
+  fed from the metrics.json of each finished job, and the peak RSS seen per stage
+- Cache hit rates: result cache hits and misses, coalesced requests, and stage runs per
+  status ("cached" and "resumed" runs are stage cache and checkpoint hits)
+
+- TGA_METRICS_PORT: port of the endpoint on TGA_METRICS_HOST (0 disables it)
+"""
+
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Optional
+
+from tg_analyst.job_queue import JobQueue
+from tg_analyst.metrics import Histogram, format_metric, load_metrics
+from tg_bot.executor import analysis_executor
+from tg_bot.result_cache import result_cache
+from tg_bot.single_flight import analysis_flights
+
+METRICS_HOST = os.getenv("TGA_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("TGA_METRICS_PORT", "9108"))
+
+stage_seconds = Histogram("tga_stage_duration_seconds", "Wall time of analysis stages.", ("stage",))
+job_seconds = Histogram("tga_job_duration_seconds", "Wall time of analysis jobs.")
+_stage_runs = defaultdict(int)
+_stage_peak_rss = {}
+_jobs_observed = 0
+
+
+def observe_job(output_dir: Optional[str]) -> None:
+    """Add the measurements of a finished job (its metrics.json) to the stage metrics."""
+    global _jobs_observed
+    summary = load_metrics(output_dir) if output_dir else None
+    if summary is None:
+        return
+    _jobs_observed += 1
+    job_seconds.observe(summary.get("wall_seconds") or 0.0)
+    for name, record in summary.get("stages", {}).items():
+        status = record.get("status", "done")
+        _stage_runs[(name, status)] += 1
+        # Restores and resumed stages would drown the real run times
+        if status in ("done", "failed"):
+            stage_seconds.observe(record.get("wall_seconds") or 0.0, name)
+        if record.get("peak_rss_mb") is not None:
+            _stage_peak_rss[(name,)] = record["peak_rss_mb"] * 2 ** 20
+
+
+def render_metrics() -> str:
+    """All bot metrics in the Prometheus text format (touches SQLite; call off the event loop)."""
+    queue = JobQueue()
+    depth = queue.depth()
+    cache = result_cache.stats()
+    lookups = cache["hits"] + cache["misses"]
+    parts = [
+        format_metric("tga_queue_jobs", "gauge", "Jobs in the job queue by status.",
+                      {(status,): depth.get(status, 0) for status in ("queued", "running", "done", "failed")},
+                      ("status",)),
+        format_metric("tga_queue_live_workers", "gauge", "Queue workers with a recent heartbeat.",
+                      {(): queue.live_workers()}),
+        format_metric("tga_executor_jobs", "gauge", "Analyses in the in-process executor.",
+                      {("waiting",): analysis_executor.waiting, ("running",): analysis_executor.running}, ("state",)),
+        format_metric("tga_analyses_in_flight", "gauge", "Chats being analysed for waiting requests.",
+                      {(): analysis_flights.in_flight()}),
+        format_metric("tga_analysis_requests_coalesced_total", "counter",
+                      "Requests that joined an analysis already running.", {(): analysis_flights.coalesced}),
+        format_metric("tga_result_cache_hits_total", "counter", "Requests served from the result cache.",
+                      {(): cache["hits"]}),
+        format_metric("tga_result_cache_misses_total", "counter", "Requests the result cache could not serve.",
+                      {(): cache["misses"]}),
+        format_metric("tga_result_cache_hit_ratio", "gauge", "Result cache hits per lookup since start.",
+                      {(): cache["hits"] / lookups if lookups else 0.0}),
+        format_metric("tga_result_cache_entries", "gauge", "Entries in the result cache.", {(): cache["entries"]}),
+        format_metric("tga_result_cache_size_bytes", "gauge", "Size of the result cache.",
+                      {(): cache["size_mb"] * 2 ** 20}),
+        format_metric("tga_jobs_observed_total", "counter", "Finished jobs whose metrics were collected.",
+                      {(): _jobs_observed}),
+        format_metric("tga_stage_runs_total", "counter", "Stage runs by status (cached/resumed are cache hits).",
+                      dict(_stage_runs), ("stage", "status")),
+        format_metric("tga_stage_peak_rss_bytes", "gauge", "Highest RSS sampled while the stage last ran.",
+                      dict(_stage_peak_rss), ("stage",)),
+        stage_seconds.render(),
+        job_seconds.render(),
+    ]
+    return "".join(parts)
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/metrics", "/"):
+            status, content_type = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+            body = (await asyncio.to_thread(render_metrics)).encode("utf-8")
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except Exception:
+        logging.exception("❌ Serving metrics failed:")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve /metrics in the running event loop; returns the server, or None if disabled or the port is taken."""
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(_handle, host, port)
+    except OSError as e:
+        logging.error(f"❌ Could not serve metrics on {host}:{port}: {e}")
+        return None
+    logging.info(f"📈 Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,264 @@
+"""
+Persistent cache of finished analyses, served to repeat requests without re-running them.
+
+Results are keyed by the resolved chat id, so "@group", "https://t.me/group" and
+"t.me/group" all hit the same entry. Links are mapped to chat ids by an alias table.
+The report and the charts of an entry are copied into a blob directory, because job
+workspaces are removed by their retention policy. An index in SQLite records the id
+of the newest message each entry covers. An entry is only served while no newer
+message exists in the chat.
+
+The cache is bounded. Least recently used entries are evicted once there are more than
+TGA_BOT_CACHE_MAX_ENTRIES or they take more than TGA_BOT_CACHE_MAX_MB. Entries older
+than TGA_BOT_CACHE_TTL_HOURS are never served.
+"""
+
+import os
+import re
+import time
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+)
+
+RESULT_CACHE_DIR = os.getenv("TGA_BOT_CACHE_DIR", os.path.join(BASE_DIR, "cache", "bot_results"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("TGA_BOT_CACHE_MAX_ENTRIES", "200"))
+RESULT_CACHE_MAX_MB = float(os.getenv("TGA_BOT_CACHE_MAX_MB", "512"))
+RESULT_CACHE_TTL_HOURS = float(os.getenv("TGA_BOT_CACHE_TTL_HOURS", "168"))
+
+# Files of a job workspace kept per entry
+REPORT_FILE = "final_analysis_gpt.txt"
+USER_ACTIVITY_FILE = "user_activity.png"
+MESSAGE_ACTIVITY_FILE = "message_activity.png"
+CACHED_FILES = (REPORT_FILE, USER_ACTIVITY_FILE, MESSAGE_ACTIVITY_FILE)
+
+_LINK_RE = re.compile(r"^(?:https?://)?(?:www\.)?(?:t\.me|telegram\.me)/(?:s/)?(?P<name>[^/?#\s]+)", re.IGNORECASE)
+
+
+def normalize_chat_ref(text: str) -> str:
+    """
+    Canonical form of a chat link or username: "@Group", "https://t.me/group",
+    "t.me/s/group/123" -> "group". Invite links keep their "+hash" / "joinchat/hash" form.
+    """
+    text = text.strip()
+    if "joinchat/" in text:
+        return "joinchat/" + text.split("joinchat/", 1)[1].split("?")[0].strip("/")
+    match = _LINK_RE.match(text)
+    name = match.group("name") if match else text.lstrip("@")
+    # Invite hashes are case-sensitive, usernames are not
+    return name if name.startswith("+") else name.lower()
+
+
+@dataclass
+class CachedResult:
+    """A cached analysis: where its files are and which messages it covers."""
+    chat_id: str
+    last_message_id: Optional[int]
+    created: float
+    path: str
+
+    @property
+    def report_path(self) -> str:
+        return os.path.join(self.path, REPORT_FILE)
+
+    @property
+    def user_activity_path(self) -> str:
+        return os.path.join(self.path, USER_ACTIVITY_FILE)
+
+    @property
+    def message_activity_path(self) -> str:
+        return os.path.join(self.path, MESSAGE_ACTIVITY_FILE)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _safe_name(chat_id: str) -> str:
+    return re.sub(r"[^\w.+-]", "_", str(chat_id))
+
+
+class ResultCache:
+    """
+    Bounded on-disk cache of analysis results (SQLite index plus a blob directory).
+
+    Args:
+        root (str): Directory of the cache.
+        max_entries (int): Entries kept at most.
+        max_mb (float): Total size of the blobs kept at most.
+        ttl_hours (float): Age after which an entry is no longer served.
+    """
+
+    def __init__(
+            self,
+            root: str = RESULT_CACHE_DIR,
+            max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+            max_mb: float = RESULT_CACHE_MAX_MB,
+            ttl_hours: float = RESULT_CACHE_TTL_HOURS,
+    ):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_mb = max_mb
+        self.ttl_hours = ttl_hours
+        self.db_path = os.path.join(root, "index.sqlite")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def _db(self):
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    "chat_id TEXT PRIMARY KEY, last_message_id INTEGER, created REAL, accessed REAL, size INTEGER)"
+                )
+                conn.execute("CREATE TABLE IF NOT EXISTS aliases (ref TEXT PRIMARY KEY, chat_id TEXT, updated REAL)")
+                yield conn
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _blob_dir(self, chat_id: str) -> str:
+        return os.path.join(self.root, "blobs", _safe_name(chat_id))
+
+    def add_alias(self, ref: str, chat_id) -> None:
+        """Remember that the link `ref` (see normalize_chat_ref) points to `chat_id`."""
+        with self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO aliases (ref, chat_id, updated) VALUES (?, ?, ?)",
+                (normalize_chat_ref(ref), str(chat_id), time.time()),
+            )
+
+    def chat_id_for(self, ref: str) -> Optional[str]:
+        """Chat id a link was last resolved to, or None."""
+        with self._db() as conn:
+            row = conn.execute("SELECT chat_id FROM aliases WHERE ref = ?", (normalize_chat_ref(ref),)).fetchone()
+        return row[0] if row else None
+
+    def get(self, chat_id, latest_message_id: Optional[int] = None) -> Optional[CachedResult]:
+        """
+        The cached result of a chat if it is still fresh.
+
+        Args:
+            chat_id: Resolved chat id.
+            latest_message_id (int, optional): Id of the newest message in the chat right now.
+                When given, entries that do not cover it are stale. When None, only the TTL applies.
+
+        Returns:
+            CachedResult | None: The entry, or None on a miss.
+        """
+        chat_id = str(chat_id)
+        now = time.time()
+        with self._db() as conn:
+            row = conn.execute(
+                "SELECT last_message_id, created FROM results WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            result = None
+            if row is not None:
+                last_message_id, created = row
+                entry = CachedResult(chat_id, last_message_id, created, self._blob_dir(chat_id))
+                fresh = now - created <= self.ttl_hours * 3600 and (
+                    latest_message_id is None
+                    or (last_message_id is not None and last_message_id >= latest_message_id)
+                )
+                if fresh and os.path.exists(entry.report_path):
+                    conn.execute("UPDATE results SET accessed = ? WHERE chat_id = ?", (now, chat_id))
+                    result = entry
+
+        if result is None:
+            self.misses += 1
+            if row is not None:
+                logging.info(f"♻️ Cached result for chat {chat_id} is stale (covers id {row[0]}, latest {latest_message_id})")
+        else:
+            self.hits += 1
+            logging.info(f"📦 Serving cached result for chat {chat_id} (covers id {result.last_message_id})")
+        return result
+
+    def put(self, chat_id, last_message_id: Optional[int], results_dir: str, refs: Iterable[str] = ()) -> Optional[CachedResult]:
+        """
+        Copy the report and charts of a finished job into the cache and evict old entries.
+
+        Args:
+            chat_id: Resolved chat id.
+            last_message_id (int, optional): Id of the newest message the analysis covers.
+            results_dir (str): Job workspace with the output files.
+            refs (Iterable[str]): Links the chat was requested by, stored as aliases.
+
+        Returns:
+            CachedResult | None: The new entry, or None if the job produced no report.
+        """
+        chat_id = str(chat_id)
+        if not os.path.exists(os.path.join(results_dir, REPORT_FILE)):
+            return None
+
+        # Write the blobs next to the final directory, then swap them in
+        blob_dir = self._blob_dir(chat_id)
+        tmp_dir = f"{blob_dir}.tmp.{os.getpid()}.{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name in CACHED_FILES:
+            source = os.path.join(results_dir, name)
+            if os.path.exists(source):
+                shutil.copy2(source, os.path.join(tmp_dir, name))
+        shutil.rmtree(blob_dir, ignore_errors=True)
+        os.replace(tmp_dir, blob_dir)
+
+        now = time.time()
+        with self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (chat_id, last_message_id, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, last_message_id, now, now, _dir_size(blob_dir)),
+            )
+            for ref in refs:
+                conn.execute(
+                    "INSERT OR REPLACE INTO aliases (ref, chat_id, updated) VALUES (?, ?, ?)",
+                    (normalize_chat_ref(ref), chat_id, now),
+                )
+
+        self.evict()
+        logging.info(f"💾 Cached result for chat {chat_id} (covers id {last_message_id})")
+        return CachedResult(chat_id, last_message_id, now, blob_dir)
+
+    def evict(self) -> int:
+        """Drop least recently used entries beyond the entry and size limits; returns how many."""
+        with self._db() as conn:
+            rows = conn.execute("SELECT chat_id, size FROM results ORDER BY accessed DESC").fetchall()
+            keep, total, evicted = 0, 0, []
+            for chat_id, size in rows:
+                if keep < self.max_entries and total + (size or 0) <= self.max_mb * 2 ** 20:
+                    keep += 1
+                    total += size or 0
+                else:
+                    evicted.append(chat_id)
+            conn.executemany("DELETE FROM results WHERE chat_id = ?", [(c,) for c in evicted])
+
+        for chat_id in evicted:
+            shutil.rmtree(self._blob_dir(chat_id), ignore_errors=True)
+        if evicted:
+            logging.info(f"🧹 Evicted {len(evicted)} cached results")
+        return len(evicted)
+
+    def stats(self) -> Dict[str, float]:
+        with self._db() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"entries": entries, "size_mb": size / 2 ** 20, "hits": self.hits, "misses": self.misses}
+
+
+result_cache = ResultCache()
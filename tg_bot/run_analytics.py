@@ -4,48 +4,52 @@ import logging
 BASE_DIR = os.environ.get("TGANALYST_BASE_DIR", os.path.abspath(os.path.dirname(__file__)))
 os.environ["TGANALYST_BASE_DIR"] = BASE_DIR
 
+# Charts are only sent as Telegram photos, which are downscaled anyway
+BOT_CHART_PROFILE = os.getenv("TGA_BOT_CHART_PROFILE", "preview")
 
-def run_analysis_from_group(json_path: str):
+
+def run_analysis_from_group(json_path: str, chat_id=None, progress=None, job=None):
     """
     Runs the full Telegram chat analysis pipeline on the given JSON file.
 
     Args:
-        json_path (str): Path to the JSON file containing chat messages.
+        json_path (str): Path to the chat messages (JSON file or Parquet message table).
+        chat_id (optional): Telegram chat id, used to key per-chat caches.
+        progress (Callable[[str], None], optional): Called with a short status line before each stage.
+        job (JobContext, optional): Workspace for this run's outputs; a new one is created if omitted.
+
+    Returns:
+        str: The job's output directory.
     """
-    from tg_analyst.utils.analyzer import (
-        analyze_messages, plot_message_activity,
-        plot_user_activity, cluster_with_embeddings,
-        topic_modeling_nmf
-    )
-    from tg_analyst.report_generator import generate_report
-    from tg_analyst import gpt_summary
-    from tg_analyst.utils.json_loader import load_json
-    from tg_analyst.utils import cluster_utils
+    from tg_analyst.utils.corpus import MessageCorpus
+    from tg_analyst.pipeline import build_stages, run_pipeline
+    from tg_analyst.job import JobContext
+    from tg_analyst.metrics import JobMetrics
+
+    if job is None:
+        job = JobContext.create(chat_id=chat_id)
 
     try:
-        data = load_json(json_path)
-        if not data or not isinstance(data, list):
+        # Parse the file once; every stage reads from the same corpus
+        metrics = JobMetrics(job.job_id)
+        with metrics.stage("load") as record:
+            corpus = MessageCorpus.load(json_path, chat_id=chat_id)
+            record["items"] = len(corpus)
+        if not len(corpus):
             raise ValueError("❌ Invalid or empty JSON file")
 
-        logging.info(f"📊 Loaded {len(data)} messages for analysis from {json_path}")
-
-        analyze_messages(json_path)
-        plot_message_activity(json_path)
-        plot_user_activity(json_path)
-        topic_modeling_nmf(json_path)
-        cluster_with_embeddings(json_path)
+        logging.info(f"📊 Loaded {len(corpus)} messages for analysis from {json_path}")
 
-        json_dir = os.path.dirname(json_path)
-        results_dir = os.path.join(os.path.dirname(json_dir), "results")
-        cluster_csv_path = os.path.join(results_dir, "hdbscan_clusters.csv")
-        cluster_summaries_path = os.path.join(results_dir, "cluster_summaries.txt")
-
-        cluster_utils.summarize_clusters(csv_path=cluster_csv_path, output_path=cluster_summaries_path)
-
-        generate_report(results_dir)
-        gpt_summary.main(results_dir=results_dir)
-
-        logging.info("✅ Analysis pipeline completed successfully.")
+        with job.hold():
+            results = run_pipeline(corpus, job, build_stages(chart_profile=BOT_CHART_PROFILE), progress=progress,
+                                   metrics=metrics)
+        failed = [name for name, result in results.items() if result.status == "failed"]
+        if failed:
+            logging.warning(f"⚠️ Analysis pipeline finished with failed stages: {', '.join(failed)} (job {job.job_id})")
+        else:
+            logging.info(f"✅ Analysis pipeline completed successfully (job {job.job_id}).")
 
     except Exception as e:
         logging.exception(f"❌ Failed to run analysis pipeline for {json_path}:")
+
+    return job.output_dir
@@ -0,0 +1,109 @@
+"""
+Single-flight coalescing of analysis requests.
+
+When several users ask for the same chat while its analysis is running, only the first
+request starts a job. The others attach to it and get its progress messages and its
+result. A user who attaches late first gets the latest status of the job and the
+number of users waiting for it.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+ProgressCallback = Callable[[str], Awaitable[Any]]
+
+
+class _Flight:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[ProgressCallback] = []
+        self.last_status: Optional[str] = None
+        self.started = time.monotonic()
+
+
+class SingleFlight:
+    """
+    Runs at most one coroutine per key at a time; concurrent callers with the same key share it.
+
+    Usage from a handler:
+
+        result = await analysis_flights.run(chat_id, lambda progress: analyse(chat, progress),
+                                            on_progress=message.answer)
+    """
+
+    def __init__(self):
+        self._flights: Dict[Any, _Flight] = {}
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def waiters(self, key: Any) -> int:
+        flight = self._flights.get(key)
+        return len(flight.subscribers) if flight is not None else 0
+
+    async def _broadcast(self, flight: _Flight, text: str) -> None:
+        flight.last_status = text
+        for callback in list(flight.subscribers):
+            try:
+                await callback(text)
+            except Exception as e:
+                logging.warning(f"⚠️ Failed to deliver progress message: {e}")
+
+    async def _lead(self, key: Any, flight: _Flight, fn: Callable[[ProgressCallback], Awaitable[Any]]) -> Any:
+        try:
+            return await fn(lambda text: self._broadcast(flight, text))
+        finally:
+            self._flights.pop(key, None)
+            logging.info(f"✈️ Analysis of {key} finished after {time.monotonic() - flight.started:.1f}s "
+                         f"for {len(flight.subscribers)} requester(s)")
+
+    async def run(
+            self,
+            key: Any,
+            fn: Callable[[ProgressCallback], Awaitable[Any]],
+            on_progress: Optional[ProgressCallback] = None,
+    ) -> Any:
+        """
+        Await `fn(progress)` for `key`, starting it only if no call with the same key is running.
+
+        Args:
+            key: Identity of the work, e.g. the resolved chat id.
+            fn: Coroutine function doing the work; its `progress` callback reaches every requester.
+            on_progress (async Callable[[str], Any], optional): Receives this requester's status messages.
+
+        Returns:
+            The result of the shared call (its exception is raised to every requester).
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            if on_progress is not None:
+                flight.subscribers.append(on_progress)
+            flight.task = asyncio.create_task(self._lead(key, flight, fn))
+        else:
+            self.coalesced += 1
+            logging.info(f"✈️ Attaching a request to the running analysis of {key}")
+            if on_progress is not None:
+                others = len(flight.subscribers)
+                notice = (f"⏳ This chat is already being analysed ({others} other request(s) waiting "
+                          f"for {time.monotonic() - flight.started:.0f}s). You will get the same result.")
+                if flight.last_status:
+                    notice += f"\nLatest status: {flight.last_status}"
+                try:
+                    await on_progress(notice)
+                except Exception as e:
+                    logging.warning(f"⚠️ Failed to deliver progress message: {e}")
+                flight.subscribers.append(on_progress)
+
+        try:
+            # A requester that goes away must not cancel the shared job
+            return await asyncio.shield(flight.task)
+        finally:
+            if on_progress in flight.subscribers:
+                flight.subscribers.remove(on_progress)
+
+
+analysis_flights = SingleFlight()
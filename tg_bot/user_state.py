@@ -0,0 +1,66 @@
+"""
+Per-user bot state (which analysis the menu buttons refer to), kept in SQLite so that
+it survives a restart of the bot.
+
+- TGA_BOT_STATE_PATH: location of the state database
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+BASE_DIR = os.getenv(
+    "TGA_OUTPUT_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+)
+
+STATE_PATH = os.getenv("TGA_BOT_STATE_PATH", os.path.join(BASE_DIR, "state", "user_states.sqlite"))
+
+
+class UserStates:
+    """
+    Dict-like store of one JSON-serializable state per user id.
+
+    Args:
+        path (str): Database file (default: TGA_BOT_STATE_PATH).
+    """
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _db(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                conn.execute("CREATE TABLE IF NOT EXISTS user_states (user_id INTEGER PRIMARY KEY, state TEXT)")
+                yield conn
+                conn.commit()
+            finally:
+                conn.close()
+
+    def get(self, user_id: int, default: Any = None) -> Optional[Dict[str, Any]]:
+        with self._db() as conn:
+            row = conn.execute("SELECT state FROM user_states WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def __setitem__(self, user_id: int, state: Dict[str, Any]) -> None:
+        with self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO user_states (user_id, state) VALUES (?, ?)",
+                (user_id, json.dumps(state, ensure_ascii=False)),
+            )
+
+    def pop(self, user_id: int, default: Any = None) -> Optional[Dict[str, Any]]:
+        state = self.get(user_id, default)
+        with self._db() as conn:
+            conn.execute("DELETE FROM user_states WHERE user_id = ?", (user_id,))
+        return state
+
+
+user_states = UserStates()